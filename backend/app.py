@@ -2,31 +2,42 @@
 """
 Flask web application for SMC Documentation Q&A System.
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response
 import os
-import json
 import time
 import logging
-import werkzeug
+import threading
 
-from qa_system import answer_with_local_llm, get_relevant_context
+import metrics
+import diagnostics
+import sessions
+import partitions
+import deadline
+import prefetch
+import model_router
+import ollama_pool
+import feedback_store
+import static_assets
+from logging_setup import setup_logging, new_request_id, request_id_var
+from qa_system import (
+    answer_with_local_llm, answer_batch, get_relevant_context, get_collection, retrieval_query
+)
 from config import (
     DEBUG_MODE, HOST, PORT, OLLAMA_MODEL, LLAVA_MODEL, 
-    LOG_LEVEL, COLLECTION_NAME
+    COLLECTION_NAME, METRICS_ENABLED, SESSIONS_ENABLED, BATCH_MAX_QUERIES,
+    ASK_DEADLINE_SECONDS, PREFETCH_ENABLED, PREFETCH_MIN_CHARS, ROUTING_QUEUE_DEPTH
 )
 
 # Set up logging
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()]
-)
+setup_logging("app.log")
 logger = logging.getLogger("app")
 
 # Filter out frequent status endpoint requests from the werkzeug logger
 class StatusEndpointFilter(logging.Filter):
     def filter(self, record):
-        return not (record.getMessage().find('/status') != -1 and record.levelname == 'INFO')
+        message = record.getMessage()
+        return not ((message.find('/status') != -1 or message.find('/metrics') != -1)
+                    and record.levelname == 'INFO')
 
 # Apply the filter to werkzeug logger
 werkzeug_logger = logging.getLogger("werkzeug")
@@ -35,14 +46,75 @@ werkzeug_logger.addFilter(StatusEndpointFilter())
 # Initialize Flask app
 app = Flask(__name__)
 
+@app.before_request
+def assign_request_id():
+    """Tag all log records of this request with an id (the client's X-Request-ID if given)."""
+    new_request_id(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+@app.teardown_request
+def clear_request_id(exc=None):
+    # Worker threads are reused, so don't let the id leak into unrelated log records
+    request_id_var.set("-")
+
+# The React build is loaded into memory once, with precompressed variants
+static_manifest = static_assets.build_manifest(os.path.join(app.static_folder, "react"))
+
 # Main route - serve React app
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react(path):
     """Serve React frontend."""
-    if path != "" and os.path.exists(os.path.join(app.static_folder, "react", path)):
-        return send_from_directory(os.path.join(app.static_folder, "react"), path)
-    return send_from_directory(os.path.join(app.static_folder, "react"), "index.html")
+    return static_assets.serve(static_manifest, path, request)
+
+def format_sources(context):
+    """Source references for the frontend."""
+    sources = []
+    for ctx in context:
+        source_info = {
+            'document': ctx['source'],
+            'page': ctx['page']
+        }
+        
+        # Add extra metadata if available
+        if 'heading' in ctx and ctx['heading']:
+            source_info['section'] = ctx['heading']
+        
+        # Other documents containing the same (deduplicated) page
+        also_in = [{'document': ref['source'], 'page': ref['page']} for ref in ctx.get('references', [])
+                   if (ref['source'], ref['page']) != (ctx['source'], ctx['page'])]
+        if also_in:
+            source_info['also_in'] = also_in
+            
+        sources.append(source_info)
+    return sources
+
+def validate_partitions(data):
+    """
+    Read the optional `partitions` field of a request body.
+    
+    Returns:
+        Tuple of (partition_names, error_response); error_response is None if valid
+    """
+    partition_names = data.get('partitions')
+    if partition_names is None:
+        return None, None
+    if isinstance(partition_names, str):
+        partition_names = [partition_names]
+    _, _, unknown = partitions.resolve_partitions(
+        partition_names, partitions.get_manifest(get_collection())
+    )
+    if unknown:
+        return None, (jsonify({
+            'error': f"Unknown partitions: {', '.join(unknown)}",
+            'answer': 'Please choose partitions listed by /partitions.',
+            'sources': []
+        }), 400)
+    return partition_names, None
 
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -59,38 +131,94 @@ def ask():
                 'sources': []
             }), 400
         
+        # Optional list of partitions (product series or source documents) to search
+        partition_names, error_response = validate_partitions(data)
+        if error_response is not None:
+            return error_response
+        
+        # Optional time budget in seconds; the server default is also the maximum
+        try:
+            budget = min(float(data.get('timeout', ASK_DEADLINE_SECONDS)), ASK_DEADLINE_SECONDS)
+        except (TypeError, ValueError):
+            return jsonify({
+                'error': 'timeout must be a number of seconds',
+                'answer': 'Invalid request.',
+                'sources': []
+            }), 400
+        
+        # Detailed stage timing is opt-in, either in the body or as ?timing=detailed
+        detailed_timing = bool(data.get('timing_detail')) or request.args.get('timing') == 'detailed'
+        
         # Log the query
         logger.info(f"Received query: {query}")
         start_time = time.time()
+        timings = {}
+        
+        # Continue the client's conversation session (a new one is created if unknown)
+        session = sessions.get_session(data.get('session_id')) if SESSIONS_ENABLED else None
+        
+        # Reuse the context /prefetch retrieved while the question was being typed
+        context = None
+        if PREFETCH_ENABLED and data.get('client_id'):
+            prefetched = prefetch.lookup(data['client_id'], retrieval_query(query, session), partition_names)
+            if prefetched is not None:
+                context = prefetched['context']
+                timings['prefetch_hit'] = True
+                timings['partitions'] = prefetched['partitions']
         
-        # Get answer using the local LLM
-        answer, context = answer_with_local_llm(query)
+        # The deadline is cancelled by /ask/cancel or when the client disconnects
+        request_deadline = deadline.Deadline(budget, request_id_var.get())
+        deadline.register(request_deadline)
+        client_socket = deadline.client_socket(request.environ)
+        if client_socket is not None:
+            deadline.monitor.watch(request_deadline, client_socket)
+        
+        # Get answer using the local LLM, tracking how many requests are in flight
+        metrics.add_gauge("qa_requests_in_flight", 1, "Number of /ask requests being processed")
+        try:
+            with diagnostics.maybe_profile("ask"):
+                answer, context = answer_with_local_llm(query, context=context, timings=timings,
+                                                        session=session,
+                                                        partition_names=partition_names,
+                                                        deadline=request_deadline)
+        except deadline.RequestAborted as e:
+            logger.info(f"Query abandoned after {time.time() - start_time:.2f} seconds: {str(e)}")
+            cancelled = isinstance(e, deadline.RequestCancelled)
+            return jsonify({
+                'error': 'Request cancelled' if cancelled else 'Deadline exceeded',
+                'answer': 'The request was cancelled.' if cancelled else
+                          'Sorry, the answer could not be generated in time. Please try again.',
+                'sources': []
+            }), 499 if cancelled else 504
+        finally:
+            metrics.add_gauge("qa_requests_in_flight", -1, "Number of /ask requests being processed")
+            deadline.monitor.unwatch(request_deadline)
+            deadline.unregister(request_deadline)
         
         # Log timing information
         elapsed = time.time() - start_time
         logger.info(f"Query answered in {elapsed:.2f} seconds")
+        metrics.observe("qa_request_seconds", elapsed, "End-to-end /ask latency")
+        diagnostics.log_slow_query(query, context, timings, elapsed)
         
         # Format response for the frontend
-        sources = []
-        for ctx in context:
-            source_info = {
-                'document': ctx['source'],
-                'page': ctx['page']
-            }
-            
-            # Add extra metadata if available
-            if 'heading' in ctx and ctx['heading']:
-                source_info['section'] = ctx['heading']
-                
-            sources.append(source_info)
+        sources = format_sources(context)
         
-        return jsonify({
+        timing = {'total_seconds': round(elapsed, 2)}
+        if detailed_timing:
+            timing['stages'] = diagnostics.round_timings(timings)
+        
+        response = {
             'answer': answer,
             'sources': sources,
-            'timing': {
-                'total_seconds': round(elapsed, 2)
-            }
-        })
+            'partitions': timings.get('partitions', []),
+            'model': timings.get('model'),
+            'timing': timing
+        }
+        if session is not None:
+            response['session_id'] = session['id']
+        
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -100,11 +228,112 @@ def ask():
             'sources': []
         }), 500
 
+@app.route('/prefetch', methods=['POST'])
+def prefetch_context():
+    """
+    Retrieve context for a partially typed question, so /ask can skip retrieval.
+    
+    Called by the frontend with debounced input. Expects `query` and `client_id`,
+    and optionally `session_id` and `partitions` as sent with /ask.
+    """
+    data = request.get_json(silent=True) or {}
+    query = (data.get('query') or '').strip()
+    client_id = data.get('client_id')
+    if not client_id:
+        return jsonify({'status': 'error', 'message': 'client_id is required'}), 400
+    
+    # Speculative work must never slow down questions that were actually asked
+    if not PREFETCH_ENABLED or len(query) < PREFETCH_MIN_CHARS:
+        return jsonify({'status': 'skipped'})
+    if ROUTING_QUEUE_DEPTH and metrics.get_gauge("qa_requests_in_flight") >= ROUTING_QUEUE_DEPTH:
+        return jsonify({'status': 'skipped', 'reason': 'busy'})
+    
+    partition_names, error_response = validate_partitions(data)
+    if error_response is not None:
+        return error_response
+    
+    # Don't create a session for a question that may never be asked
+    session = sessions.peek_session(data.get('session_id')) if SESSIONS_ENABLED else None
+    text = retrieval_query(query, session)
+    if prefetch.has(client_id, text, partition_names):
+        return jsonify({'status': 'prefetched'})
+    
+    timings = {}
+    with metrics.timed("qa_prefetch_seconds", "Speculative retrieval latency"):
+        context = get_relevant_context(text, timings=timings, partition_names=partition_names)
+    if not context:
+        return jsonify({'status': 'skipped', 'reason': 'no_context'})
+    
+    prefetch.store(client_id, text, context, partition_names, timings.get('partitions'))
+    return jsonify({'status': 'prefetched', 'chunks': len(context)})
+
+@app.route('/ask/cancel', methods=['POST'])
+def ask_cancel():
+    """Cancel an in-flight /ask request by its X-Request-ID (also accepts navigator.sendBeacon bodies)."""
+    data = request.get_json(force=True, silent=True) or {}
+    request_id = data.get('request_id')
+    if not request_id:
+        return jsonify({'status': 'error', 'message': 'request_id is required'}), 400
+    if deadline.cancel(request_id):
+        return jsonify({'status': 'cancelled'})
+    return jsonify({'status': 'not_found'}), 404
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    """API endpoint to answer many questions in one request."""
+    try:
+        data = request.json or {}
+        queries = data.get('queries')
+        
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'queries must be a non-empty list of questions'}), 400
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({'error': f'At most {BATCH_MAX_QUERIES} queries per batch'}), 400
+        queries = [q if isinstance(q, str) else '' for q in queries]
+        
+        partition_names, error_response = validate_partitions(data)
+        if error_response is not None:
+            return error_response
+        
+        logger.info(f"Received batch of {len(queries)} queries")
+        start_time = time.time()
+        
+        metrics.add_gauge("qa_requests_in_flight", 1, "Number of /ask requests being processed")
+        try:
+            items = answer_batch(queries, partition_names=partition_names)
+        finally:
+            metrics.add_gauge("qa_requests_in_flight", -1, "Number of /ask requests being processed")
+        
+        elapsed = time.time() - start_time
+        logger.info(f"Batch of {len(queries)} queries answered in {elapsed:.2f} seconds")
+        metrics.observe("qa_batch_request_seconds", elapsed, "End-to-end /ask/batch latency")
+        
+        results = []
+        for item in items:
+            result = {
+                'query': item['query'],
+                'answer': item['answer'],
+                'sources': format_sources(item['context']),
+                'model': item['model'],
+                'cached': item['cached']
+            }
+            if item['error']:
+                result['error'] = item['error']
+            results.append(result)
+        
+        return jsonify({
+            'results': results,
+            'timing': {'total_seconds': round(elapsed, 2)}
+        })
+        
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}")
+        return jsonify({'error': 'Internal server error', 'results': []}), 500
+
 @app.route('/status', methods=['GET'])
 def status():
     """API endpoint to check the system status."""
     try:
-        import requests
         import chromadb
         
         status = {
@@ -125,18 +354,20 @@ def status():
         except Exception as e:
             status['vectordb'] = f'error: {str(e)}'
         
-        # Check Ollama
+        # Ollama backends as of the pool's last health check (querying them here would
+        # block /status for up to OLLAMA_HEALTH_TIMEOUT per backend); the system is
+        # online while at least one is up
         try:
-            response = requests.get(
-                "http://localhost:11434/api/tags",
-                timeout=2
-            )
-            if response.status_code == 200:
-                models = response.json()
+            backends = ollama_pool.get_pool().status()
+            healthy = [b for b in backends if b['healthy'] and b['checked']]
+            if not any(b['checked'] for b in backends):
+                status['ollama'] = 'unknown'
+            elif healthy:
                 status['ollama'] = 'online'
-                status['available_models'] = [m['name'] for m in models.get('models', [])]
+                status['available_models'] = sorted(set().union(*(b['models'] for b in healthy)))
             else:
-                status['ollama'] = f'error: status code {response.status_code}'
+                status['ollama'] = 'error: no Ollama backend is responding'
+            status['ollama_backends'] = backends
         except Exception as e:
             status['ollama'] = f'error: {str(e)}'
             
@@ -148,6 +379,37 @@ def status():
             'error': str(e)
         })
 
+@app.route('/partitions', methods=['GET'])
+def list_partitions():
+    """List the searchable partitions (product series and source documents)."""
+    try:
+        return jsonify(partitions.get_manifest(get_collection()))
+    except Exception as e:
+        logger.error(f"Error listing partitions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/session/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    """Forget a conversation session (e.g. when the user starts a new chat)."""
+    sessions.clear_session(session_id)
+    return jsonify({'status': 'success'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose metrics in Prometheus text format."""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    metrics.set_gauge("qa_sessions_active", sessions.session_count(), "Live conversation sessions")
+    output = metrics.render()
+    
+    # Append the metrics of the last ingestion run, if any
+    if os.path.exists(metrics.INGESTION_METRICS_FILE):
+        with open(metrics.INGESTION_METRICS_FILE, 'r') as f:
+            output += f.read()
+    
+    return Response(output, mimetype='text/plain; version=0.0.4')
+
 @app.route('/feedback', methods=['POST'])
 def feedback():
     """Store user feedback for future improvement."""
@@ -158,31 +420,50 @@ def feedback():
         rating = data.get('rating', 0)
         comment = data.get('comment', '')
         
-        # Create feedback directory if it doesn't exist
-        os.makedirs('feedback', exist_ok=True)
-        
-        # Save feedback to file
-        timestamp = int(time.time())
-        feedback_file = f'feedback/feedback_{timestamp}.json'
-        
-        with open(feedback_file, 'w') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'query': query,
-                'answer': answer,
-                'rating': rating,
-                'comment': comment
-            }, f, indent=2)
+        # Queue feedback for the background writer
+        feedback_store.submit(query, answer, rating, comment)
             
         return jsonify({'status': 'success'})
         
+    except feedback_store.FeedbackStoreError as e:
+        logger.error(f"Error saving feedback: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 503
     except Exception as e:
         logger.error(f"Error saving feedback: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/feedback/stats', methods=['GET'])
+def feedback_stats():
+    """Aggregated feedback: ratings per query, worst-rated answers and counts over time."""
+    try:
+        stats = feedback_store.get_stats(
+            days=request.args.get('days', 30, type=int),
+            limit=request.args.get('limit', 10, type=int),
+            period=request.args.get('period', 'day')
+        )
+        return jsonify(stats)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading feedback stats: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 if __name__ == '__main__':
     logger.info(f"Starting SMC Documentation Assistant on {HOST}:{PORT}")
     logger.info(f"Using Ollama model for chat: {OLLAMA_MODEL}")
     logger.info(f"Using LLaVA model for document processing: {LLAVA_MODEL}")
     logger.info(f"Vector database collection: {COLLECTION_NAME}")
+    
+    def warm_up():
+        # chromadb and the embedding model load on first use; do it in the background
+        # so the server starts accepting requests immediately
+        try:
+            get_collection()
+        except Exception as e:
+            logger.warning(f"Vector database warm-up failed: {str(e)}")
+        # Learn which models the Ollama backends have before the first question
+        ollama_pool.get_pool().check_health()
+        model_router.check_fast_model()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    
     app.run(debug=DEBUG_MODE, host=HOST, port=PORT)
\ No newline at end of file
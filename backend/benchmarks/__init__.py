@@ -0,0 +1,3 @@
+"""
+Offline benchmark and load-testing tools for the SMC Documentation Q&A System.
+"""
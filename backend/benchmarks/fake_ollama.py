@@ -0,0 +1,177 @@
+# benchmarks/fake_ollama.py
+"""
+Local Ollama stand-in for benchmarks and load tests.
+
+Implements the parts of the Ollama HTTP API the system uses (/api/generate,
+streaming and non-streaming, and /api/tags) with a configurable latency and
+token rate, so generation cost can be simulated without a model.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11435 --tokens-per-second 20 --latency 0.5
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "To reset the device, turn off the supply pressure, wait until the residual "
+    "pressure is released and press the reset button for three seconds "
+    "(ZHV-A_EU.pdf, Page 12)."
+)
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": m} for m in self.server.models]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        with self.server.stats_lock:
+            self.server.request_count += 1
+
+        if self.server.failure_status:
+            self._send_json(self.server.failure_status, {"error": "simulated failure"})
+            return
+
+        self._generate(body)
+
+    def _generate(self, body):
+        server = self.server
+        tokens = server.answer.split(" ")
+        max_tokens = body.get("options", {}).get("num_predict")
+        if max_tokens and max_tokens > 0:
+            tokens = tokens[:max_tokens]
+
+        # Rough prompt size (about 4 characters per token) drives the simulated prefill
+        prompt_tokens = max(len(body.get("prompt", "")) // 4, 1)
+        prefill_seconds = server.latency + prompt_tokens / server.prompt_tokens_per_second
+        token_seconds = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+
+        start = time.time()
+        time.sleep(prefill_seconds)
+
+        stats = {
+            "model": body.get("model", ""),
+            "done": True,
+            "context": list(range(prompt_tokens + len(tokens))),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_seconds * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(token_seconds * len(tokens) * 1e9),
+        }
+
+        if not body.get("stream", True):
+            time.sleep(token_seconds * len(tokens))
+            stats["response"] = " ".join(tokens)
+            stats["total_duration"] = int((time.time() - start) * 1e9)
+            self._send_json(200, stats)
+            return
+
+        # Streaming: newline-delimited JSON objects, one per token
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                time.sleep(token_seconds)
+                text = token if i == 0 else " " + token
+                self._write_chunk(json.dumps({"model": stats["model"], "response": text, "done": False}))
+            stats["response"] = ""
+            stats["total_duration"] = int((time.time() - start) * 1e9)
+            self._write_chunk(json.dumps(stats))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation
+            with server.stats_lock:
+                server.cancelled_count += 1
+
+    def _write_chunk(self, line):
+        data = (line + "\n").encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def start_fake_ollama(host="127.0.0.1", port=0, latency=0.0, tokens_per_second=0.0,
+                      prompt_tokens_per_second=5000.0, answer=DEFAULT_ANSWER,
+                      models=("phi4", "llava"), failure_status=0):
+    """
+    Start a fake Ollama server in a background thread.
+
+    Args:
+        port: Port to bind (0 picks a free port)
+        latency: Fixed seconds added before the first token
+        tokens_per_second: Simulated generation rate (0 means instantaneous)
+        prompt_tokens_per_second: Simulated prefill rate
+        failure_status: If set, every generate call fails with this HTTP status
+
+    Returns:
+        The running server; its base URL is server.url and it stops with server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.tokens_per_second = tokens_per_second
+    server.prompt_tokens_per_second = prompt_tokens_per_second
+    server.answer = answer
+    server.models = list(models)
+    server.failure_status = failure_status
+    server.stats_lock = threading.Lock()
+    server.request_count = 0
+    server.cancelled_count = 0
+    server.url = f"http://{host}:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Ollama stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Fixed latency before the first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=20.0,
+                        help="Simulated generation rate")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=500.0,
+                        help="Simulated prompt evaluation rate")
+    args = parser.parse_args()
+
+    server = start_fake_ollama(
+        host=args.host, port=args.port, latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        prompt_tokens_per_second=args.prompt_tokens_per_second
+    )
+    print(f"Fake Ollama listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,159 @@
+# benchmarks/fixtures.py
+"""
+Synthetic, deterministic fixtures for the offline benchmark suite.
+"""
+import random
+import hashlib
+
+import numpy as np
+
+EMBEDDING_DIM = 384  # Same dimensionality as all-MiniLM-L6-v2
+
+PRODUCT_SERIES = ["ZHV-A", "VQ1000", "SY3000", "ITV2000", "AS2201F", "CKD-P", "EX600", "LEFS25"]
+
+VOCABULARY = [
+    "valve", "pressure", "supply", "port", "solenoid", "vacuum", "ejector", "regulator",
+    "cylinder", "flow", "setting", "maintenance", "installation", "warning", "filter",
+    "connection", "signal", "voltage", "manual", "override", "exhaust", "seal", "piping",
+    "fitting", "adjustment", "operation", "temperature", "range", "specification", "error",
+    "reset", "power", "display", "switch", "output", "input", "torque", "mounting",
+    "bracket", "lubrication", "replacement", "inspection", "procedure", "check", "release"
+]
+
+HEADINGS = [
+    "Safety Instructions", "Installation", "Piping", "Wiring", "Maintenance",
+    "Troubleshooting", "Specifications", "Operating Principle", "Configuration"
+]
+
+QUESTIONS = [
+    "How do I reset the device?",
+    "What is the maximum supply pressure for the ZHV-A?",
+    "How does the vacuum ejector work in principle?",
+    "Which fittings are recommended for the VQ1000 piping?",
+    "What maintenance is required for the solenoid valve?",
+    "How do I adjust the regulator output pressure?",
+    "What does error code E3 mean on the display?",
+    "What is the operating temperature range?"
+]
+
+ANSWER_EVERY = 4  # Every 4th synthetic chunk answers one of the QUESTIONS
+
+class StubEmbeddingFunction:
+    """
+    Deterministic, dependency-free stand-in for the sentence-transformers model.
+
+    Hashes tokens into a fixed-size bag-of-words vector, so texts that share words
+    end up close together, which is enough to exercise the retrieval code paths.
+    """
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _token_index(self, token):
+        return int(hashlib.md5(token.encode()).hexdigest()[:8], 16) % self.dim
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                vectors[row, self._token_index(token.strip(".,:;?!()"))] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def __call__(self, input):
+        return [vector.tolist() for vector in self.encode(list(input))]
+
+def make_paragraph(rng, n_words):
+    """Build a pseudo-technical paragraph."""
+    words = [rng.choice(VOCABULARY) for _ in range(n_words)]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(PRODUCT_SERIES))
+    return " ".join(words).capitalize() + "."
+
+def make_page_text(rng, n_paragraphs=6, with_images=True):
+    """Build the extracted text of a single manual page."""
+    paragraphs = [rng.choice(HEADINGS)]
+    paragraphs.extend(make_paragraph(rng, rng.randint(20, 60)) for _ in range(n_paragraphs))
+    text = "\n\n".join(paragraphs)
+    if with_images and rng.random() < 0.4:
+        text += "\n\nIMAGE DESCRIPTIONS:\n[Image 1.1]: " + make_paragraph(rng, 40)
+    return text
+
+def make_documents(n_pages, seed=0):
+    """Build page-level documents in the format produced by extract_text_with_llava."""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(n_pages):
+        series = PRODUCT_SERIES[i % len(PRODUCT_SERIES)]
+        documents.append({
+            "content": make_page_text(rng),
+            "metadata": {
+                "source": f"{series}_manual.pdf",
+                "page": i + 1,
+                "heading": rng.choice(HEADINGS),
+                "has_images": False,
+                "image_count": 0
+            }
+        })
+    return documents
+
+def make_answer_paragraph(rng, question):
+    """Build a paragraph that answers one of the QUESTIONS (shares most of its words)."""
+    return f"{question.rstrip('?')}. " * 3 + make_paragraph(rng, 30)
+
+def make_chunks(n_chunks, seed=0):
+    """
+    Build chunk-level documents in the format produced by chunk_documents.
+
+    Every ANSWER_EVERY-th chunk answers one of the QUESTIONS (and belongs to the
+    series it mentions), so each question retrieves context above MINIMUM_RELEVANCE
+    once there are ANSWER_EVERY * len(QUESTIONS) chunks.
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(n_chunks):
+        series = PRODUCT_SERIES[i % len(PRODUCT_SERIES)]
+        if i % ANSWER_EVERY == 0:
+            question = QUESTIONS[(i // ANSWER_EVERY) % len(QUESTIONS)]
+            series = next((s for s in PRODUCT_SERIES if s in question), series)
+            content = make_answer_paragraph(rng, question)
+        else:
+            content = make_paragraph(rng, rng.randint(80, 160))
+        chunks.append({
+            "content": content,
+            "metadata": {
+                "source": f"{series}_manual.pdf",
+                "page": i // 4 + 1,
+                "heading": rng.choice(HEADINGS)
+            }
+        })
+    return chunks
+
+def make_page_html(rng, n_spans=80):
+    """Build HTML in the style of PyMuPDF's page.get_text("html")."""
+    spans = []
+    for _ in range(n_spans):
+        roll = rng.random()
+        if roll < 0.05:
+            spans.append(f'<span style="font-family:Arial;font-size:18px">{rng.choice(HEADINGS)}</span>')
+        elif roll < 0.1:
+            spans.append(f'<span style="font-weight:bold;font-size:11px">{rng.choice(HEADINGS)}</span>')
+        else:
+            spans.append(f'<span style="font-family:Arial;font-size:10px">{make_paragraph(rng, 12)}</span>')
+    return "<div>" + "".join(f"<p>{span}</p>" for span in spans) + "</div>"
+
+class FakePage:
+    """Minimal stand-in for a PyMuPDF page, supporting get_text("blocks")."""
+    def __init__(self, n_blocks=60, seed=0):
+        rng = random.Random(seed)
+        self.blocks = []
+        for i in range(n_blocks):
+            x0 = rng.uniform(0, 500)
+            y0 = rng.uniform(0, 800)
+            self.blocks.append((x0, y0, x0 + rng.uniform(50, 300), y0 + rng.uniform(10, 60),
+                                make_paragraph(rng, 25), i, 0))
+
+    def get_text(self, option="text"):
+        if option != "blocks":
+            raise ValueError("FakePage only supports get_text('blocks')")
+        return self.blocks
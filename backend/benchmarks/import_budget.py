@@ -0,0 +1,104 @@
+# benchmarks/import_budget.py
+"""
+Import-time budget for the CLI and server entry points.
+
+Each module is imported in a fresh interpreter with `python -X importtime` and its
+cumulative import time is compared with IMPORT_TIME_BUDGETS. The slowest imports
+are listed so a regression (e.g. a heavy package imported at module level again)
+is easy to locate. Exits non-zero when a module is over budget, so CI can run it.
+
+Usage (from the backend directory):
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --modules app,qa_system --repeat 5 --top 15
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+from config import IMPORT_TIME_BUDGETS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:   self [us] | cumulative | imported package" (nesting shown by indentation)
+_LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+def measure_imports(module):
+    """
+    Import a module in a fresh interpreter and parse the -X importtime report.
+
+    Returns:
+        List of (package, self_ms, cumulative_ms, depth) in report order; the
+        last entry is the module itself
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, package = match.groups()
+            entries.append((package, int(self_us) / 1000, int(cumulative_us) / 1000, (len(indent) - 1) // 2))
+    return entries
+
+def check_module(module, budget_ms, repeat=3, top=10):
+    """Measure a module repeatedly (keeping the fastest run) and compare with its budget."""
+    best = None
+    for _ in range(repeat):
+        entries = measure_imports(module)
+        total = next(cumulative for package, _, cumulative, depth in reversed(entries)
+                     if package == module and depth == 0)
+        if best is None or total < best[0]:
+            best = (total, entries)
+
+    total, entries = best
+    # Children are reported before their parent; stop at the previous top-level
+    # import (interpreter startup, e.g. site hooks, is not part of the module)
+    end = max(i for i, (package, _, _, depth) in enumerate(entries) if package == module and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    slowest = sorted(entries[start:end], key=lambda e: e[2], reverse=True)
+    return {
+        "module": module,
+        "import_ms": round(total, 1),
+        "budget_ms": budget_ms,
+        "ok": budget_ms is None or total <= budget_ms,
+        # Direct imports of the module are the ones worth making lazy
+        "slowest_imports": [
+            {"package": package, "cumulative_ms": round(cumulative, 1), "self_ms": round(self_ms, 1)}
+            for package, self_ms, cumulative, depth in slowest if depth == 1
+        ][:top]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check entry point import times against their budgets")
+    parser.add_argument("--modules", help="Comma-separated modules (default: all in IMPORT_TIME_BUDGETS)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh imports per module; the fastest counts")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest direct imports to list")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    modules = args.modules.split(",") if args.modules else list(IMPORT_TIME_BUDGETS)
+    report = [check_module(m, IMPORT_TIME_BUDGETS.get(m), args.repeat, args.top) for m in modules]
+
+    for entry in report:
+        budget = f"{entry['budget_ms']} ms" if entry["budget_ms"] is not None else "no budget"
+        status = "OK" if entry["ok"] else "OVER BUDGET"
+        print(f"{entry['module']:<22} {entry['import_ms']:>8.1f} ms  (budget {budget})  {status}")
+        for item in entry["slowest_imports"]:
+            print(f"    {item['package']:<40} {item['cumulative_ms']:>8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not all(entry["ok"] for entry in report):
+        sys.exit(1)
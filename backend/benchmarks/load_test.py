@@ -0,0 +1,284 @@
+# benchmarks/load_test.py
+"""
+End-to-end load generator with a concurrency sweep and percentile report.
+
+Drives /ask, /status and /feedback at increasing concurrency and reports, per
+level, throughput, p50/p95/p99 latency, error and timeout rates and the response
+cache hit ratio. Questions are replayed from the queries stored in response_cache/.
+
+By default the Flask app is started in-process against a local fake Ollama with a
+configurable latency and token rate; use --url to target an already running server.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test --concurrency 1,4,16,64 --duration 20
+    python -m benchmarks.load_test --stub-index 10000 --tokens-per-second 15 --latency 0.5
+    python -m benchmarks.load_test --backends 3 --concurrency 4,16   # Balance over 3 fake Ollamas
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 1,2,4
+"""
+import os
+import math
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+
+import requests
+
+from config import CACHE_DIR
+from benchmarks.fixtures import QUESTIONS, StubEmbeddingFunction, make_chunks
+from benchmarks.fake_ollama import start_fake_ollama
+
+def load_question_corpus(cache_dir=CACHE_DIR):
+    """Collect the questions stored in the response cache, falling back to built-in ones."""
+    questions = []
+    if os.path.isdir(cache_dir):
+        for filename in sorted(os.listdir(cache_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(cache_dir, filename), "r") as f:
+                    query = json.load(f).get("query", "").strip()
+                if query:
+                    questions.append(query)
+            except (OSError, ValueError):
+                continue
+    return questions or list(QUESTIONS)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100.0 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+def parse_mix(mix):
+    """Parse an endpoint mix like 'ask=0.8,status=0.1,feedback=0.1'."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {"ask", "status", "feedback"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+def start_local_app(args):
+    """
+    Start the Flask app in-process against a fake Ollama.
+
+    Returns:
+        Tuple of (base_url, cleanup function)
+    """
+    import qa_system
+    import ollama_pool
+    import feedback_store
+    from werkzeug.serving import make_server
+    from app import app
+
+    backends = [
+        start_fake_ollama(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            prompt_tokens_per_second=args.prompt_tokens_per_second
+        )
+        for _ in range(max(args.backends, 1))
+    ]
+    original = (ollama_pool.set_pool(ollama_pool.OllamaPool([{"url": b.url} for b in backends])),
+                qa_system.CACHE_DIR)
+
+    # Start from a cold, private response cache so the hit ratio reflects this run
+    cache_dir = tempfile.TemporaryDirectory()
+    qa_system.CACHE_DIR = cache_dir.name
+
+    # Keep load test feedback out of the real store (and away from its legacy files)
+    feedback_original = (feedback_store.FEEDBACK_DB, feedback_store._writer, set(feedback_store._initialized))
+    feedback_store.FEEDBACK_DB = os.path.join(cache_dir.name, "feedback.db")
+    feedback_store._writer = None
+
+    if args.stub_index:
+        from benchmarks.run_benchmarks import build_collection, check_retrieval
+        embedder = StubEmbeddingFunction()
+        print(f"Building stub index with {args.stub_index} chunks...")
+        qa_system._collection = build_collection(make_chunks(args.stub_index), embedder)
+        qa_system._embedding_function = embedder
+        check_retrieval(qa_system)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def cleanup():
+        server.shutdown()
+        for backend in backends:
+            backend.shutdown()
+        print(f"Generate requests per fake Ollama: {', '.join(str(b.request_count) for b in backends)}")
+        ollama_pool.set_pool(original[0])
+        qa_system.CACHE_DIR = original[1]
+        qa_system._collection = None
+        qa_system._embedding_function = None
+        feedback_store.flush()
+        feedback_store.FEEDBACK_DB, feedback_store._writer = feedback_original[:2]
+        feedback_store._initialized.intersection_update(feedback_original[2])
+        cache_dir.cleanup()
+
+    return f"http://127.0.0.1:{server.server_port}", cleanup
+
+def send_request(session, base_url, endpoint, question, timeout):
+    """Send one request and return a result record."""
+    start = time.perf_counter()
+    record = {"endpoint": endpoint, "ok": False, "timeout": False, "cache_hit": None}
+    try:
+        if endpoint == "ask":
+            response = session.post(f"{base_url}/ask", json={"query": question, "timing_detail": True},
+                                    timeout=timeout)
+            if response.status_code == 200:
+                body = response.json()
+                stages = body.get("timing", {}).get("stages", {})
+                record["cache_hit"] = stages.get("cache_hit")
+                record["ok"] = not body.get("answer", "").startswith("Error:")
+        elif endpoint == "status":
+            response = session.get(f"{base_url}/status", timeout=timeout)
+            record["ok"] = response.status_code == 200
+        else:
+            response = session.post(f"{base_url}/feedback", json={
+                "query": question, "answer": "load test", "rating": random.randint(1, 5),
+                "comment": "load-test"
+            }, timeout=timeout)
+            record["ok"] = response.status_code == 200
+    except requests.exceptions.Timeout:
+        record["timeout"] = True
+    except requests.exceptions.RequestException:
+        pass
+    record["latency"] = time.perf_counter() - start
+    return record
+
+def run_level(base_url, concurrency, duration, questions, mix, timeout, seed):
+    """Run closed-loop workers at one concurrency level for a fixed duration."""
+    records = []
+    records_lock = threading.Lock()
+    deadline = time.time() + duration
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        while time.time() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            record = send_request(session, base_url, endpoint, rng.choice(questions), timeout)
+            with records_lock:
+                records.append(record)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    return summarize(records, concurrency, elapsed)
+
+def summarize(records, concurrency, elapsed):
+    """Aggregate result records into a per-level report."""
+    summary = {
+        "concurrency": concurrency,
+        "requests": len(records),
+        "throughput_rps": len(records) / elapsed if elapsed else 0.0,
+        "error_rate": sum(1 for r in records if not r["ok"]) / len(records) if records else 0.0,
+        "timeout_rate": sum(1 for r in records if r["timeout"]) / len(records) if records else 0.0,
+        "endpoints": {}
+    }
+
+    for endpoint in sorted({r["endpoint"] for r in records}):
+        subset = [r for r in records if r["endpoint"] == endpoint]
+        latencies = [r["latency"] for r in subset if r["ok"]]
+        stats = {
+            "requests": len(subset),
+            "throughput_rps": len(subset) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "errors": sum(1 for r in subset if not r["ok"]),
+            "timeouts": sum(1 for r in subset if r["timeout"])
+        }
+        if endpoint == "ask":
+            flagged = [r["cache_hit"] for r in subset if r["cache_hit"] is not None]
+            stats["cache_hit_ratio"] = sum(flagged) / len(flagged) if flagged else None
+        summary["endpoints"][endpoint] = stats
+
+    return summary
+
+def print_report(levels):
+    def ms(value):
+        return f"{value * 1000:>9.0f}" if value is not None else f"{'-':>9}"
+
+    print(f"\n{'conc':>5} {'endpoint':<9} {'req':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'err%':>6} {'tmo%':>6} {'hit%':>6}")
+    print("-" * 83)
+    for level in levels:
+        for endpoint, stats in level["endpoints"].items():
+            errors = 100.0 * stats["errors"] / stats["requests"] if stats["requests"] else 0.0
+            timeouts = 100.0 * stats["timeouts"] / stats["requests"] if stats["requests"] else 0.0
+            hit_ratio = stats.get("cache_hit_ratio")
+            hits = f"{100.0 * hit_ratio:>6.1f}" if hit_ratio is not None else f"{'-':>6}"
+            print(f"{level['concurrency']:>5} {endpoint:<9} {stats['requests']:>6} "
+                  f"{stats['throughput_rps']:>8.2f} {ms(stats['p50'])} {ms(stats['p95'])} "
+                  f"{ms(stats['p99'])} {errors:>6.1f} {timeouts:>6.1f} {hits}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMC Documentation Q&A load generator")
+    parser.add_argument("--url", help="Base URL of a running server (default: start one in-process)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32",
+                        help="Comma-separated concurrency levels to sweep")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+    parser.add_argument("--mix", default="ask=0.8,status=0.1,feedback=0.1",
+                        help="Endpoint weights, e.g. ask=0.8,status=0.1,feedback=0.1")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Fake Ollama latency before the first token (in-process mode)")
+    parser.add_argument("--tokens-per-second", type=float, default=20.0,
+                        help="Fake Ollama generation rate (in-process mode)")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=500.0,
+                        help="Fake Ollama prompt evaluation rate (in-process mode)")
+    parser.add_argument("--backends", type=int, default=1,
+                        help="Number of fake Ollama backends in the pool (in-process mode)")
+    parser.add_argument("--stub-index", type=int, default=0,
+                        help="Serve a synthetic index of this many chunks with a stub embedding model")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Response cache to seed questions from")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    questions = load_question_corpus(args.cache_dir)
+    mix = parse_mix(args.mix)
+    print(f"Replaying {len(questions)} questions")
+
+    cleanup = None
+    base_url = args.url
+    if not base_url:
+        base_url, cleanup = start_local_app(args)
+        print(f"Started in-process server at {base_url}")
+
+    levels = []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+            print(f"Running {args.duration:.0f}s at concurrency {concurrency}...")
+            levels.append(run_level(base_url, concurrency, args.duration, questions, mix,
+                                    args.timeout, args.seed))
+    finally:
+        if cleanup:
+            cleanup()
+
+    print_report(levels)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url or "in-process", "duration": args.duration,
+                       "mix": mix, "levels": levels}, f, indent=2)
+        print(f"\nReport written to {os.path.abspath(args.output)}")
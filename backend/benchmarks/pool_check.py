@@ -0,0 +1,115 @@
+# benchmarks/pool_check.py
+"""
+Failover checks for the Ollama backend pool against two local fake Ollamas.
+
+Covers the paths that only show up when a backend misbehaves: a request refused
+with 503 is retried on the other backend, a backend that refuses connections is
+ejected, and a refused response is released (not counted as outstanding) when
+the deadline runs out before the retry. Exits non-zero when a check fails, so CI
+can run it.
+
+Usage (from the backend directory):
+    python -m benchmarks.pool_check
+"""
+import sys
+import time
+import socket
+import logging
+
+from ollama_pool import OllamaPool
+from deadline import Deadline, DeadlineExceeded
+from benchmarks.fake_ollama import start_fake_ollama
+
+BODY = {"model": "phi4", "prompt": "How do I reset the ZHV-A?", "stream": False}
+
+class _ExpiringDeadline(Deadline):
+    """A deadline that runs out as soon as the first attempt has been sent."""
+
+    def timeout(self, default):
+        self.expires_at = time.monotonic()
+        return default
+
+def _closed_port_url(host="127.0.0.1"):
+    """URL of a local port nothing listens on."""
+    with socket.socket() as s:
+        s.bind((host, 0))
+        port = s.getsockname()[1]
+    return f"http://{host}:{port}"
+
+def _pool(*urls):
+    # No background health checks, so the backends are picked in order
+    return OllamaPool([{"url": url} for url in urls], health_interval=0)
+
+def _backend_state(pool):
+    return {b["url"]: b for b in pool.status()}
+
+def check_retry_on_overload():
+    """The first backend answers 503; the request succeeds on the second and the first is ejected."""
+    overloaded, healthy = start_fake_ollama(failure_status=503), start_fake_ollama()
+    try:
+        pool = _pool(overloaded.url, healthy.url)
+        with pool.post("/api/generate", BODY, timeout=5) as response:
+            status_code = response.status_code
+        state = _backend_state(pool)
+        return [
+            (status_code == 200, f"response status {status_code}, expected 200"),
+            (overloaded.request_count == 1 and healthy.request_count == 1,
+             f"requests {overloaded.request_count}/{healthy.request_count}, expected 1/1"),
+            (state[overloaded.url]["ejected"], "overloaded backend was not ejected"),
+            (all(b["outstanding"] == 0 for b in state.values()), f"outstanding requests left: {state}")
+        ]
+    finally:
+        overloaded.shutdown()
+        healthy.shutdown()
+
+def check_eject_on_connection_error():
+    """The first backend refuses connections; it is ejected and later requests skip it."""
+    down_url, healthy = _closed_port_url(), start_fake_ollama()
+    try:
+        pool = _pool(down_url, healthy.url)
+        for _ in range(2):
+            with pool.post("/api/generate", BODY, timeout=5) as response:
+                status_code = response.status_code
+        state = _backend_state(pool)
+        return [
+            (status_code == 200, f"response status {status_code}, expected 200"),
+            (state[down_url]["ejected"], "unreachable backend was not ejected"),
+            (healthy.request_count == 2, f"{healthy.request_count} requests reached the healthy backend, expected 2"),
+            (all(b["outstanding"] == 0 for b in state.values()), f"outstanding requests left: {state}")
+        ]
+    finally:
+        healthy.shutdown()
+
+def check_release_on_deadline():
+    """The deadline runs out while the first backend refuses; the refused attempt is released."""
+    overloaded, healthy = start_fake_ollama(failure_status=503), start_fake_ollama()
+    try:
+        pool = _pool(overloaded.url, healthy.url)
+        try:
+            with pool.post("/api/generate", BODY, timeout=5, deadline=_ExpiringDeadline(30)):
+                raised = False
+        except DeadlineExceeded:
+            raised = True
+        state = _backend_state(pool)
+        return [
+            (raised, "DeadlineExceeded was not raised"),
+            (healthy.request_count == 0, "the request was retried after the deadline"),
+            (all(b["outstanding"] == 0 for b in state.values()), f"outstanding requests left: {state}")
+        ]
+    finally:
+        overloaded.shutdown()
+        healthy.shutdown()
+
+CHECKS = [check_retry_on_overload, check_eject_on_connection_error, check_release_on_deadline]
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+
+    failed = False
+    for check in CHECKS:
+        problems = [message for ok, message in check() if not ok]
+        print(f"{check.__name__:35s} {'FAILED' if problems else 'OK'}")
+        for message in problems:
+            print(f"    {message}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
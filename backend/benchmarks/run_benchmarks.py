@@ -0,0 +1,277 @@
+# benchmarks/run_benchmarks.py
+"""
+Offline micro-benchmark suite for the retrieval, prompt building and ingestion stages.
+
+Runs on synthetic fixtures with a stub embedding model and a local fake Ollama,
+so no models, GPUs or network access are needed. Results are written as JSON and
+can be compared against a previous run.
+
+Usage (from the backend directory):
+    python -m benchmarks.run_benchmarks --sizes 1000,10000 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --tolerance 0.15
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+
+from benchmarks.fixtures import (
+    StubEmbeddingFunction, FakePage, QUESTIONS,
+    make_chunks, make_documents, make_page_html
+)
+from benchmarks.fake_ollama import start_fake_ollama
+
+def measure(func, repeat, warmup=1):
+    """Run func repeatedly and return timing statistics in seconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "max": max(samples)
+    }
+
+def build_collection(chunks, embedder):
+    """Build an in-memory Chroma collection from synthetic chunks."""
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    name = f"bench_{len(chunks)}_{int(time.time() * 1000)}"
+    collection = client.create_collection(name, embedding_function=None)
+
+    batch_size = 5000
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        collection.add(
+            ids=[f"doc_{start + i}" for i in range(len(batch))],
+            documents=[c["content"] for c in batch],
+            metadatas=[c["metadata"] for c in batch],
+            embeddings=embedder.encode([c["content"] for c in batch])
+        )
+    return collection
+
+def check_retrieval(qa_system):
+    """
+    Fail if a fixture question retrieves no context.
+
+    Otherwise the prompt building and answer benchmarks would silently measure
+    the empty-context shortcut instead of the real pipeline.
+    """
+    empty = [q for q in QUESTIONS if not qa_system.get_relevant_context(q)]
+    if empty:
+        raise RuntimeError(f"{len(empty)} of {len(QUESTIONS)} benchmark questions retrieve no context "
+                           f"(check the fixtures against MINIMUM_RELEVANCE): {empty}")
+
+def bench_qa_stages(size, repeat, results):
+    """Benchmark retrieval, prompt building and the response cache at a corpus size."""
+    import qa_system
+
+    embedder = StubEmbeddingFunction()
+    chunks = make_chunks(size)
+
+    build_start = time.perf_counter()
+    qa_system._collection = build_collection(chunks, embedder)
+    qa_system._embedding_function = embedder
+    results[f"index_build[{size}]"] = {"seconds": time.perf_counter() - build_start}
+    check_retrieval(qa_system)
+
+    queries = iter(QUESTIONS * (repeat + 2))
+    results[f"get_relevant_context[{size}]"] = measure(
+        lambda: qa_system.get_relevant_context(next(queries)), repeat
+    )
+
+    context = qa_system.get_relevant_context(QUESTIONS[0], n_results=20)
+    results[f"format_context_for_llm[{size}]"] = measure(
+        lambda: qa_system.format_context_for_llm(context), repeat
+    )
+
+    # The response cache is size-bounded by CACHE_SIZE, so the corpus size only
+    # changes the keys; exercise it in a scratch directory.
+    with tempfile.TemporaryDirectory() as cache_dir:
+        original_cache_dir = qa_system.CACHE_DIR
+        qa_system.CACHE_DIR = cache_dir
+        try:
+            counter = iter(range(10 ** 9))
+            results[f"save_to_cache[{size}]"] = measure(
+                lambda: qa_system.save_to_cache(f"question {next(counter)}", context, "answer"), repeat
+            )
+            qa_system.save_to_cache(QUESTIONS[0], context, "answer")
+            results[f"get_cached_response.hit[{size}]"] = measure(
+                lambda: qa_system.get_cached_response(QUESTIONS[0], context), repeat
+            )
+            results[f"get_cached_response.miss[{size}]"] = measure(
+                lambda: qa_system.get_cached_response("never asked", context), repeat
+            )
+        finally:
+            qa_system.CACHE_DIR = original_cache_dir
+
+    qa_system._collection = None
+    qa_system._embedding_function = None
+
+def bench_answer_pipeline(repeat, results):
+    """Benchmark a cache-miss answer_with_local_llm against an instantaneous fake Ollama."""
+    import qa_system
+    import ollama_pool
+
+    server = start_fake_ollama(prompt_tokens_per_second=1e9)
+    embedder = StubEmbeddingFunction()
+    qa_system._collection = build_collection(make_chunks(1000), embedder)
+    qa_system._embedding_function = embedder
+    check_retrieval(qa_system)
+
+    original = (ollama_pool.set_pool(ollama_pool.OllamaPool([{"url": server.url}])), qa_system.CACHE_DIR)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        qa_system.CACHE_DIR = cache_dir
+        try:
+            counter = iter(range(10 ** 9))
+            results["answer_with_local_llm.miss[1000]"] = measure(
+                lambda: qa_system.answer_with_local_llm(f"{QUESTIONS[1]} #{next(counter)}"), repeat
+            )
+        finally:
+            ollama_pool.set_pool(original[0])
+            qa_system.CACHE_DIR = original[1]
+            qa_system._collection = None
+            qa_system._embedding_function = None
+            server.shutdown()
+
+def bench_ingestion_stages(size, repeat, results):
+    """Benchmark the CPU-bound ingestion helpers."""
+    import document_processor
+
+    # Roughly four chunks per synthetic page
+    documents = make_documents(max(size // 4, 1))
+    results[f"chunk_documents[{size}]"] = measure(
+        lambda: document_processor.chunk_documents(documents), max(1, repeat // 5)
+    )
+
+    page = FakePage(n_blocks=80)
+    bbox = (100, 200, 300, 400)
+    results["extract_text_around_image"] = measure(
+        lambda: document_processor.extract_text_around_image(page, bbox), repeat * 10
+    )
+
+    html = make_page_html(random.Random(0))
+    results["extract_headings_from_html"] = measure(
+        lambda: document_processor.extract_headings_from_html(html), repeat * 10
+    )
+
+def run_suite(sizes, repeat, only=None):
+    """Run all benchmark groups, recording skipped groups instead of failing."""
+    results = {}
+    skipped = {}
+
+    groups = [("qa", lambda size: bench_qa_stages(size, repeat, results)),
+              ("ingestion", lambda size: bench_ingestion_stages(size, repeat, results))]
+
+    for group_name, group in groups:
+        if only and group_name not in only:
+            continue
+        for size in sizes:
+            print(f"Running {group_name} benchmarks at {size} chunks...")
+            try:
+                group(size)
+            except ImportError as e:
+                skipped[group_name] = f"missing dependency: {e.name or str(e)}"
+                print(f"  Skipped: {skipped[group_name]}")
+                break
+
+    if not only or "answer" in only:
+        print("Running end-to-end answer benchmark against fake Ollama...")
+        try:
+            bench_answer_pipeline(repeat, results)
+        except ImportError as e:
+            skipped["answer"] = f"missing dependency: {e.name or str(e)}"
+            print(f"  Skipped: {skipped['answer']}")
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": sizes,
+        "repeat": repeat,
+        "results": results,
+        "skipped": skipped
+    }
+
+def compare(current, baseline, tolerance):
+    """
+    Compare median timings against a baseline run.
+
+    Returns:
+        List of benchmark names that regressed by more than tolerance
+    """
+    regressions = []
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    print("-" * 81)
+    for name, stats in sorted(current["results"].items()):
+        base = baseline.get("results", {}).get(name)
+        if not base or "median" not in stats or "median" not in base:
+            continue
+        change = (stats["median"] - base["median"]) / base["median"] if base["median"] else 0.0
+        marker = ""
+        if change > tolerance:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            marker = "  faster"
+        print(f"{name:<45} {base['median'] * 1000:>10.3f}ms {stats['median'] * 1000:>10.3f}ms "
+              f"{change:>+8.1%}{marker}")
+    return regressions
+
+def print_results(report):
+    print(f"\n{'benchmark':<45} {'median':>12} {'min':>12}")
+    print("-" * 71)
+    for name, stats in sorted(report["results"].items()):
+        if "median" in stats:
+            print(f"{name:<45} {stats['median'] * 1000:>10.3f}ms {stats['min'] * 1000:>10.3f}ms")
+        else:
+            print(f"{name:<45} {stats['seconds']:>11.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMC Documentation Q&A micro-benchmarks")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="Comma-separated corpus sizes in chunks (e.g. 1000,10000,100000)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per benchmark")
+    parser.add_argument("--only", default="",
+                        help="Comma-separated groups to run: qa, ingestion, answer")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write JSON results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression (default: 0.10)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Per-query INFO logging would dominate the measurements
+    logging.disable(logging.INFO)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = {s.strip() for s in args.only.split(",") if s.strip()}
+
+    report = run_suite(sizes, args.repeat, only)
+    print_results(report)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {os.path.abspath(args.output)}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
@@ -0,0 +1,225 @@
+# chunker.py
+"""
+Structure-aware chunking of extracted pages, sized in tokens.
+
+Pages are split along the structure document_processor already produces instead
+of at arbitrary character offsets:
+
+- the text part and the "IMAGE DESCRIPTIONS" part are never mixed in one chunk
+- lines matching a heading extracted from the page start a new section
+- blank-line blocks (paragraphs, tables, numbered procedures) are kept whole
+  unless a single block exceeds the token budget
+
+Token counts for all blocks of all pages are computed in one batched call, and
+the output depends only on the input, so chunk ids are stable across runs.
+"""
+import re
+import logging
+
+from context_packer import count_tokens_batch
+from config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_TOKENS
+
+logger = logging.getLogger("chunker")
+
+IMAGE_SECTION_MARKER = "\n\nIMAGE DESCRIPTIONS:\n"
+
+_BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n+")
+_IMAGE_ENTRY_PATTERN = re.compile(r"^\[Image \d+\.\d+\]:", re.MULTILINE)
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+class _Unit:
+    """A piece of a page that is never split further when packing."""
+
+    __slots__ = ("text", "kind", "heading", "starts_section", "joiner", "tokens")
+
+    def __init__(self, text, kind, heading, starts_section=False, joiner="\n\n"):
+        self.text = text
+        self.kind = kind
+        self.heading = heading
+        self.starts_section = starts_section
+        # Separator placed before this unit when it follows another in a chunk
+        self.joiner = joiner
+        self.tokens = 0
+
+def _text_units(text, headings, default_heading):
+    """Split the text part of a page into blocks, starting a section at every heading line."""
+    known = {h.strip() for h in headings if h and h.strip()}
+    units = []
+    heading = default_heading
+    for block in _BLOCK_SEPARATOR.split(text):
+        lines = []
+        for line in block.split("\n"):
+            if line.strip() in known:
+                if any(l.strip() for l in lines):
+                    units.append(_Unit("\n".join(lines).strip(), "text", heading))
+                heading = line.strip()
+                lines = [line]
+                units.append(None)  # section boundary placeholder
+            else:
+                lines.append(line)
+        if any(l.strip() for l in lines):
+            units.append(_Unit("\n".join(lines).strip(), "text", heading))
+
+    # Resolve placeholders: the unit after a boundary starts a new section
+    resolved = []
+    starts_section = False
+    for unit in units:
+        if unit is None:
+            starts_section = True
+            continue
+        unit.starts_section = starts_section
+        starts_section = False
+        resolved.append(unit)
+    return resolved
+
+def _image_units(text, heading):
+    """Split the image-description part of a page into one unit per image."""
+    starts = [m.start() for m in _IMAGE_ENTRY_PATTERN.finditer(text)] or [0]
+    if starts[0] != 0:
+        starts.insert(0, 0)
+    units = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        entry = text[start:end].strip()
+        if entry:
+            units.append(_Unit(entry, "image", heading))
+    return units
+
+def _page_units(doc):
+    """Split one page into structural units."""
+    content = doc["content"]
+    heading = doc["metadata"].get("heading", "")
+    text, _, images = content.partition(IMAGE_SECTION_MARKER)
+    units = _text_units(text, doc.get("headings") or [heading], heading)
+    if images:
+        units.extend(_image_units(images, heading))
+    return units
+
+def _split_oversized(unit, max_tokens):
+    """Split a unit that exceeds max_tokens by lines, then sentences, then words."""
+    for pattern, joiner in (("\n", "\n"), (_SENTENCE_PATTERN, " "), (None, " ")):
+        if pattern is None:
+            pieces = unit.text.split()
+        elif isinstance(pattern, str):
+            pieces = [p for p in unit.text.split(pattern) if p.strip()]
+        else:
+            pieces = [p for p in pattern.split(unit.text) if p.strip()]
+        if len(pieces) > 1:
+            break
+    else:
+        return [unit]
+
+    counts = count_tokens_batch(pieces)
+    # Counting pieces separately overestimates (per-text rounding); scale to the whole unit's count
+    scale = unit.tokens / max(sum(counts), 1)
+    counts = [tokens * scale for tokens in counts]
+    parts = []
+    current, current_tokens = [], 0
+    for piece, tokens in zip(pieces, counts):
+        if current and current_tokens + tokens > max_tokens:
+            parts.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        parts.append(joiner.join(current))
+
+    result = []
+    for i, part in enumerate(parts):
+        sub = _Unit(part, unit.kind, unit.heading,
+                    starts_section=unit.starts_section and i == 0,
+                    joiner=unit.joiner if i == 0 else joiner)
+        result.append(sub)
+    # Pieces that are still too long (e.g. one huge table row) are split again at a finer level
+    sub_counts = count_tokens_batch([u.text for u in result])
+    final = []
+    for sub, tokens in zip(result, sub_counts):
+        sub.tokens = tokens
+        if tokens > max_tokens and sub.text != unit.text and len(sub.text.split()) > 1:
+            final.extend(_split_oversized(sub, max_tokens))
+        else:
+            final.append(sub)
+    return final
+
+def _pack(units, max_tokens, overlap_tokens, min_tokens):
+    """Greedily pack units into chunks, carrying a small tail of units over as overlap."""
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        if current:
+            chunks.append(current[:])
+
+    for unit in units:
+        boundary = (not current
+                    or unit.kind != current[-1].kind
+                    or (unit.starts_section and current_tokens >= min_tokens))
+        if not boundary and current_tokens + unit.tokens <= max_tokens:
+            current.append(unit)
+            current_tokens += unit.tokens
+            continue
+
+        flush()
+        # Overlap only continues the same section of the same kind
+        carry, carry_tokens = [], 0
+        if current and not boundary and overlap_tokens > 0:
+            for previous in reversed(current):
+                if carry_tokens + previous.tokens > overlap_tokens:
+                    break
+                carry.insert(0, previous)
+                carry_tokens += previous.tokens
+            if carry_tokens + unit.tokens > max_tokens or len(carry) == len(current):
+                carry, carry_tokens = [], 0
+        current = carry + [unit]
+        current_tokens = carry_tokens + unit.tokens
+    flush()
+    return chunks
+
+def _join(units):
+    return "".join((u.joiner if i else "") + u.text for i, u in enumerate(units))
+
+def chunk_documents(documents, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                    min_tokens=CHUNK_MIN_TOKENS):
+    """
+    Split page documents into chunks of at most max_tokens tokens.
+
+    Args:
+        documents: Page documents ({"content", "metadata"} plus optional "headings")
+        max_tokens: Token budget per chunk (a single oversized word may exceed it)
+        overlap_tokens: Maximum tokens of trailing blocks repeated in the next chunk
+        min_tokens: A heading only starts a new chunk once the current one has this many tokens
+
+    Returns:
+        List of {"content", "metadata"} chunks; metadata is a copy of the page
+        metadata with the chunk's section heading, chunk_index and chunk_id
+    """
+    pages = [_page_units(doc) for doc in documents]
+
+    # Count every block of every page in one batched call
+    all_units = [unit for units in pages for unit in units]
+    for unit, tokens in zip(all_units, count_tokens_batch([u.text for u in all_units])):
+        unit.tokens = tokens
+
+    chunked_documents = []
+    for doc, units in zip(documents, pages):
+        sized = []
+        for unit in units:
+            if unit.tokens > max_tokens:
+                sized.extend(_split_oversized(unit, max_tokens))
+            else:
+                sized.append(unit)
+
+        metadata = doc["metadata"]
+        source = metadata.get("source", "")
+        page = metadata.get("page", 0)
+        for index, chunk in enumerate(_pack(sized, max_tokens, overlap_tokens, min_tokens)):
+            chunk_metadata = metadata.copy()
+            chunk_metadata["heading"] = chunk[0].heading or metadata.get("heading", "")
+            chunk_metadata["chunk_index"] = index
+            chunk_metadata["chunk_id"] = f"{source}:p{page}:c{index}"
+            chunked_documents.append({
+                "content": _join(chunk),
+                "metadata": chunk_metadata
+            })
+
+    logger.info(f"Split {len(documents)} pages into {len(chunked_documents)} chunks")
+    return chunked_documents
@@ -12,53 +12,166 @@ STATIC_DIR = "static"
 TEMPLATES_DIR = "templates"
 CACHE_DIR = "response_cache"
 LOG_DIR = "logs"
+FEEDBACK_DIR = "feedback"
 
 # Create directories if they don't exist
-for dir_path in [DOCS_DIR, PROCESSED_DIR, STATIC_DIR, TEMPLATES_DIR, CACHE_DIR, LOG_DIR]:
+for dir_path in [DOCS_DIR, PROCESSED_DIR, STATIC_DIR, TEMPLATES_DIR, CACHE_DIR, LOG_DIR, FEEDBACK_DIR]:
     os.makedirs(dir_path, exist_ok=True)
 
 # Document processing settings
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_TOKENS = 250  # Maximum tokens per chunk (chunker.py)
+CHUNK_OVERLAP_TOKENS = 50  # Trailing blocks of up to this many tokens are repeated in the next chunk
+CHUNK_MIN_TOKENS = 50  # A heading only starts a new chunk once the current one has this many tokens
+CHUNK_OVERLAP = 200  # Characters of overlap to look for when merging retrieved neighbours
 EXTRACT_IMAGES = True
 IMAGE_MIN_SIZE = 100  # Minimum width/height to extract
+IMAGE_MAX_SIZE = 672  # Longest side sent to LLaVA (its effective input resolution); larger images are downscaled
+IMAGE_UNIFORM_RANGE = 16  # Images whose brightness range (max - min, 0-255) is at most this are skipped as blank
+IMAGE_JPEG_QUALITY = 85  # Quality for re-encoding images before upload
 OCR_ENABLED = True
+INGEST_JOURNAL = os.path.join(PROCESSED_DIR, "ingest_journal.jsonl")  # Per-page write-ahead journal (process_docs.py --resume)
+EMBEDDINGS_JOURNAL = os.path.join(PROCESSED_DIR, "embeddings_journal.pkl")  # Embedded chunk batches of an unfinished run
+DEDUP_ENABLED = True  # Collapse near-identical pages (boilerplate repeated across manuals) before chunking
+DEDUP_THRESHOLD = 0.9  # Estimated Jaccard similarity of word shingles at which pages count as duplicates
+DEDUP_NUM_PERM = 64  # MinHash signature length
+DEDUP_BANDS = 16  # LSH bands (DEDUP_NUM_PERM must be divisible by this)
+DEDUP_SHINGLE_SIZE = 5  # Words per shingle
+DEDUP_MIN_WORDS = 30  # Shorter pages are never deduplicated
+
+# Ollama backend pool settings (used for chat and LLaVA captioning)
+# Each backend has a base URL, a weight (relative capacity) and optionally the
+# models it should be used for (None: whatever models it reports in /api/tags)
+OLLAMA_BACKENDS = [
+    {"url": "http://localhost:11434", "weight": 1, "models": None},
+]
+OLLAMA_HEALTH_INTERVAL = 10  # Seconds between background health checks of the backends
+OLLAMA_HEALTH_TIMEOUT = 2  # Timeout of a health check request in seconds
+OLLAMA_MAX_OUTSTANDING = 4  # Requests per unit of weight at which a backend counts as overloaded (0 disables)
+OLLAMA_EJECT_SECONDS = 30  # A backend that failed or was overloaded is skipped for this long
+OLLAMA_MAX_ATTEMPTS = 3  # Backends tried per request before giving up
 
 # LLaVA settings for document pre-processing
 LLAVA_MODEL = "llava"
-LLAVA_URL = "http://localhost:11434/api/generate"
 LLAVA_TEMPERATURE = 0.2
 LLAVA_CONTEXT_SIZE = 1000  # Text context size around images
 
 # Ollama LLM settings for chat
-OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "phi4"  # Default model for chat
 LLM_TEMPERATURE = 0.3
 LLM_MAX_TOKENS = 1000
 LLM_TOP_P = 0.9
 LLM_FREQUENCY_PENALTY = 0.0
 LLM_PRESENCE_PENALTY = 0.0
-LLM_CONTEXT_WINDOW = 8000
+LLM_CONTEXT_WINDOW = 8000  # Legacy character budget, superseded by LLM_CONTEXT_TOKENS
+LLM_CONTEXT_TOKENS = 2000  # Token budget for retrieved excerpts in the prompt
+CONTEXT_TOKENIZER = "cl100k_base"  # tiktoken encoding used to count prompt tokens
 LLM_USE_STREAMING = False
 
+# Model routing settings
+MODEL_ROUTING_ENABLED = True
+FAST_MODEL = "llama3.2:3b"  # Smaller chat model for simple lookups and peak load (None to disable)
+FAST_MODEL_MAX_TOKENS = 500
+ROUTING_QUEUE_DEPTH = 4  # Requests in flight at which everything goes to FAST_MODEL (0 to disable)
+ROUTING_COMPLEX_MIN_WORDS = 20  # Questions at least this long go to OLLAMA_MODEL
+ROUTING_COMPLEX_KEYWORDS = [  # Words that mark troubleshooting or reasoning questions
+    "why", "troubleshoot", "troubleshooting", "fault", "error", "alarm", "not working",
+    "compare", "comparison", "difference", "versus", "vs", "explain", "step by step", "steps"
+]
+ROUTING_CONTEXT_TOKENS = 1200  # Retrieved context of this size goes to OLLAMA_MODEL
+
+# Conversation session settings
+SESSIONS_ENABLED = True
+SESSION_MAX_COUNT = 1000  # Maximum number of live sessions kept in memory
+SESSION_TTL = 1800  # Seconds of inactivity after which a session expires
+SESSION_MAX_TURNS = 10  # Number of recent turns remembered per session
+SESSION_MAX_CONTEXT_TOKENS = 6000  # Start a fresh Ollama context once it grows beyond this
+
 # Retrieval settings
 SEARCH_TOP_K = 5  # Number of chunks to retrieve
 RERANK_RESULTS = True
 MINIMUM_RELEVANCE = 0.3  # Minimum relevance score to include
+RETRIEVAL_MODE = "mmr"  # "mmr" (diversified, adaptive k) or "similarity" (plain top-k)
+MMR_FETCH_K = 20  # Candidates fetched from the vector database for MMR
+MMR_LAMBDA = 0.7  # Trade-off between relevance (1.0) and diversity (0.0)
+MMR_DUPLICATE_SIMILARITY = 0.95  # Candidates this similar to a selected one are skipped outright
+RELEVANCE_CLIFF_GAP = 0.08  # Stop adding results when the score drops by more than this
+ADAPTIVE_MIN_K = 2  # Results always kept (if above MINIMUM_RELEVANCE) before applying the cliff rule
 CACHE_SIZE = 100  # Maximum number of cached responses
 CACHE_TTL = 86400  # Time to live for cache in seconds (default: 1 day)
 
+# Speculative retrieval settings (/prefetch)
+PREFETCH_ENABLED = True
+PREFETCH_TTL = 30  # Seconds prefetched context stays usable
+PREFETCH_MAX_CLIENTS = 1000  # Maximum number of clients with prefetched context
+PREFETCH_MAX_PER_CLIENT = 3  # Most recent partial questions kept per client
+PREFETCH_MIN_CHARS = 12  # Shorter partial questions are not prefetched
+
+# Feedback store settings
+FEEDBACK_DB = os.path.join(FEEDBACK_DIR, "feedback.db")  # SQLite database (legacy JSON files are imported)
+FEEDBACK_BATCH_SIZE = 100  # Maximum submissions written in one transaction
+FEEDBACK_FLUSH_INTERVAL = 1.0  # Seconds the writer waits to batch more submissions
+FEEDBACK_RETRY_MAX_DELAY = 30  # Maximum seconds between attempts to open the database
+
+# Cache warming settings (warm_cache.py)
+WARM_CACHE_TOP_N = 50  # Most frequent questions to pre-generate
+WARM_CACHE_CONCURRENCY = 2  # Simultaneous Ollama generations while warming
+WARM_CACHE_STATE = os.path.join(LOG_DIR, "warm_cache_state.json")  # Resume journal
+WARM_CACHE_LOG_FILES = [os.path.join(LOG_DIR, "app.log*"), "app.log*"]  # Request logs scanned for asked questions
+
+# Batch question answering settings (/ask/batch)
+BATCH_MAX_QUERIES = 100  # Maximum questions per batch request
+BATCH_CONCURRENCY = 2  # Simultaneous Ollama generations per batch
+
+# Vector store settings
+VECTOR_STORE = "chroma"  # "chroma", or "int8"/"binary" for the quantized index with exact rescoring
+QUANTIZED_RESCORE_CANDIDATES = 100  # Candidates from the quantized scan that are rescored exactly
+
 # Embedding settings
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Lightweight model for embeddings
+EMBEDDING_BACKEND = "sentence-transformers"  # "sentence-transformers", "onnx" or "onnx-int8"
+EMBEDDING_ONNX_DIR = os.path.join(PROCESSED_DIR, "onnx")  # Exported ONNX models
+EMBEDDING_BATCH_SIZE = 32  # Texts per encode call during ingestion
+EMBEDDING_PARITY_MIN_COSINE = 0.99  # Minimum similarity to the PyTorch vectors for an index to stay valid
+QUERY_BATCHING_ENABLED = True  # Encode concurrent queries together in micro-batches
+QUERY_BATCH_WAIT_MS = 5  # How long the encoder waits for more queries before running a batch
+QUERY_BATCH_MAX = 32  # Maximum number of queries encoded in one batch
 
 # Server settings
+STATIC_COMPRESSION_MIN_SIZE = 1024  # Smaller static files are served uncompressed
+STATIC_IMMUTABLE_MAX_AGE = 31536000  # Cache lifetime (seconds) for content-hashed build assets
 DEBUG_MODE = True
 HOST = "127.0.0.1"
 PORT = 5000
 LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"  # Log file format: "json" (one object per line) or "text"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate log files at this size
+LOG_BACKUP_COUNT = 5  # Rotated log files kept per log
+LOG_SAMPLE_RATES = {}  # Fraction of INFO/DEBUG records kept per logger, e.g. {"werkzeug": 0.1}
 
 # Performance settings
 REQUEST_TIMEOUT = 180  # Timeout for API requests in seconds
+ASK_DEADLINE_SECONDS = REQUEST_TIMEOUT  # Default (and maximum) time budget of an /ask request
+DEADLINE_MIN_GENERATION_SECONDS = 5  # Don't start generating if less time than this is left
+DISCONNECT_POLL_INTERVAL = 0.5  # Seconds between checks for clients that closed their connection
+# Cumulative import time per entry point in ms (checked by benchmarks/import_budget.py).
+# About 2x the median of 9 fresh imports (at least 100 ms): single runs vary by up to
+# 1.4x on a busy machine, and a heavy module-level import still costs far more.
+IMPORT_TIME_BUDGETS = {
+    "app": 600,  # Measured median 297 ms
+    "qa_system": 400,  # 197 ms
+    "process_docs": 100,  # 28 ms
+    "document_processor": 350,  # 176 ms
+    "warm_cache": 100  # 27 ms
+}
+
+# Metrics settings
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180]
+
+# Diagnostics settings
+SLOW_QUERY_THRESHOLD = 20.0  # Requests slower than this (seconds) go to the slow-query log
+SLOW_QUERY_LOG = os.path.join(LOG_DIR, "slow_queries.jsonl")
+PROFILE_EVERY_N_REQUESTS = 0  # Profile every Nth /ask request with cProfile (0 disables)
 
 # Collection name for vector database
 COLLECTION_NAME = "smc_documentation"
\ No newline at end of file
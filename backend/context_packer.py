@@ -0,0 +1,187 @@
+# context_packer.py
+"""
+Token-budgeted packing of retrieved chunks into the LLM prompt context.
+
+Retrieved chunks from the same page frequently overlap (CHUNK_OVERLAP) or are
+direct neighbours, so they are first merged into single excerpts. Excerpts are
+then selected by relevance per token until the token budget is filled.
+"""
+import re
+import logging
+
+from config import LLM_CONTEXT_TOKENS, CONTEXT_TOKENIZER, CHUNK_OVERLAP
+
+logger = logging.getLogger("context_packer")
+
+_encoder = None
+_encoder_loaded = False
+
+# Technical text averages roughly 1.3 BPE tokens per word
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_WORD_TOKEN_FACTOR = 1.3
+
+def _get_encoder():
+    """Return the tiktoken encoder if tiktoken is installed, otherwise None."""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            logger.warning(f"tiktoken not available ({str(e)}), using approximate token counts; "
+                           f"install it with pip install tiktoken")
+            _encoder = None
+    return _encoder
+
+def count_tokens(text):
+    """Count tokens in text with the configured tokenizer (approximate without tiktoken)."""
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return int(len(_TOKEN_PATTERN.findall(text)) * _WORD_TOKEN_FACTOR) + 1
+
+def count_tokens_batch(texts):
+    """Count tokens of many texts in one call (tiktoken encodes them in parallel)."""
+    encoder = _get_encoder()
+    if encoder is not None:
+        return [len(tokens) for tokens in encoder.encode_batch(list(texts), disallowed_special=())]
+    return [int(len(_TOKEN_PATTERN.findall(text)) * _WORD_TOKEN_FACTOR) + 1 for text in texts]
+
+def truncate_to_tokens(text, max_tokens):
+    """Truncate text to at most max_tokens, preferring a sentence or line boundary."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoder = _get_encoder()
+    if encoder is not None:
+        truncated = encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        # Keep the first max_tokens approximate tokens
+        matches = list(_TOKEN_PATTERN.finditer(text))
+        keep = max(int(max_tokens / _WORD_TOKEN_FACTOR) - 1, 1)
+        truncated = text[:matches[min(keep, len(matches)) - 1].end()]
+
+    # Cut back to the last sentence or line end if it doesn't lose too much
+    boundary = max(truncated.rfind(". "), truncated.rfind("\n"))
+    if boundary > len(truncated) * 0.7:
+        truncated = truncated[:boundary + 1]
+    return truncated
+
+def _chunk_position(ctx):
+    """Position of a chunk within its source, used to detect neighbouring chunks."""
+    if "chunk_index" in ctx:
+        return ctx["chunk_index"]
+    match = re.search(r"(\d+)$", str(ctx.get("id", "")))
+    return int(match.group(1)) if match else None
+
+def _overlap_length(first, second, max_overlap):
+    """Length of the longest suffix of first that is also a prefix of second."""
+    probe = second[:min(50, len(second))]
+    if not probe:
+        return 0
+    # Scan from the earliest candidate so the longest overlap wins
+    pos = first.find(probe, max(len(first) - max_overlap, 0))
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return len(first) - pos
+        pos = first.find(probe, pos + 1)
+    return 0
+
+def merge_overlapping_chunks(context, max_overlap=CHUNK_OVERLAP * 2):
+    """
+    Merge overlapping or adjacent chunks from the same page into single excerpts.
+
+    Returns a new list of context entries; merged entries keep the highest
+    relevance of their parts and list the merged chunk ids under "ids".
+    """
+    groups = {}
+    for ctx in context:
+        groups.setdefault((ctx["source"], ctx["page"]), []).append(ctx)
+
+    merged = []
+    for chunks in groups.values():
+        # Order chunks by their position in the document when known
+        if all(_chunk_position(c) is not None for c in chunks):
+            chunks = sorted(chunks, key=_chunk_position)
+
+        current = None
+        previous_position = None
+        for ctx in chunks:
+            position = _chunk_position(ctx)
+            if current is None:
+                current = dict(ctx, ids=[ctx.get("id")])
+                previous_position = position
+                continue
+
+            overlap = _overlap_length(current["content"], ctx["content"], max_overlap)
+            adjacent = (previous_position is not None and position is not None
+                        and position == previous_position + 1)
+            previous_position = position
+
+            if overlap or adjacent:
+                current["content"] += ctx["content"][overlap:] if overlap else "\n" + ctx["content"]
+                current["relevance"] = max(current.get("relevance", 0), ctx.get("relevance", 0))
+                current["ids"].append(ctx.get("id"))
+            else:
+                merged.append(current)
+                current = dict(ctx, ids=[ctx.get("id")])
+        merged.append(current)
+
+    return merged
+
+def format_excerpt(ctx, content=None):
+    """Format a single excerpt with clear section boundaries."""
+    parts = [f"--- START EXCERPT FROM {ctx['source']}, PAGE {ctx['page']} ---\n"]
+    if ctx.get("heading"):
+        parts.append(f"SECTION: {ctx['heading']}\n")
+    parts.append(f"{ctx['content'] if content is None else content}\n")
+    parts.append(f"--- END EXCERPT FROM {ctx['source']}, PAGE {ctx['page']} ---\n\n")
+    return "".join(parts)
+
+def pack_context(context, max_tokens=LLM_CONTEXT_TOKENS):
+    """
+    Pack retrieved chunks into a context string that fits in max_tokens.
+
+    The most relevant excerpt is always included (truncated if necessary); the
+    remaining budget is filled greedily by relevance per token.
+
+    Returns:
+        Tuple of (context_text, used_tokens, chunk_ids) where chunk_ids lists
+        the ids of all chunks that made it into the context
+    """
+    excerpts = []
+    for ctx in merge_overlapping_chunks(context):
+        text = format_excerpt(ctx)
+        excerpts.append({"ctx": ctx, "text": text, "tokens": count_tokens(text),
+                         "relevance": ctx.get("relevance", 0)})
+
+    if not excerpts:
+        return "", 0, []
+
+    excerpts.sort(key=lambda x: x["relevance"], reverse=True)
+
+    # Always include the most relevant excerpt, truncated to the budget if needed
+    best = excerpts[0]
+    if best["tokens"] > max_tokens:
+        marker = "... [content truncated]"
+        overhead = count_tokens(format_excerpt(best["ctx"], content=marker))
+        content = truncate_to_tokens(best["ctx"]["content"], max_tokens - overhead)
+        best["text"] = format_excerpt(best["ctx"], content=content + marker)
+        best["tokens"] = count_tokens(best["text"])
+    selected = [best]
+    used = best["tokens"]
+
+    # Fill the remaining budget by relevance per token
+    remaining = sorted(excerpts[1:], key=lambda x: x["relevance"] / max(x["tokens"], 1), reverse=True)
+    for excerpt in remaining:
+        if used + excerpt["tokens"] <= max_tokens:
+            selected.append(excerpt)
+            used += excerpt["tokens"]
+
+    # Present the selected excerpts in order of relevance
+    selected.sort(key=lambda x: x["relevance"], reverse=True)
+    chunk_ids = [cid for e in selected for cid in e["ctx"]["ids"]]
+    return "".join(e["text"] for e in selected), used, chunk_ids
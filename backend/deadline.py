@@ -0,0 +1,193 @@
+# deadline.py
+"""
+Per-request deadlines and cancellation.
+
+Every /ask request gets a Deadline that is passed through retrieval and
+generation. Stages check it before they start and are skipped when the
+remaining budget can't cover them. Work stops early when the deadline passes
+or the request is cancelled. A request is cancelled when the client
+disconnects (noticed by DisconnectMonitor) or calls /ask/cancel. Cancelling
+closes the Ollama stream, and Ollama then stops generating.
+"""
+import time
+import select
+import socket
+import logging
+import threading
+
+import metrics
+from config import DISCONNECT_POLL_INTERVAL
+
+logger = logging.getLogger("deadline")
+
+class RequestAborted(Exception):
+    """Base class for requests that stopped before they finished."""
+
+    reason = "aborted"
+
+class DeadlineExceeded(RequestAborted):
+    """The request's time budget ran out (or would run out before a stage could finish)."""
+
+    reason = "deadline"
+
+class RequestCancelled(RequestAborted):
+    """The client disconnected or cancelled the request."""
+
+    reason = "cancelled"
+
+class Deadline:
+    """A time budget for one request that can also be cancelled from another thread."""
+
+    def __init__(self, seconds, request_id=None):
+        self.request_id = request_id
+        self.expires_at = time.monotonic() + seconds
+        self.cancel_reason = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self):
+        return self.cancel_reason is not None
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the request and run the registered callbacks (e.g. closing the Ollama stream)."""
+        with self._lock:
+            if self.cancel_reason is not None:
+                return
+            self.cancel_reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"Request {self.request_id} cancelled ({reason})")
+        metrics.inc_counter("qa_requests_cancelled_total", help_text="Requests stopped before completion",
+                            reason=reason)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancel callback failed: {str(e)}")
+
+    def on_cancel(self, callback):
+        """Register a callback to run on cancellation; returns a function that unregisters it."""
+        with self._lock:
+            if self.cancel_reason is None:
+                self._callbacks.append(callback)
+                registered = True
+            else:
+                registered = False
+        if not registered:
+            callback()
+
+        def remove():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return remove
+
+    def check(self, stage, min_seconds=0.0):
+        """
+        Raise if the request was cancelled or fewer than min_seconds remain.
+
+        Args:
+            stage: Name of the stage about to start (for logs and metrics)
+            min_seconds: Time the stage needs at least to be worth starting
+        """
+        if self.cancelled:
+            raise RequestCancelled(f"Request cancelled before {stage}")
+        if self.remaining() <= min_seconds:
+            metrics.inc_counter("qa_stages_skipped_total", help_text="Stages skipped for lack of time",
+                                stage=stage)
+            raise DeadlineExceeded(f"Deadline too close to start {stage} "
+                                   f"({self.remaining():.1f}s left, {min_seconds:.1f}s needed)")
+
+    def timeout(self, default):
+        """A socket timeout that never outlives the deadline."""
+        return max(min(default, self.remaining()), 0.001)
+
+# In-flight requests by request id, for /ask/cancel
+_active = {}
+_active_lock = threading.Lock()
+
+def register(deadline):
+    with _active_lock:
+        _active[deadline.request_id] = deadline
+
+def unregister(deadline):
+    with _active_lock:
+        if _active.get(deadline.request_id) is deadline:
+            del _active[deadline.request_id]
+
+def cancel(request_id, reason="client"):
+    """Cancel an in-flight request by id; returns False if no such request is running."""
+    with _active_lock:
+        deadline = _active.get(request_id)
+    if deadline is None:
+        return False
+    deadline.cancel(reason)
+    return True
+
+def client_socket(environ):
+    """The client connection of a WSGI request, if the server exposes it."""
+    return environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+
+# MSG_DONTWAIT does not exist on Windows; there the select() below keeps recv from blocking
+_PEEK_FLAGS = socket.MSG_PEEK | getattr(socket, "MSG_DONTWAIT", 0)
+
+def _disconnected(sock):
+    """True if the peer closed the connection (readable with nothing to read)."""
+    # The socket is not switched to non-blocking mode, since the request's thread
+    # may be writing the response to it at the same time
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, _PEEK_FLAGS) == b""
+    except (BlockingIOError, InterruptedError):
+        return False
+    except (OSError, ValueError):
+        return True
+
+class DisconnectMonitor:
+    """Background thread that cancels requests whose client has gone away."""
+
+    def __init__(self, interval=DISCONNECT_POLL_INTERVAL):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, deadline, sock):
+        with self._lock:
+            self._watched[deadline] = sock
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="disconnect-monitor", daemon=True)
+                self._thread.start()
+
+    def unwatch(self, deadline):
+        with self._lock:
+            self._watched.pop(deadline, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = list(self._watched.items())
+            if not watched:
+                continue
+            try:
+                readable, _, _ = select.select([sock for _, sock in watched], [], [], 0)
+            except (OSError, ValueError):
+                # A socket was closed under us; check them one by one
+                readable = [sock for _, sock in watched]
+            for deadline, sock in watched:
+                try:
+                    if sock in readable and _disconnected(sock):
+                        self.unwatch(deadline)
+                        deadline.cancel("disconnect")
+                except Exception as e:
+                    # Stop watching this request, but keep monitoring the others
+                    self.unwatch(deadline)
+                    logger.warning(f"Disconnect check of request {deadline.request_id} failed: {str(e)}")
+
+monitor = DisconnectMonitor()
@@ -0,0 +1,201 @@
+# dedup.py
+"""
+Near-duplicate page detection for extracted documents.
+
+Manual libraries repeat the same safety, warranty and boilerplate pages across
+many documents. Pages are compared by MinHash signatures of their word shingles;
+candidate pairs come from LSH banding and are confirmed when the estimated
+Jaccard similarity reaches DEDUP_THRESHOLD. Each group of near-identical pages
+is collapsed into its first page (in input order, so the result is
+deterministic), which lists every copy under the "references" metadata field.
+
+References are stored as a JSON string because vector store metadata must be
+scalar. So that scoped searches still find a page in every partition it was
+collapsed from, partitions.assign_series also flags the canonical chunks with
+the copies' sources and series.
+
+numpy is only imported when pages are compared, since qa_system imports this
+module for parse_references.
+"""
+import re
+import json
+import hashlib
+import logging
+from functools import lru_cache
+
+import metrics
+from config import (
+    DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_SIZE, DEDUP_MIN_WORDS
+)
+
+logger = logging.getLogger("dedup")
+
+IMAGE_SECTION_MARKER = "\n\nIMAGE DESCRIPTIONS:\n"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+@lru_cache(maxsize=None)
+def _permutations():
+    """
+    Fixed permutation parameters (a, b) so signatures are stable across runs. With
+    32-bit shingle hashes and a, b < 2**32, a * h + b cannot overflow 64 bits.
+    """
+    import numpy as np
+    rng = np.random.RandomState(1)
+    perm_a = rng.randint(1, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.int64).astype(np.uint64)
+    perm_b = rng.randint(0, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.int64).astype(np.uint64)
+    return perm_a, perm_b
+
+def _shingles(text, size=DEDUP_SHINGLE_SIZE):
+    """Hash the word shingles of a page's text (image descriptions excluded) to 32-bit ints."""
+    import numpy as np
+    words = _WORD_PATTERN.findall(text.partition(IMAGE_SECTION_MARKER)[0].lower())
+    if len(words) < DEDUP_MIN_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+
+def minhash_signature(text):
+    """MinHash signature (DEDUP_NUM_PERM values) of a page, or None if it is too short to compare."""
+    hashes = _shingles(text)
+    if hashes is None:
+        return None
+    perm_a, perm_b = _permutations()
+    return ((hashes[:, None] * perm_a + perm_b) % _MERSENNE_PRIME).min(axis=0)
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def find_duplicate_groups(documents, threshold=DEDUP_THRESHOLD, bands=DEDUP_BANDS):
+    """
+    Group near-identical pages.
+
+    Returns:
+        List of index lists (in input order) with two or more pages each
+    """
+    import numpy as np
+    signatures = [minhash_signature(doc["content"]) for doc in documents]
+    rows = DEDUP_NUM_PERM // bands
+
+    parent = list(range(len(documents)))
+    buckets = {}
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            bucket = buckets.setdefault(key, [])
+            merged = False
+            for j in bucket:
+                root_i, root_j = _find(parent, i), _find(parent, j)
+                if root_i == root_j:
+                    merged = True
+                    continue
+                # Confirm the candidate pair, and don't merge pages with different image counts
+                similarity = float(np.mean(signatures[i] == signatures[j]))
+                if (similarity >= threshold and documents[i]["metadata"].get("image_count", 0)
+                        == documents[j]["metadata"].get("image_count", 0)):
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+                    merged = True
+            # A page merged with a member of the bucket is represented by it, which keeps
+            # buckets small when hundreds of manuals share a page
+            if not merged:
+                bucket.append(i)
+
+    groups = {}
+    for i in range(len(documents)):
+        if signatures[i] is not None:
+            groups.setdefault(_find(parent, i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+class PageIndex:
+    """
+    Incremental near-duplicate lookup for pages as they are extracted.
+
+    Lets extraction skip LLaVA for a page that repeats an earlier one: the earlier
+    page's image descriptions are copied, and deduplicate_pages() later collapses
+    the two. Only pages that were not found are added, which keeps buckets small.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=DEDUP_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = DEDUP_NUM_PERM // bands
+        self._entries = []  # (signature, image_count, value)
+        self._buckets = {}
+
+    def _keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def find(self, text, image_count):
+        """Return the value stored for a near-identical page with the same image count, or None."""
+        import numpy as np
+        signature = minhash_signature(text)
+        if signature is None:
+            return None
+        for key in self._keys(signature):
+            for i in self._buckets.get(key, ()):
+                other, other_image_count, value = self._entries[i]
+                if other_image_count == image_count and float(np.mean(signature == other)) >= self.threshold:
+                    return value
+        return None
+
+    def add(self, text, image_count, value):
+        signature = minhash_signature(text)
+        if signature is None:
+            return
+        self._entries.append((signature, image_count, value))
+        for key in self._keys(signature):
+            self._buckets.setdefault(key, []).append(len(self._entries) - 1)
+
+def deduplicate_pages(documents, threshold=DEDUP_THRESHOLD):
+    """
+    Collapse near-identical pages into their first occurrence.
+
+    Returns:
+        New document list; canonical pages of a group get a "references" metadata
+        field (JSON list of {"source", "page"} for every copy, itself included)
+        and "duplicate_count"
+    """
+    groups = find_duplicate_groups(documents, threshold)
+    dropped = set()
+    canonical = {}
+    for members in groups:
+        first = members[0]
+        canonical[first] = [
+            {"source": documents[i]["metadata"]["source"], "page": documents[i]["metadata"]["page"]}
+            for i in members
+        ]
+        dropped.update(members[1:])
+
+    deduplicated = []
+    for i, doc in enumerate(documents):
+        if i in dropped:
+            continue
+        if i in canonical:
+            doc = dict(doc, metadata=dict(doc["metadata"]))
+            doc["metadata"]["references"] = json.dumps(canonical[i])
+            doc["metadata"]["duplicate_count"] = len(canonical[i]) - 1
+        deduplicated.append(doc)
+
+    metrics.inc_counter("ingest_duplicate_pages_total", len(dropped), "Near-duplicate pages collapsed")
+    logger.info(f"Collapsed {len(dropped)} near-duplicate pages into {len(groups)} canonical pages "
+                f"({len(deduplicated)} of {len(documents)} pages kept)")
+    return deduplicated
+
+def parse_references(metadata):
+    """Return the list of {"source", "page"} copies stored on a canonical page (empty if none)."""
+    references = metadata.get("references")
+    if not references:
+        return []
+    try:
+        return json.loads(references)
+    except (TypeError, ValueError):
+        return []
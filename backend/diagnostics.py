@@ -0,0 +1,93 @@
+# diagnostics.py
+"""
+Per-request diagnostics: slow-query log and sampled cProfile profiling.
+"""
+import os
+import json
+import time
+import itertools
+import threading
+import logging
+import cProfile
+from contextlib import contextmanager
+
+from config import (
+    LOG_DIR, SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG, PROFILE_EVERY_N_REQUESTS
+)
+
+logger = logging.getLogger("diagnostics")
+
+_slow_log_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_request_counter = itertools.count(1)
+
+def round_timings(timings):
+    """Round float timings for presentation, leaving counts and flags untouched."""
+    return {
+        key: round(value, 4) if isinstance(value, float) else value
+        for key, value in timings.items()
+    }
+
+def log_slow_query(query, context, timings, total_seconds):
+    """Append a record to the slow-query log if the request exceeded the threshold."""
+    if SLOW_QUERY_THRESHOLD is None or total_seconds < SLOW_QUERY_THRESHOLD:
+        return False
+    
+    record = {
+        "timestamp": time.time(),
+        "query": query,
+        "total_seconds": round(total_seconds, 4),
+        "chunk_ids": [ctx.get("id") for ctx in context],
+        "stages": round_timings(timings)
+    }
+    
+    try:
+        with _slow_log_lock:
+            with open(SLOW_QUERY_LOG, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        logger.warning(f"Slow query ({total_seconds:.2f}s): {query[:50]}...")
+    except Exception as e:
+        logger.warning(f"Error writing slow-query log: {str(e)}")
+    
+    return True
+
+@contextmanager
+def maybe_profile(label="ask"):
+    """
+    Profile every PROFILE_EVERY_N_REQUESTS-th call with cProfile.
+    
+    The profile is dumped to LOG_DIR as profile_<label>_<timestamp>_<n>.prof and
+    can be inspected with `python -m pstats` or snakeviz. Only one request is
+    profiled at a time; concurrent samples are skipped.
+    """
+    n = next(_request_counter)
+    if PROFILE_EVERY_N_REQUESTS <= 0 or n % PROFILE_EVERY_N_REQUESTS != 0:
+        yield
+        return
+    
+    if not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    
+    try:
+        profiler = cProfile.Profile()
+        try:
+            # Fails if another profiler is already active, e.g. one attached to the server
+            profiler.enable()
+        except Exception as e:
+            logger.warning(f"Could not profile request {n}, running it unprofiled: {str(e)}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+        
+        profile_path = os.path.join(LOG_DIR, f"profile_{label}_{int(time.time())}_{n}.prof")
+        try:
+            profiler.dump_stats(profile_path)
+            logger.info(f"Wrote request profile to {profile_path}")
+        except OSError as e:
+            logger.warning(f"Could not write request profile to {profile_path}: {str(e)}")
+    finally:
+        _profile_lock.release()
@@ -3,34 +3,37 @@
 Document processor using LLaVA to extract text and analyze images from SMC documentation PDFs.
 """
 import os
-import fitz  # PyMuPDF
+import re
 import base64
-import requests
-import io
-from PIL import Image
-import pickle
-from tqdm import tqdm
+import hashlib
 import logging
 import time
 
+import dedup
+import metrics
+import ollama_pool
+from image_preprocessing import prepare_image
+from ingest_journal import IngestJournal, atomic_pickle, file_fingerprint
+from logging_setup import setup_logging
+
 # Import configuration
 from config import (
-    DOCS_DIR, PROCESSED_DIR, CHUNK_SIZE, CHUNK_OVERLAP,
-    EXTRACT_IMAGES, IMAGE_MIN_SIZE, OCR_ENABLED,
-    LLAVA_URL, LLAVA_MODEL, LLAVA_TEMPERATURE, LLAVA_CONTEXT_SIZE
+    DOCS_DIR, PROCESSED_DIR,
+    EXTRACT_IMAGES, OCR_ENABLED, DEDUP_ENABLED,
+    LLAVA_MODEL, LLAVA_TEMPERATURE, LLAVA_CONTEXT_SIZE
 )
 
-# Import chunking from langchain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Structure-aware token chunking (re-exported for callers of document_processor.chunk_documents)
+from chunker import chunk_documents
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("document_processor.log"), logging.StreamHandler()]
-)
 logger = logging.getLogger("document_processor")
 
+# Start of each "[Image <page>.<n>]: ..." entry in a page's image descriptions
+_IMAGE_ENTRY_PATTERN = re.compile(r"\n\n(?=\[Image \d+\.\d+\]: )")
+
+# Captions by SHA-1 of the (preprocessed) image bytes, shared across the PDFs of a run
+_caption_cache = {}
+
 def encode_image_to_base64(image_bytes):
     """Convert image bytes to base64 string for API."""
     return base64.b64encode(image_bytes).decode('utf-8')
@@ -64,17 +67,21 @@ Be specific about part numbers, labels, and functional descriptions.
         }
         
         # Call LLaVA API
-        response = requests.post(
-            LLAVA_URL,
-            json=request_data,
+        start_time = time.time()
+        with ollama_pool.get_pool().post(
+            "/api/generate",
+            request_data,
             timeout=60  # Longer timeout for image processing
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "Error: No response content")
-        else:
-            return f"Error: API returned status code {response.status_code}"
+        ) as response:
+            metrics.observe("ingest_llava_seconds", time.time() - start_time,
+                            "LLaVA image captioning latency")
+            
+            if response.status_code == 200:
+                result = response.json()
+                metrics.record_ollama_stats(result, LLAVA_MODEL, stage="ingest")
+                return result.get("response", "Error: No response content")
+            else:
+                return f"Error: API returned status code {response.status_code}"
             
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
@@ -171,8 +178,26 @@ def ocr_page(pdf_path, page_num):
     except Exception as e:
         return f"[OCR ERROR: {str(e)}]"
 
-def extract_text_with_llava(pdf_path, verbose=True):
-    """Extract text and analyze images with LLaVA."""
+def _index_page(page_index, document):
+    """Make a captioned page available to later duplicates of it."""
+    if page_index is None or not document["metadata"].get("image_count"):
+        return
+    text, _, image_section = document["content"].partition(dedup.IMAGE_SECTION_MARKER)
+    image_count = document["metadata"]["image_count"]
+    if page_index.find(text, image_count) is None:
+        page_index.add(text, image_count, _IMAGE_ENTRY_PATTERN.split(image_section))
+
+def extract_text_with_llava(pdf_path, verbose=True, journal=None, page_index=None):
+    """
+    Extract text and analyze images with LLaVA.
+    
+    With a journal, pages it already holds are reused and every finished page
+    and caption is recorded as soon as it is done. With a dedup.PageIndex, a page
+    whose text repeats an earlier page (with as many images) is not captioned;
+    the earlier page's image descriptions are copied instead.
+    """
+    import fitz  # PyMuPDF, imported on first use since it is slow to load
+    
     documents = []
     filename = os.path.basename(pdf_path)
     
@@ -181,6 +206,13 @@ def extract_text_with_llava(pdf_path, verbose=True):
         doc = fitz.open(pdf_path)
         
         for i, page in enumerate(doc):
+            journaled = journal.page(filename, i) if journal else None
+            if journaled is not None:
+                documents.append(journaled)
+                _index_page(page_index, journaled)
+                continue
+            
+            caption_failed = False
             try:
                 # Extract text with layout preservation
                 text = page.get_text("text")
@@ -191,6 +223,7 @@ def extract_text_with_llava(pdf_path, verbose=True):
                     if verbose:
                         logger.info(f"  Page {i+1} has limited text, trying OCR...")
                     text = ocr_page(pdf_path, i)
+                    metrics.inc_counter("ingest_ocr_pages_total", help_text="Pages processed with OCR")
                 
                 # Extract and analyze images if enabled
                 image_descriptions = []
@@ -198,13 +231,39 @@ def extract_text_with_llava(pdf_path, verbose=True):
                 if EXTRACT_IMAGES:
                     # Get images from the page
                     img_list = page.get_images(full=True)
+                    images = []
                     
                     for img_index, img_info in enumerate(img_list):
                         try:
                             xref = img_info[0]
                             base_image = doc.extract_image(xref)
-                            image_bytes = base_image["image"]
                             
+                            # Skip bullets, decorations and blank images; shrink large scans
+                            image_bytes, reason = prepare_image(
+                                base_image["image"], base_image.get("width"), base_image.get("height")
+                            )
+                            if image_bytes is None:
+                                if verbose:
+                                    logger.debug(f"  Skipping image {img_index+1} on page {i+1} ({reason})")
+                                continue
+                            images.append((img_index, xref, image_bytes))
+                        except Exception as e:
+                            caption_failed = True
+                            if verbose:
+                                logger.error(f"  Error processing image {img_index+1} on page {i+1}: {str(e)}")
+                    
+                    # Boilerplate pages repeated across manuals are captioned once
+                    copied = page_index.find(text, len(images)) if page_index is not None and images else None
+                    if copied is not None:
+                        image_descriptions = list(copied)
+                        images = []
+                        metrics.inc_counter("ingest_duplicate_pages_uncaptioned_total",
+                                            help_text="Duplicate pages whose image descriptions were copied")
+                        if verbose:
+                            logger.info(f"  Page {i+1} repeats an earlier page, copying its image descriptions")
+                    
+                    for img_index, xref, image_bytes in images:
+                        try:
                             # Find image position
                             image_bbox = None
                             for img_rect in page.get_image_rects(xref):
@@ -215,20 +274,35 @@ def extract_text_with_llava(pdf_path, verbose=True):
                             if image_bbox:
                                 surrounding_text = extract_text_around_image(page, image_bbox)
                             
-                            # Process with LLaVA
-                            if verbose:
-                                logger.info(f"  Processing image {img_index+1} on page {i+1} with LLaVA...")
-                            
-                            image_description = process_with_llava(
-                                image_bytes,
-                                surrounding_text=surrounding_text,
-                                page_num=i+1,
-                                source=filename
-                            )
+                            # Logos and boilerplate figures recur across manuals; caption each image once
+                            image_key = hashlib.sha1(image_bytes).hexdigest()
+                            image_description = _caption_cache.get(image_key)
+                            if image_description is not None:
+                                metrics.inc_counter("ingest_images_reused_total",
+                                                    help_text="Images whose caption was reused")
+                            else:
+                                # Process with LLaVA
+                                if verbose:
+                                    logger.info(f"  Processing image {img_index+1} on page {i+1} with LLaVA...")
+                                
+                                image_description = process_with_llava(
+                                    image_bytes,
+                                    surrounding_text=surrounding_text,
+                                    page_num=i+1,
+                                    source=filename
+                                )
+                                if image_description.startswith("Error"):
+                                    caption_failed = True
+                                else:
+                                    _caption_cache[image_key] = image_description
+                                    if journal:
+                                        journal.record_caption(image_key, image_description)
+                                metrics.inc_counter("ingest_images_total", help_text="Images captioned with LLaVA")
                             
                             image_descriptions.append(f"[Image {i+1}.{img_index+1}]: {image_description}")
                             
                         except Exception as e:
+                            caption_failed = True
                             if verbose:
                                 logger.error(f"  Error processing image {img_index+1} on page {i+1}: {str(e)}")
                 
@@ -237,7 +311,7 @@ def extract_text_with_llava(pdf_path, verbose=True):
                 
                 # Add image descriptions if we have any
                 if image_descriptions:
-                    combined_text += "\n\nIMAGE DESCRIPTIONS:\n" + "\n\n".join(image_descriptions)
+                    combined_text += dedup.IMAGE_SECTION_MARKER + "\n\n".join(image_descriptions)
                 
                 # Extract headings from HTML
                 headings = extract_headings_from_html(html)
@@ -252,9 +326,19 @@ def extract_text_with_llava(pdf_path, verbose=True):
                         "heading": heading,
                         "has_images": len(image_descriptions) > 0,
                         "image_count": len(image_descriptions)
-                    }
+                    },
+                    # All headings on the page, used by the chunker to find section starts
+                    "headings": headings
                 })
                 
+                metrics.inc_counter("ingest_pages_total", help_text="PDF pages extracted")
+                if not caption_failed:
+                    _index_page(page_index, documents[-1])
+                
+                # Pages with failed captions (e.g. Ollama went down) are redone on resume
+                if journal and not caption_failed:
+                    journal.record_page(filename, i, documents[-1])
+                
                 if verbose:
                     logger.info(f"  Processed page {i+1}: {len(combined_text)} chars, {len(image_descriptions)} images")
                 
@@ -284,28 +368,13 @@ def extract_text_with_llava(pdf_path, verbose=True):
     
     return documents
 
-def chunk_documents(documents):
-    """Split documents into smaller chunks for better retrieval."""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ".", " ", ""]
-    )
+def process_directory(directory_path=DOCS_DIR, verbose=True, resume=False):
+    """
+    Process all PDFs in a directory using LLaVA for image analysis.
     
-    chunked_documents = []
-    
-    for doc in documents:
-        chunks = text_splitter.split_text(doc["content"])
-        for chunk in chunks:
-            chunked_documents.append({
-                "content": chunk,
-                "metadata": doc["metadata"].copy()
-            })
-    
-    return chunked_documents
-
-def process_directory(directory_path=DOCS_DIR, verbose=True):
-    """Process all PDFs in a directory using LLaVA for image analysis."""
+    Progress is journaled page by page (see ingest_journal.py); with resume=True
+    the pages and captions of an interrupted run are reused.
+    """
     all_documents = []
     processed_files = 0
     failed_files = 0
@@ -314,7 +383,8 @@ def process_directory(directory_path=DOCS_DIR, verbose=True):
         logger.error(f"Directory {directory_path} does not exist.")
         return all_documents
     
-    pdf_files = [f for f in os.listdir(directory_path) if f.lower().endswith('.pdf')]
+    # Sorted so a resumed run produces documents in the same order as an uninterrupted one
+    pdf_files = sorted(f for f in os.listdir(directory_path) if f.lower().endswith('.pdf'))
     
     if not pdf_files:
         logger.warning(f"No PDF files found in {directory_path}")
@@ -322,46 +392,72 @@ def process_directory(directory_path=DOCS_DIR, verbose=True):
     
     logger.info(f"Found {len(pdf_files)} PDF files to process.")
     
-    for filename in pdf_files:
-        file_path = os.path.join(directory_path, filename)
-        logger.info(f"Processing {filename}...")
-        
-        try:
-            # Extract text and analyze images with LLaVA
-            start_time = time.time()
-            documents = extract_text_with_llava(file_path, verbose=verbose)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    journal = IngestJournal(resume=resume)
+    _caption_cache.update(journal.captions)
+    # Shared across the PDFs so boilerplate pages are captioned once per run
+    page_index = dedup.PageIndex() if DEDUP_ENABLED else None
+    
+    # Close the journal even if a step fails, so its last record is flushed and the file released
+    try:
+        for filename in pdf_files:
+            file_path = os.path.join(directory_path, filename)
+            logger.info(f"Processing {filename}...")
             
-            if documents:
-                all_documents.extend(documents)
-                processing_time = time.time() - start_time
-                logger.info(f"  Successfully extracted {len(documents)} document chunks in {processing_time:.2f} seconds")
-                processed_files += 1
-            else:
-                logger.warning(f"  No content extracted from {filename}")
-                failed_files += 1
+            try:
+                # Extract text and analyze images with LLaVA
+                start_time = time.time()
+                journal.start_file(filename, file_fingerprint(file_path))
+                documents = extract_text_with_llava(file_path, verbose=verbose, journal=journal,
+                                                    page_index=page_index)
                 
+                if documents:
+                    all_documents.extend(documents)
+                    processing_time = time.time() - start_time
+                    logger.info(f"  Successfully extracted {len(documents)} document chunks in {processing_time:.2f} seconds")
+                    processed_files += 1
+                else:
+                    logger.warning(f"  No content extracted from {filename}")
+                    failed_files += 1
+                    
+            except Exception as e:
+                logger.error(f"  Failed to process {filename}: {str(e)}")
+                failed_files += 1
+        
+        logger.info(f"Processing complete: {processed_files} files processed successfully, {failed_files} files failed")
+        
+        # Save the extracted documents
+        atomic_pickle(all_documents, os.path.join(PROCESSED_DIR, "extracted_docs.pkl"))
+        
+        # Collapse boilerplate pages repeated across manuals before they are chunked and embedded
+        if DEDUP_ENABLED:
+            all_documents = dedup.deduplicate_pages(all_documents)
+        
+        # Create chunks
+        chunk_start = time.time()
+        chunked_docs = chunk_documents(all_documents)
+        chunk_elapsed = time.time() - chunk_start
+        
+        metrics.inc_counter("ingest_chunks_total", len(chunked_docs), "Chunks created")
+        metrics.set_gauge("ingest_chunks_per_second", len(chunked_docs) / max(chunk_elapsed, 1e-9),
+                          "Chunking throughput of the last ingestion run")
+        try:
+            metrics.write_textfile()
         except Exception as e:
-            logger.error(f"  Failed to process {filename}: {str(e)}")
-            failed_files += 1
-    
-    logger.info(f"Processing complete: {processed_files} files processed successfully, {failed_files} files failed")
-    
-    # Save the extracted documents
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
-    
-    with open(os.path.join(PROCESSED_DIR, "extracted_docs.pkl"), "wb") as f:
-        pickle.dump(all_documents, f)
-    
-    # Create chunks
-    chunked_docs = chunk_documents(all_documents)
-    
-    with open(os.path.join(PROCESSED_DIR, "chunked_docs.pkl"), "wb") as f:
-        pickle.dump(chunked_docs, f)
-    
-    logger.info(f"Created {len(chunked_docs)} chunks from {len(all_documents)} documents")
+            logger.warning(f"Could not write ingestion metrics: {str(e)}")
+        
+        atomic_pickle(chunked_docs, os.path.join(PROCESSED_DIR, "chunked_docs.pkl"))
+        
+        logger.info(f"Created {len(chunked_docs)} chunks from {len(all_documents)} documents")
+        
+        journal.mark_complete()
+    finally:
+        journal.close()
     
     return chunked_docs
 
 if __name__ == "__main__":
+    setup_logging("document_processor.log")
+    
     chunked_docs = process_directory()
     logger.info(f"Processed {len(chunked_docs)} total chunks")
\ No newline at end of file
@@ -0,0 +1,308 @@
+# embedding_backends.py
+"""
+Pluggable embedding backends for ingestion and query encoding.
+
+Every backend is a Chroma-compatible embedding function (called with a list of
+texts, and implementing the name()/get_config()/embed_query() protocol of
+chromadb 0.6+) with an extra encode() method returning a float32 matrix:
+
+- "sentence-transformers": the original PyTorch SentenceTransformer model
+- "onnx":      the same model exported to ONNX and run with ONNX Runtime
+- "onnx-int8": the ONNX model with dynamically int8-quantized weights
+
+The ONNX backends need only onnxruntime and tokenizers at serving time (no torch).
+The model is exported once, on a machine with sentence-transformers installed.
+
+Usage:
+    python embedding_backends.py --export            # Export EMBEDDING_MODEL to ONNX (+ int8)
+    python embedding_backends.py --parity onnx-int8  # Compare a backend with sentence-transformers
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+from logging_setup import setup_logging
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_PARITY_MIN_COSINE, PROCESSED_DIR
+)
+
+logger = logging.getLogger("embedding_backends")
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+def _model_dir(model_name=EMBEDDING_MODEL, onnx_dir=EMBEDDING_ONNX_DIR):
+    return os.path.join(onnx_dir, model_name.replace("/", "__"))
+
+class _ChromaEmbeddingFunction:
+    """
+    Chroma's EmbeddingFunction protocol, implemented structurally (subclassing it
+    would import chromadb, which takes about a second, with this module).
+
+    All backends share one Chroma name: their vectors are interchangeable (see
+    check_parity), so switching EMBEDDING_BACKEND must not conflict with the name
+    stored in an existing collection.
+    """
+
+    @staticmethod
+    def name():
+        return "smc-manual-embeddings"
+
+    def get_config(self):
+        return {"backend": self.backend_name, "model_name": self.model_name}
+
+    @staticmethod
+    def build_from_config(config):
+        # Chroma rebuilds the function stored with a collection when it is opened;
+        # reuse the loaded model rather than loading a second copy
+        if config == {"backend": EMBEDDING_BACKEND, "model_name": EMBEDDING_MODEL}:
+            return get_backend()
+        return create_backend(config["backend"], config["model_name"])
+
+    def is_legacy(self):
+        return False
+
+    def default_space(self):
+        return "l2"
+
+    def supported_spaces(self):
+        return ["cosine", "l2", "ip"]
+
+    @staticmethod
+    def validate_config(config):
+        return
+
+    def validate_config_update(self, old_config, new_config):
+        return
+
+    def embed_query(self, input):
+        return self(input)
+
+    def __call__(self, input):
+        return [vector.tolist() for vector in self.encode(input)]
+
+class SentenceTransformerBackend(_ChromaEmbeddingFunction):
+    """Embeds with the PyTorch SentenceTransformer model."""
+
+    backend_name = "sentence-transformers"
+
+    def __init__(self, model_name=EMBEDDING_MODEL):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("sentence-transformers is required. Install with: pip install sentence-transformers")
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True),
+                          dtype=np.float32)
+
+class OnnxBackend(_ChromaEmbeddingFunction):
+    """Embeds with an exported ONNX model in ONNX Runtime (optionally int8-quantized)."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, quantized=False, onnx_dir=EMBEDDING_ONNX_DIR):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("onnxruntime and tokenizers are required. Install with: pip install onnxruntime tokenizers")
+
+        model_dir = _model_dir(model_name, onnx_dir)
+        model_file = os.path.join(model_dir, "model_int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"{model_file} not found. Export the model first: python embedding_backends.py --export"
+            )
+
+        with open(os.path.join(model_dir, "backend.json"), "r") as f:
+            settings = json.load(f)
+        self.pooling = settings["pooling"]
+        self.normalize = settings["normalize"]
+
+        self.backend_name = "onnx-int8" if quantized else "onnx"
+        self.model_name = model_name
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=settings["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=settings.get("pad_token_id", 0),
+                                      pad_token=settings.get("pad_token", "[PAD]"))
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feed)[0]
+        if self.pooling == "cls":
+            vectors = token_embeddings[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            vectors = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def encode(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Sort by length so each batch pads to a similar length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[i] = vector
+        return np.stack(vectors)
+
+def create_backend(name=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL):
+    """Instantiate an embedding backend by name (see BACKENDS)."""
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend(model_name)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, quantized=name == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend: {name} (choose from {', '.join(BACKENDS)})")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the shared embedding backend configured by EMBEDDING_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            start = time.time()
+            _backend = create_backend()
+            logger.info(f"Loaded {EMBEDDING_MODEL} with the {_backend.backend_name} backend "
+                        f"in {time.time() - start:.2f} seconds")
+        return _backend
+
+def export_onnx(model_name=EMBEDDING_MODEL, onnx_dir=EMBEDDING_ONNX_DIR, quantize=True):
+    """
+    Export a SentenceTransformer model to ONNX (requires sentence-transformers and torch).
+
+    Writes model.onnx, tokenizer.json and backend.json (pooling settings), plus
+    model_int8.onnx with dynamically quantized weights if quantize is set.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    model_dir = _model_dir(model_name, onnx_dir)
+    os.makedirs(model_dir, exist_ok=True)
+
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = next((m for m in model if isinstance(m, Pooling)), None)
+    settings = {
+        "model": model_name,
+        "pooling": "cls" if pooling is not None and pooling.get_pooling_mode_str() == "cls" else "mean",
+        "normalize": any(isinstance(m, Normalize) for m in model),
+        "max_seq_length": model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "pad_token": tokenizer.pad_token or "[PAD]"
+    }
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_file = os.path.join(model_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[name] for name in input_names), model_file,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, "tokenizer.json"))
+    with open(os.path.join(model_dir, "backend.json"), "w") as f:
+        json.dump(settings, f, indent=2)
+    logger.info(f"Exported {model_name} to {model_file} ({os.path.getsize(model_file) / 1e6:.1f} MB)")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_file = os.path.join(model_dir, "model_int8.onnx")
+        quantize_dynamic(model_file, quantized_file, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized model written to {quantized_file} "
+                    f"({os.path.getsize(quantized_file) / 1e6:.1f} MB)")
+
+def check_parity(texts, backend, reference, min_cosine=EMBEDDING_PARITY_MIN_COSINE):
+    """
+    Compare a backend's vectors with a reference backend's.
+
+    Vectors from the two backends must be nearly identical for an index built
+    with one to be searched with the other.
+
+    Returns:
+        Dict with the minimum and mean cosine similarity, encode timings and
+        whether the minimum reaches min_cosine
+    """
+    start = time.perf_counter()
+    expected = reference.encode(texts)
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = backend.encode(texts)
+    backend_seconds = time.perf_counter() - start
+
+    expected = expected / np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual = actual / np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    cosines = (expected * actual).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "reference_seconds": reference_seconds,
+        "backend_seconds": backend_seconds,
+        "ok": bool(cosines.min() >= min_cosine)
+    }
+
+def _sample_texts(limit):
+    """Sample chunk texts from the processed documents (or a few fixed sentences)."""
+    path = os.path.join(PROCESSED_DIR, "chunked_docs.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            documents = pickle.load(f)
+        step = max(len(documents) // limit, 1)
+        return [doc["content"] for doc in documents[::step][:limit]]
+    return ["How do I reset the device?", "Maximum operating pressure of the vacuum ejector",
+            "Replace the filter element when the pressure drop exceeds 0.1 MPa."]
+
+if __name__ == "__main__":
+    setup_logging("embedding_backends.log")
+
+    parser = argparse.ArgumentParser(description="Embedding backends")
+    parser.add_argument("--export", action="store_true", help="Export EMBEDDING_MODEL to ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 model when exporting")
+    parser.add_argument("--parity", choices=BACKENDS, help="Check a backend against sentence-transformers")
+    parser.add_argument("--samples", type=int, default=200, help="Number of chunks for --parity")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(quantize=not args.no_quantize)
+
+    if args.parity:
+        report = check_parity(_sample_texts(args.samples), create_backend(args.parity),
+                              create_backend("sentence-transformers"))
+        print(json.dumps(report, indent=2))
+        if not report["ok"]:
+            print(f"Parity check FAILED: minimum cosine {report['min_cosine']:.4f} < "
+                  f"{EMBEDDING_PARITY_MIN_COSINE}; rebuild the index if you switch to {args.parity}")
+            sys.exit(1)
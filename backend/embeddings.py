@@ -5,57 +5,76 @@ Generate embeddings and setup vector database for SMC Documentation Q&A system.
 import os
 import pickle
 import chromadb
-from chromadb.utils import embedding_functions
 import logging
 from tqdm import tqdm
 
+import partitions
+import quantized_index
+import embedding_backends
+from logging_setup import setup_logging
+from ingest_journal import EmbeddingJournal, atomic_pickle, chunks_fingerprint
+
 # Import configuration
 from config import (
     PROCESSED_DIR, CHROMA_DB_DIR, EMBEDDING_MODEL,
-    COLLECTION_NAME
+    COLLECTION_NAME, EMBEDDING_BATCH_SIZE
 )
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("embeddings.log"), logging.StreamHandler()]
-)
 logger = logging.getLogger("embeddings")
 
-def generate_embeddings(documents):
-    """Generate embeddings for text chunks using a local model."""
-    try:
-        from sentence_transformers import SentenceTransformer
-    except ImportError:
-        raise ImportError("sentence-transformers is required. Install with: pip install sentence-transformers")
+def generate_embeddings(documents, resume=False):
+    """
+    Generate embeddings for text chunks using the configured embedding backend.
     
-    # Using the model specified in config
-    model = SentenceTransformer(EMBEDDING_MODEL)
+    Each batch is journaled as it finishes; with resume=True the batches of an
+    interrupted run over the same chunks are reused.
+    """
+    backend = embedding_backends.get_backend()
+    journal = EmbeddingJournal(chunks_fingerprint(documents), resume=resume)
     
-    logger.info(f"Generating embeddings for {len(documents)} chunks using {EMBEDDING_MODEL}...")
+    logger.info(f"Generating embeddings for {len(documents)} chunks using {EMBEDDING_MODEL} "
+                f"({backend.backend_name} backend)...")
     
-    embeddings = []
-    for doc in tqdm(documents, desc="Generating embeddings"):
-        embedding = model.encode(doc["content"])
-        embeddings.append(embedding)
+    for start in tqdm(range(len(journal.embeddings), len(documents), EMBEDDING_BATCH_SIZE),
+                      desc="Generating embeddings"):
+        batch = [doc["content"] for doc in documents[start:start + EMBEDDING_BATCH_SIZE]]
+        journal.record_batch(backend.encode(batch, batch_size=EMBEDDING_BATCH_SIZE))
+    embeddings = journal.embeddings
     
     # Save embeddings
-    with open(os.path.join(PROCESSED_DIR, "embeddings.pkl"), "wb") as f:
-        pickle.dump(embeddings, f)
+    atomic_pickle(embeddings, os.path.join(PROCESSED_DIR, "embeddings.pkl"))
+    journal.close(remove=True)
     
     logger.info(f"Generated and saved {len(embeddings)} embeddings")
     return embeddings
 
+def _delete_stale_chunks(collection, ids, batch_size=5000):
+    """
+    Delete chunks that are not in ids (left over from an earlier ingestion).
+
+    Returns:
+        Number of chunks deleted
+    """
+    keep = set(ids)
+    stale = []
+    offset = 0
+    while True:
+        existing = collection.get(limit=batch_size, offset=offset, include=[])["ids"]
+        if not existing:
+            break
+        stale.extend(chunk_id for chunk_id in existing if chunk_id not in keep)
+        offset += len(existing)
+    for start in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[start:start + batch_size])
+    return len(stale)
+
 def setup_vector_db(documents, embeddings):
     """Set up a ChromaDB collection with documents and embeddings."""
     # Initialize ChromaDB (persistent client)
     client = chromadb.PersistentClient(CHROMA_DB_DIR)
     
-    # Create embedding function (this is just a placeholder as we're using our own embeddings)
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBEDDING_MODEL
-    )
+    # Embedding function for query_texts (documents are added with our precomputed embeddings)
+    embedding_function = embedding_backends.get_backend()
     
     # Create or get collection
     collection = client.get_or_create_collection(
@@ -63,13 +82,18 @@ def setup_vector_db(documents, embeddings):
         embedding_function=embedding_function
     )
     
+    # Tag every chunk with its product series so searches can be scoped
+    partitions.assign_series(documents)
+    
     # Prepare data for insertion
-    ids = [f"doc_{i}" for i in range(len(documents))]
+    # Deterministic chunk ids from the chunker keep ids stable across re-ingestion
+    ids = [doc["metadata"].get("chunk_id", f"doc_{i}") for i, doc in enumerate(documents)]
     contents = [doc["content"] for doc in documents]
     metadatas = [doc["metadata"] for doc in documents]
     
-    # Add documents to collection (using our precomputed embeddings)
-    collection.add(
+    # Add documents to collection (using our precomputed embeddings); upsert so a
+    # re-run after an interrupted insert doesn't fail on ids that were already added
+    collection.upsert(
         ids=ids,
         documents=contents,
         metadatas=metadatas,
@@ -77,9 +101,23 @@ def setup_vector_db(documents, embeddings):
     )
     
     logger.info(f"Added {len(documents)} documents to ChromaDB collection '{COLLECTION_NAME}'")
+    
+    # Chunks that no longer exist (or still have the old doc_<i> ids) would otherwise
+    # be returned as stale duplicates, and the quantized index and partition
+    # manifest below are built from the new chunks only
+    deleted = _delete_stale_chunks(collection, ids)
+    if deleted:
+        logger.info(f"Deleted {deleted} chunks left over from an earlier ingestion")
+    
+    # Build the compact quantized index alongside Chroma (used when VECTOR_STORE is int8/binary)
+    quantized_index.build_index(ids, embeddings, metadatas)
+    
+    manifest = partitions.build_manifest(metadatas)
+    partitions.save_manifest(manifest)
+    logger.info(f"Indexed {len(manifest['series'])} product series across {len(manifest['sources'])} sources")
     return collection
 
-def process_embeddings_and_db():
+def process_embeddings_and_db(resume=False):
     """Load documents, generate embeddings, and setup vector database."""
     # Check if chunked documents exist
     chunked_docs_path = os.path.join(PROCESSED_DIR, "chunked_docs.pkl")
@@ -100,7 +138,7 @@ def process_embeddings_and_db():
             embeddings = pickle.load(f)
     else:
         # Generate new embeddings
-        embeddings = generate_embeddings(chunked_docs)
+        embeddings = generate_embeddings(chunked_docs, resume=resume)
     
     # Setup ChromaDB
     logger.info(f"Setting up ChromaDB with {len(chunked_docs)} documents...")
@@ -121,4 +159,6 @@ def process_embeddings_and_db():
     return collection
 
 if __name__ == "__main__":
+    setup_logging("embeddings.log")
+    
     collection = process_embeddings_and_db()
\ No newline at end of file
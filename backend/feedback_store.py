@@ -0,0 +1,280 @@
+# feedback_store.py
+"""
+Append-only feedback store backed by SQLite.
+
+Submissions are queued and written by a background thread that commits them in
+batches (one fsync per batch instead of one file per submission), and aggregate
+queries replace scanning the old feedback/feedback_<timestamp>.json files, which
+are imported into the database the first time the store is opened (and then
+moved to feedback/imported/).
+"""
+import os
+import glob
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+import atexit
+
+from config import FEEDBACK_DB, FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL, FEEDBACK_RETRY_MAX_DELAY
+
+logger = logging.getLogger("feedback_store")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    query TEXT NOT NULL,
+    answer TEXT,
+    rating INTEGER,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS feedback_timestamp ON feedback (timestamp);
+CREATE INDEX IF NOT EXISTS feedback_query ON feedback (query);
+CREATE TABLE IF NOT EXISTS imported_files (
+    name TEXT PRIMARY KEY,
+    imported REAL NOT NULL
+);
+"""
+
+_INSERT = "INSERT INTO feedback (timestamp, query, answer, rating, comment) VALUES (?, ?, ?, ?, ?)"
+
+_PERIOD_FORMATS = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+class FeedbackStoreError(Exception):
+    """Feedback cannot be stored right now (the database cannot be opened)."""
+
+_init_lock = threading.Lock()
+_initialized = set()
+_writer = None
+
+def _connect(path=None):
+    """Open a connection, creating the schema and importing legacy files on first use."""
+    path = path or FEEDBACK_DB
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode each commit is one fsync of the log, so a batch costs one fsync
+    conn.execute("PRAGMA synchronous=FULL")
+    with _init_lock:
+        if path not in _initialized:
+            conn.executescript(_SCHEMA)
+            _migrate_json_files(conn, os.path.dirname(path) or ".")
+            _initialized.add(path)
+    return conn
+
+def _migrate_json_files(conn, directory):
+    """
+    Import legacy feedback_*.json files and move them to an imported/ subdirectory.
+
+    Each file is recorded in imported_files in the same transaction as its row,
+    and the transaction takes the write lock up front, so processes starting
+    together (several workers, or the app and warm_cache.py) import every file
+    exactly once.
+    """
+    files = sorted(glob.glob(os.path.join(directory, "feedback_*.json")))
+    if not files:
+        return
+
+    done, count = [], 0
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for path in files:
+            name = os.path.basename(path)
+            if conn.execute("SELECT 1 FROM imported_files WHERE name = ?", (name,)).fetchone():
+                # Imported by another process that hasn't moved it yet
+                done.append(path)
+                continue
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                row = _row(data, data.get("timestamp", os.path.getmtime(path)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not import {path}: {str(e)}")
+                continue
+            conn.execute(_INSERT, row)
+            conn.execute("INSERT INTO imported_files (name, imported) VALUES (?, ?)", (name, time.time()))
+            done.append(path)
+            count += 1
+
+    archive_dir = os.path.join(directory, "imported")
+    os.makedirs(archive_dir, exist_ok=True)
+    for path in done:
+        try:
+            os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+        except FileNotFoundError:
+            pass  # Moved by another process
+    if count:
+        logger.info(f"Imported {count} legacy feedback files from {directory} (originals moved to {archive_dir})")
+
+def _row(data, timestamp):
+    return (
+        float(timestamp),
+        data.get("query", ""),
+        data.get("answer", ""),
+        int(data.get("rating", 0) or 0),
+        data.get("comment", "")
+    )
+
+class _Writer:
+    """Background thread that drains the submission queue in batches."""
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.error = None  # Why the database cannot be opened, while it cannot
+        self.thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self.thread.start()
+
+    @property
+    def available(self):
+        return self.error is None and self.thread.is_alive()
+
+    def _open(self):
+        """Connect, retrying with backoff (queued submissions wait meanwhile)."""
+        delay = 1.0
+        while True:
+            try:
+                conn = _connect(self.path)
+            except Exception as e:
+                if self.error is None:
+                    logger.error(f"Could not open feedback database {self.path}: {str(e)}; retrying")
+                self.error = e
+                time.sleep(delay)
+                delay = min(delay * 2, FEEDBACK_RETRY_MAX_DELAY)
+                continue
+            if self.error is not None:
+                logger.info(f"Feedback database {self.path} is available again")
+                self.error = None
+            return conn
+
+    def _run(self):
+        try:
+            conn = self._open()
+            while True:
+                batch, waiters = [], []
+                item = self.queue.get()
+                deadline = time.time() + FEEDBACK_FLUSH_INTERVAL
+                while True:
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    batch.append(item)
+                    if len(batch) >= FEEDBACK_BATCH_SIZE:
+                        break
+                    try:
+                        item = self.queue.get(timeout=max(deadline - time.time(), 0))
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    try:
+                        with conn:
+                            conn.executemany(_INSERT, batch)
+                    except sqlite3.Error as e:
+                        logger.error(f"Error writing {len(batch)} feedback records: {str(e)}")
+                for waiter in waiters:
+                    waiter.set()
+        except Exception as e:
+            logger.error(f"Feedback writer stopped, {self.queue.qsize()} queued records lost: {str(e)}")
+
+def _get_writer():
+    global _writer
+    with _init_lock:
+        if _writer is None or not _writer.thread.is_alive():
+            _writer = _Writer(FEEDBACK_DB)
+        return _writer
+
+def submit(query, answer, rating, comment=""):
+    """
+    Queue a feedback record; it is persisted by the background writer.
+
+    Raises:
+        FeedbackStoreError: If the feedback database cannot be opened
+    """
+    writer = _get_writer()
+    if not writer.available:
+        raise FeedbackStoreError(f"Feedback database unavailable: {str(writer.error)}")
+    data = {"query": query, "answer": answer, "rating": rating, "comment": comment}
+    writer.queue.put(_row(data, time.time()))
+
+def flush(timeout=10):
+    """Block until all queued feedback has been written."""
+    if _writer is None:
+        return True
+    if not _writer.available:
+        return False
+    done = threading.Event()
+    _writer.queue.put(done)
+    return done.wait(timeout)
+
+atexit.register(flush)
+
+def all_queries(path=None):
+    """Return the query of every feedback record."""
+    path = path or FEEDBACK_DB
+    if not os.path.exists(path) and not glob.glob(os.path.join(os.path.dirname(path) or ".", "feedback_*.json")):
+        return []
+    conn = _connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT query FROM feedback")]
+    finally:
+        conn.close()
+
+def get_stats(days=30, limit=10, period="day", path=None):
+    """
+    Aggregate feedback from the last `days` days.
+
+    Records submitted within the last FEEDBACK_FLUSH_INTERVAL seconds may not
+    be included yet.
+
+    Returns:
+        Dict with overall totals, per-query ratings, the worst-rated answers and
+        counts per period ("hour", "day", "week" or "month")
+    """
+    if period not in _PERIOD_FORMATS:
+        raise ValueError(f"Unknown period: {period}")
+    since = time.time() - days * 86400
+
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        totals = conn.execute(
+            "SELECT COUNT(*) AS count, AVG(rating) AS average_rating FROM feedback WHERE timestamp >= ?",
+            (since,)
+        ).fetchone()
+
+        by_query = conn.execute(
+            """SELECT query, COUNT(*) AS count, AVG(rating) AS average_rating,
+                      MAX(timestamp) AS last_timestamp
+               FROM feedback WHERE timestamp >= ?
+               GROUP BY query ORDER BY count DESC, average_rating ASC LIMIT ?""",
+            (since, limit)
+        ).fetchall()
+
+        worst = conn.execute(
+            """SELECT timestamp, query, answer, rating, comment
+               FROM feedback WHERE timestamp >= ?
+               ORDER BY rating ASC, timestamp DESC LIMIT ?""",
+            (since, limit)
+        ).fetchall()
+
+        over_time = conn.execute(
+            """SELECT strftime(?, timestamp, 'unixepoch', 'localtime') AS period,
+                      COUNT(*) AS count, AVG(rating) AS average_rating
+               FROM feedback WHERE timestamp >= ?
+               GROUP BY period ORDER BY period""",
+            (_PERIOD_FORMATS[period], since)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        "days": days,
+        "total": totals["count"],
+        "average_rating": totals["average_rating"],
+        "by_query": [dict(row) for row in by_query],
+        "worst_rated": [dict(row) for row in worst],
+        "over_time": [dict(row) for row in over_time]
+    }
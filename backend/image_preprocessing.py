@@ -0,0 +1,97 @@
+# image_preprocessing.py
+"""
+Filtering and downscaling of extracted PDF images before they are sent to LLaVA.
+
+Manual pages contain many images that are not worth captioning (bullets, rules,
+logos, blank placeholders) and some that are far larger than the vision model's
+input resolution (full-page scans). prepare_image() drops the former and shrinks
+and re-encodes the latter, so less is uploaded and encoded per page.
+"""
+import io
+import logging
+
+import metrics
+from config import IMAGE_MIN_SIZE, IMAGE_MAX_SIZE, IMAGE_UNIFORM_RANGE, IMAGE_JPEG_QUALITY
+
+logger = logging.getLogger("image_preprocessing")
+
+def _is_uniform(image):
+    """
+    True if the image is (nearly) a single colour.
+
+    Uses the full-resolution brightness range rather than a thumbnail, since
+    downsampling averages away thin lines and small labels on large diagrams.
+    """
+    low, high = image.convert("L").getextrema()
+    return high - low <= IMAGE_UNIFORM_RANGE
+
+def _to_rgb(image):
+    """Convert palette, CMYK, greyscale and transparent images to RGB (transparency on white)."""
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+def _encode(image):
+    """Encode as JPEG, or as PNG when that is smaller (line drawings with few colours)."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    encoded = buffer.getvalue()
+
+    if image.getcolors(256) is not None:
+        buffer = io.BytesIO()
+        image.convert("P", palette=Image.Palette.ADAPTIVE, colors=256).save(buffer, format="PNG", optimize=True)
+        if len(buffer.getvalue()) < len(encoded):
+            encoded = buffer.getvalue()
+    return encoded
+
+def _skip(reason):
+    metrics.inc_counter("ingest_images_skipped_total", help_text="Images not sent to LLaVA", reason=reason)
+    return None, reason
+
+def prepare_image(image_bytes, width=None, height=None):
+    """
+    Decide whether an image is worth captioning and shrink it for LLaVA.
+
+    Args:
+        image_bytes: Encoded image as returned by PyMuPDF's extract_image
+        width, height: Pixel size if already known (skips decoding tiny images)
+
+    Returns:
+        Tuple (image bytes to send or None if the image should be skipped, reason)
+    """
+    if width and height and min(width, height) < IMAGE_MIN_SIZE:
+        return _skip("too_small")
+
+    try:
+        from PIL import Image
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except Exception as e:
+        # Let LLaVA try formats PIL can't decode (e.g. JBIG2 or JPX without codecs)
+        logger.debug(f"Could not decode image for preprocessing: {str(e)}")
+        return image_bytes, "undecodable"
+
+    if min(image.size) < IMAGE_MIN_SIZE:
+        return _skip("too_small")
+    if _is_uniform(image):
+        return _skip("uniform")
+
+    reason = "reencoded"
+    if max(image.size) > IMAGE_MAX_SIZE:
+        image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE), Image.LANCZOS)
+        reason = "downscaled"
+
+    encoded = _encode(_to_rgb(image))
+    if reason == "reencoded" and len(encoded) >= len(image_bytes):
+        encoded, reason = image_bytes, "unchanged"
+
+    metrics.inc_counter("ingest_image_bytes_in_total", len(image_bytes), "Image bytes extracted from PDFs")
+    metrics.inc_counter("ingest_image_bytes_out_total", len(encoded), "Image bytes sent to LLaVA")
+    return encoded, reason
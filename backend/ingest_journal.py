@@ -0,0 +1,172 @@
+# ingest_journal.py
+"""
+Write-ahead journals that make ingestion resumable after a crash.
+
+IngestJournal records every extracted page and every LLaVA caption as soon as it
+is finished, one fsync'ed JSON line each. EmbeddingJournal does the same for
+batches of chunk embeddings. A run started with resume=True replays the journal
+and only redoes the work that was not recorded. Because PDFs are processed in
+sorted order and journaled pages are reused verbatim, the final artifacts match
+those of an uninterrupted run.
+
+A torn last record (the process died mid-write) is detected and cut off.
+"""
+import os
+import json
+import pickle
+import hashlib
+import logging
+
+from config import INGEST_JOURNAL, EMBEDDINGS_JOURNAL
+
+logger = logging.getLogger("ingest_journal")
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+def atomic_pickle(obj, path):
+    """Pickle obj to path via a temporary file, so a crash never leaves a truncated artifact."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(obj, f)
+        _sync(f)
+    os.replace(temp_path, path)
+
+def file_fingerprint(path):
+    """Size and modification time of a file; a PDF with a new fingerprint is processed again."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+class IngestJournal:
+    """Journal of extracted pages and captions for document_processor.process_directory."""
+
+    def __init__(self, path=INGEST_JOURNAL, resume=False):
+        self.path = path
+        self.fingerprints = {}
+        self.pages = {}
+        self.captions = {}
+        self.complete = False
+
+        if resume and os.path.exists(path):
+            self._replay()
+            logger.info(f"Resuming from {path}: {sum(len(p) for p in self.pages.values())} pages "
+                        f"in {len(self.pages)} files and {len(self.captions)} captions already done")
+        else:
+            open(path, "w").close()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _replay(self):
+        good_offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Discarding torn journal record at byte {good_offset} of {self.path}")
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                good_offset += len(line)
+                self._apply(record)
+        with open(self.path, "r+b") as f:
+            f.truncate(good_offset)
+
+    def _apply(self, record):
+        kind = record["type"]
+        if kind == "file":
+            if self.fingerprints.get(record["source"]) != record["fingerprint"]:
+                # New file, or it changed since it was journaled: earlier pages are stale
+                self.pages[record["source"]] = {}
+            self.fingerprints[record["source"]] = record["fingerprint"]
+        elif kind == "page":
+            self.pages.setdefault(record["source"], {})[record["index"]] = record["document"]
+        elif kind == "caption":
+            self.captions[record["key"]] = record["caption"]
+        elif kind == "complete":
+            self.complete = True
+
+    def _append(self, record):
+        self._apply(record)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _sync(self._file)
+
+    def start_file(self, source, fingerprint):
+        """Register a PDF before processing; drops its journaled pages if the file changed."""
+        if self.fingerprints.get(source) != fingerprint:
+            self._append({"type": "file", "source": source, "fingerprint": fingerprint})
+
+    def page(self, source, index):
+        """The journaled document for a page, or None if it still has to be processed."""
+        return self.pages.get(source, {}).get(index)
+
+    def record_page(self, source, index, document):
+        self._append({"type": "page", "source": source, "index": index, "document": document})
+
+    def record_caption(self, key, caption):
+        self._append({"type": "caption", "key": key, "caption": caption})
+
+    def mark_complete(self):
+        """Record that all artifacts of the run were written."""
+        self._append({"type": "complete"})
+
+    def close(self):
+        self._file.close()
+
+def chunks_fingerprint(documents):
+    """Identify a chunk list, so embeddings are only resumed for the same chunks."""
+    digest = hashlib.sha1()
+    for doc in documents:
+        digest.update(doc["content"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class EmbeddingJournal:
+    """Journal of embedded chunk batches for embeddings.generate_embeddings."""
+
+    def __init__(self, fingerprint, path=EMBEDDINGS_JOURNAL, resume=False):
+        self.path = path
+        self.embeddings = []
+
+        if resume and os.path.exists(path):
+            self._replay(fingerprint)
+        if not self.embeddings:
+            with open(path, "wb") as f:
+                pickle.dump({"fingerprint": fingerprint}, f)
+                _sync(f)
+        self._file = open(path, "ab")
+
+    def _replay(self, fingerprint):
+        good_offset = 0
+        with open(self.path, "rb") as f:
+            try:
+                header = pickle.load(f)
+                good_offset = f.tell()
+            except Exception:
+                return
+            if header.get("fingerprint") != fingerprint:
+                logger.info("Chunks changed since the embedding journal was written; starting over")
+                return
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    logger.warning(f"Discarding torn journal record at byte {good_offset} of {self.path}")
+                    break
+                self.embeddings.extend(batch)
+                good_offset = f.tell()
+        with open(self.path, "r+b") as f:
+            f.truncate(good_offset)
+        logger.info(f"Resuming embeddings from {self.path}: {len(self.embeddings)} chunks already embedded")
+
+    def record_batch(self, embeddings):
+        pickle.dump(list(embeddings), self._file)
+        _sync(self._file)
+        self.embeddings.extend(embeddings)
+
+    def close(self, remove=False):
+        self._file.close()
+        if remove:
+            os.remove(self.path)
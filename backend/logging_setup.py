@@ -0,0 +1,137 @@
+# logging_setup.py
+"""
+Central, non-blocking logging configuration.
+
+Log records are put on an in-memory queue by the calling thread and written by a
+background QueueListener, so file and console I/O stay off the request path.
+Files are rotated and contain one JSON object per line, tagged with the id of the
+request that produced them. Selected high-volume loggers can be sampled.
+
+Entry points call setup_logging() once; other modules only use logging.getLogger().
+"""
+import os
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import datetime
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import LOG_DIR, LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_RATES
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Id of the request being handled by the current thread/context ("-" outside requests)
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+def new_request_id(request_id=None):
+    """Set the request id for the current context (a random one if not given) and return it."""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    return request_id
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id (runs on the calling thread)."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO and DEBUG records from selected loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class _PreparedQueueHandler(QueueHandler):
+    """QueueHandler that keeps extra fields and request ids intact for the JSON formatter."""
+
+    def prepare(self, record):
+        # Merge args into the message on the caller's thread, but don't pre-format
+        # with the queue handler's formatter (that would flatten the JSON fields)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging(log_file, level=LOG_LEVEL):
+    """
+    Route all logging through a background queue listener.
+
+    Args:
+        log_file: File name inside LOG_DIR (e.g. "app.log"); rotated at LOG_MAX_BYTES
+        level: Root log level name
+
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    file_handler = RotatingFileHandler(
+        os.path.join(LOG_DIR, log_file), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _PreparedQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    if LOG_SAMPLE_RATES:
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level) if isinstance(level, str) else level)
+
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
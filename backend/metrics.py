@@ -0,0 +1,154 @@
+# metrics.py
+"""
+Lightweight in-process metrics registry exposed in Prometheus text format.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from config import METRICS_LATENCY_BUCKETS, LOG_DIR
+
+# Ingestion runs in a separate process (process_docs.py), so its metrics are
+# written to a textfile that the server appends to its /metrics output.
+INGESTION_METRICS_FILE = os.path.join(LOG_DIR, "ingestion.prom")
+
+_lock = threading.Lock()
+_metrics = {}
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def _get_metric(name, kind, help_text, buckets=None):
+    """Return the metric entry for name, creating it if needed."""
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = {
+            "kind": kind,
+            "help": help_text,
+            "buckets": tuple(buckets or METRICS_LATENCY_BUCKETS),
+            "series": {}
+        }
+        _metrics[name] = metric
+    return metric
+
+def inc_counter(name, value=1, help_text="", **labels):
+    """Increment a counter."""
+    with _lock:
+        series = _get_metric(name, "counter", help_text)["series"]
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+def set_gauge(name, value, help_text="", **labels):
+    """Set a gauge to an absolute value."""
+    with _lock:
+        _get_metric(name, "gauge", help_text)["series"][_label_key(labels)] = value
+
+def add_gauge(name, delta, help_text="", **labels):
+    """Add delta (which may be negative) to a gauge."""
+    with _lock:
+        series = _get_metric(name, "gauge", help_text)["series"]
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + delta
+
+def get_gauge(name, **labels):
+    """Read the current value of a gauge (0 if never set)."""
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            return 0
+        return metric["series"].get(_label_key(labels), 0)
+
+def observe(name, value, help_text="", buckets=None, **labels):
+    """Record an observation in a histogram."""
+    with _lock:
+        metric = _get_metric(name, "histogram", help_text, buckets)
+        key = _label_key(labels)
+        state = metric["series"].get(key)
+        if state is None:
+            state = {"counts": [0] * len(metric["buckets"]), "sum": 0.0, "count": 0}
+            metric["series"][key] = state
+        for i, bound in enumerate(metric["buckets"]):
+            if value <= bound:
+                state["counts"][i] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+@contextmanager
+def timed(name, help_text="", timings=None, timing_key=None, **labels):
+    """
+    Context manager that observes the elapsed time of its body in seconds.
+    
+    If a timings dict is given, the elapsed time is also stored under timing_key
+    so callers can build a per-request stage breakdown.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if name:
+            observe(name, elapsed, help_text, **labels)
+        if timings is not None and timing_key:
+            timings[timing_key] = timings.get(timing_key, 0.0) + elapsed
+
+def record_ollama_stats(result, model, stage="chat"):
+    """Derive token throughput from the timing fields Ollama returns."""
+    eval_count = result.get("eval_count")
+    eval_duration = result.get("eval_duration")  # nanoseconds
+    if eval_count and eval_duration:
+        inc_counter("ollama_eval_tokens_total", eval_count,
+                    "Tokens generated by Ollama", model=model, stage=stage)
+        set_gauge("ollama_eval_tokens_per_second", eval_count / (eval_duration / 1e9),
+                  "Generation throughput of the last Ollama call", model=model, stage=stage)
+
+    prompt_count = result.get("prompt_eval_count")
+    prompt_duration = result.get("prompt_eval_duration")
+    if prompt_count and prompt_duration:
+        inc_counter("ollama_prompt_tokens_total", prompt_count,
+                    "Prompt tokens evaluated by Ollama", model=model, stage=stage)
+        set_gauge("ollama_prompt_tokens_per_second", prompt_count / (prompt_duration / 1e9),
+                  "Prompt evaluation throughput of the last Ollama call", model=model, stage=stage)
+
+def render():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name in sorted(_metrics):
+            metric = _metrics[name]
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+
+            for key, value in sorted(metric["series"].items()):
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+
+                for bound, count in zip(metric["buckets"], value["counts"]):
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', bound))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+
+    return "\n".join(lines) + "\n"
+
+def write_textfile(path=INGESTION_METRICS_FILE):
+    """Atomically write the current metrics to a textfile (for batch jobs)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+def reset():
+    """Drop all recorded metrics."""
+    with _lock:
+        _metrics.clear()
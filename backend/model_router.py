@@ -0,0 +1,104 @@
+# model_router.py
+"""
+Load-aware routing of questions between a small, fast chat model and phi4.
+
+Rules are evaluated in order and the first one that matches decides the model:
+
+1. load     - too many /ask requests in flight: use the fast model to keep latency bounded
+2. complex  - troubleshooting, comparisons or long multi-part questions: use phi4
+3. context  - a lot of retrieved context to reason over: use phi4
+4. simple   - everything else (short lookups): use the fast model
+
+If no Ollama backend has the fast model (it has to be pulled separately),
+questions go to phi4 instead.
+"""
+import re
+import logging
+
+import metrics
+import ollama_pool
+from context_packer import count_tokens
+from config import (
+    OLLAMA_MODEL, LLM_MAX_TOKENS, LLM_CONTEXT_TOKENS, MODEL_ROUTING_ENABLED, FAST_MODEL,
+    FAST_MODEL_MAX_TOKENS, ROUTING_QUEUE_DEPTH, ROUTING_COMPLEX_MIN_WORDS,
+    ROUTING_COMPLEX_KEYWORDS, ROUTING_CONTEXT_TOKENS
+)
+
+logger = logging.getLogger("model_router")
+
+_KEYWORD_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(k) for k in ROUTING_COMPLEX_KEYWORDS) + r")\b", re.IGNORECASE
+)
+
+def is_complex(query):
+    """Heuristic for questions that need the larger model's reasoning."""
+    if len(query.split()) >= ROUTING_COMPLEX_MIN_WORDS:
+        return True
+    if query.count("?") > 1:
+        return True
+    return bool(_KEYWORD_PATTERN.search(query))
+
+def context_tokens(context):
+    """Approximate size of the retrieved context, capped at what will be sent to the model."""
+    return min(sum(count_tokens(c["content"]) for c in context), LLM_CONTEXT_TOKENS)
+
+def default_route(reason="default"):
+    """Routing decision for OLLAMA_MODEL."""
+    return {"model": OLLAMA_MODEL, "num_predict": LLM_MAX_TOKENS, "reason": reason}
+
+def check_fast_model():
+    """Warn at startup if routing is enabled but no backend has FAST_MODEL."""
+    if MODEL_ROUTING_ENABLED and FAST_MODEL and not ollama_pool.get_pool().has_model(FAST_MODEL):
+        logger.warning(f"Fast model {FAST_MODEL} is not available on any Ollama backend, "
+                       f"using {OLLAMA_MODEL} for all questions (install it with: ollama pull {FAST_MODEL})")
+
+def route(query, context, queue_depth=None):
+    """
+    Choose the chat model for a question.
+
+    Args:
+        query: The user's question
+        context: Retrieved context entries
+        queue_depth: Requests currently in flight (read from the metrics gauge if None)
+
+    Returns:
+        Dict with "model", "num_predict" and the "reason" (rule) that chose it
+    """
+    default = default_route()
+    if not MODEL_ROUTING_ENABLED or not FAST_MODEL:
+        return default
+
+    fast = {"model": FAST_MODEL, "num_predict": FAST_MODEL_MAX_TOKENS}
+    if queue_depth is None:
+        queue_depth = metrics.get_gauge("qa_requests_in_flight")
+
+    if ROUTING_QUEUE_DEPTH and queue_depth >= ROUTING_QUEUE_DEPTH:
+        decision = dict(fast, reason="load")
+    elif is_complex(query):
+        decision = dict(default, reason="complex")
+    elif context_tokens(context) >= ROUTING_CONTEXT_TOKENS:
+        decision = dict(default, reason="context")
+    else:
+        decision = dict(fast, reason="simple")
+    
+    if decision["model"] == FAST_MODEL and not ollama_pool.get_pool().has_model(FAST_MODEL):
+        # Not pulled on any backend; answering with phi4 beats failing with a 404
+        decision = dict(default, reason="fast_model_missing")
+
+    metrics.inc_counter("qa_model_routes_total", help_text="Chat model routing decisions",
+                        model=decision["model"], reason=decision["reason"])
+    logger.info(f"Routed query to {decision['model']} ({decision['reason']}, queue depth {queue_depth})")
+    return decision
+
+def possible_routes(query, context):
+    """
+    Distinct routing decisions for a question at any load: idle, and at
+    ROUTING_QUEUE_DEPTH, where every question goes to the fast model. Used to warm
+    the response cache under every model /ask may pick for the question.
+    """
+    decisions = [route(query, context, queue_depth=0)]
+    if ROUTING_QUEUE_DEPTH:
+        loaded = route(query, context, queue_depth=ROUTING_QUEUE_DEPTH)
+        if loaded["model"] != decisions[0]["model"]:
+            decisions.append(loaded)
+    return decisions
@@ -0,0 +1,307 @@
+# ollama_pool.py
+"""
+Pool of Ollama backends for chat generation and LLaVA captioning.
+
+Backends come from OLLAMA_BACKENDS. Each one has a weight (relative capacity)
+and optionally a list of models it serves. A background thread checks every
+backend's /api/tags. That tells whether the backend is up and which models it
+has. A request goes to the backend with the fewest outstanding requests
+relative to its weight, among the healthy ones that serve the model. If a
+backend refuses the connection, is overloaded (429/503) or fails (5xx), it is
+ejected for OLLAMA_EJECT_SECONDS and the request is retried on another one.
+
+If no backend is healthy, requests are still sent to the least loaded one
+(rather than failing outright), so a single-backend setup behaves as before.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import requests
+
+import metrics
+from config import (
+    OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_HEALTH_TIMEOUT, OLLAMA_MAX_OUTSTANDING,
+    OLLAMA_EJECT_SECONDS, OLLAMA_MAX_ATTEMPTS
+)
+
+logger = logging.getLogger("ollama_pool")
+
+class NoBackendAvailable(Exception):
+    """No Ollama backend could be tried for a request."""
+
+def _model_names(name):
+    """Names a model can be listed under in /api/tags ("phi4" is also "phi4:latest")."""
+    if name.endswith(":latest"):
+        name = name[:-len(":latest")]
+    return {name, f"{name}:latest"} if ":" not in name else {name}
+
+def _all_names(models):
+    return set().union(*(_model_names(m) for m in models))
+
+class Backend:
+    """One Ollama server and its load and health state. Mutated under the pool's lock."""
+
+    def __init__(self, url, weight=1, models=None):
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 0.001)
+        self.models = _all_names(models) if models else None  # Configured restriction
+        self.available_models = None  # Reported by /api/tags (None until checked)
+        self.outstanding = 0
+        self.healthy = True
+        self.checked = False  # Whether a health check has completed yet
+        self.ejected_until = 0.0
+        self.last_selected = 0
+
+    def serves(self, model):
+        if not model:
+            return True
+        names = _model_names(model)
+        if self.models is not None and not names & self.models:
+            return False
+        return self.available_models is None or bool(names & self.available_models)
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+    def overloaded(self):
+        return bool(OLLAMA_MAX_OUTSTANDING) and self.outstanding >= OLLAMA_MAX_OUTSTANDING * self.weight
+
+    def describe(self, now):
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "checked": self.checked,
+            "ejected": self.ejected_until > now,
+            "outstanding": self.outstanding,
+            "models": sorted(m for m in (self.available_models or self.models or []) if not m.endswith(":latest"))
+        }
+
+def _retry_reason(status_code):
+    """Why a response should be retried on another backend, or None if it should be returned."""
+    if status_code == 404:
+        return "model_missing"
+    if status_code in (429, 503):
+        return "overloaded"
+    if status_code >= 500:
+        return "error"
+    return None
+
+class OllamaPool:
+    """Least-outstanding-requests balancing over several Ollama backends."""
+
+    def __init__(self, backends=OLLAMA_BACKENDS, health_interval=OLLAMA_HEALTH_INTERVAL):
+        if not backends:
+            raise ValueError("At least one Ollama backend is required")
+        self.backends = [Backend(b["url"], b.get("weight", 1), b.get("models")) for b in backends]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._selections = 0
+        self._health_thread = None
+
+    def _start_health_checks(self):
+        with self._lock:
+            if self._health_thread is not None or not self.health_interval:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    def check_health(self):
+        """Query /api/tags on every backend and update its health and model list."""
+        for backend in self.backends:
+            try:
+                response = requests.get(f"{backend.url}/api/tags", timeout=OLLAMA_HEALTH_TIMEOUT)
+                response.raise_for_status()
+                models = _all_names(m["name"] for m in response.json().get("models", []))
+                healthy = True
+            except Exception as e:
+                logger.debug(f"Health check of {backend.url} failed: {str(e)}")
+                models, healthy = None, False
+
+            with self._lock:
+                if healthy != backend.healthy:
+                    logger.warning(f"Ollama backend {backend.url} is {'up' if healthy else 'down'}")
+                backend.healthy = healthy
+                backend.checked = True
+                if models is not None:
+                    backend.available_models = models
+            metrics.set_gauge("ollama_backend_healthy", int(healthy), "Whether an Ollama backend passes health checks",
+                              backend=backend.url)
+
+    def acquire(self, model=None, exclude=()):
+        """
+        Pick the backend for a request and count it as outstanding there.
+
+        Returns:
+            The Backend (release it with release()), or None if every backend is excluded
+        """
+        self._start_health_checks()
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            # Prefer backends that serve the model, are up and have spare capacity,
+            # but fall back to the rest rather than failing the request
+            candidates = [b for b in candidates if b.serves(model)] or candidates
+            candidates = [b for b in candidates if b.available(now)] or candidates
+            candidates = [b for b in candidates if not b.overloaded()] or candidates
+            backend = min(candidates, key=lambda b: ((b.outstanding + 1) / b.weight, b.last_selected))
+            self._selections += 1
+            backend.last_selected = self._selections
+            backend.outstanding += 1
+            outstanding = backend.outstanding
+        metrics.set_gauge("ollama_backend_outstanding", outstanding, "Requests in flight per Ollama backend",
+                          backend=backend.url)
+        return backend
+
+    def has_model(self, model):
+        """False if no backend has the model (as far as the health checks know)."""
+        with self._lock:
+            return any(backend.serves(model) for backend in self.backends)
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+            outstanding = backend.outstanding
+        metrics.set_gauge("ollama_backend_outstanding", outstanding, "Requests in flight per Ollama backend",
+                          backend=backend.url)
+
+    def eject(self, backend, reason, seconds=OLLAMA_EJECT_SECONDS):
+        """Skip a backend for new requests for a while."""
+        with self._lock:
+            backend.ejected_until = time.monotonic() + seconds
+        logger.warning(f"Ejected Ollama backend {backend.url} for {seconds}s ({reason})")
+        metrics.inc_counter("ollama_backend_ejections_total", help_text="Ollama backends taken out of rotation",
+                            backend=backend.url, reason=reason)
+
+    def _forget_model(self, backend, model):
+        with self._lock:
+            if backend.available_models is not None:
+                backend.available_models -= _model_names(model)
+
+    def _discard(self, failed):
+        response, backend = failed
+        response.close()
+        self.release(backend)
+
+    def _send(self, path, body, timeout, stream, deadline):
+        model = body.get("model")
+        tried = []
+        failed = None  # (response, backend) of the last attempt that was refused
+        error = None
+        try:
+            for _ in range(max(OLLAMA_MAX_ATTEMPTS, 1)):
+                if deadline is not None:
+                    deadline.check("ollama_request")
+                backend = self.acquire(model, exclude=tried)
+                if backend is None:
+                    break
+                if failed is not None:
+                    self._discard(failed)
+                    failed = None
+                tried.append(backend)
+
+                try:
+                    response = requests.post(f"{backend.url}{path}", json=body, stream=stream,
+                                             timeout=deadline.timeout(timeout) if deadline is not None else timeout)
+                except requests.ConnectionError as e:
+                    # Also covers connect timeouts; read timeouts are not retried, since the
+                    # backend may have done most of the work already
+                    self.release(backend)
+                    self.eject(backend, "connection_error")
+                    self._count(backend, "connection_error")
+                    error = e
+                    continue
+                except Exception:
+                    self.release(backend)
+                    self._count(backend, "error")
+                    raise
+
+                reason = _retry_reason(response.status_code)
+                if reason is None:
+                    self._count(backend, "ok")
+                    return response, backend
+                self._count(backend, reason)
+                if reason == "model_missing":
+                    self._forget_model(backend, model)
+                else:
+                    self.eject(backend, reason)
+                failed = (response, backend)
+        except BaseException:
+            # E.g. the deadline ran out before the retry: the refused response is not
+            # returned, so close it and stop counting it as outstanding
+            if failed is not None:
+                self._discard(failed)
+            raise
+
+        if failed is not None:
+            return failed
+        if error is not None:
+            raise error
+        raise NoBackendAvailable("No Ollama backend available")
+
+    def _count(self, backend, outcome):
+        metrics.inc_counter("ollama_backend_requests_total", help_text="Requests sent to each Ollama backend",
+                            backend=backend.url, outcome=outcome)
+
+    @contextmanager
+    def post(self, path, body, timeout, stream=False, deadline=None):
+        """
+        POST to the least loaded backend, retrying on others if it fails or is overloaded.
+
+        Args:
+            path: API path, e.g. "/api/generate"
+            body: JSON body; its "model" decides which backends are eligible
+            timeout: Request timeout in seconds (bounded by the deadline, if given)
+            stream: Stream the response
+            deadline: Optional deadline.Deadline, checked before every attempt
+
+        Yields:
+            The requests.Response of the first backend that accepted the request (or
+            of the last attempt, if all failed). The backend counts as busy until
+            the with block exits.
+        """
+        response, backend = self._send(path, body, timeout, stream, deadline)
+        try:
+            yield response
+        finally:
+            response.close()
+            self.release(backend)
+
+    def status(self):
+        """
+        Health and load of every backend, for /status.
+
+        Reports the state of the last background health check (and starts the
+        checks if needed) rather than querying the backends.
+        """
+        self._start_health_checks()
+        now = time.monotonic()
+        with self._lock:
+            return [backend.describe(now) for backend in self.backends]
+
+# Shared pool, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaPool()
+        return _pool
+
+def set_pool(pool):
+    """Replace the shared pool (e.g. with stand-in servers); returns the previous one."""
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, pool
+        return previous
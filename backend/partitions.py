@@ -0,0 +1,216 @@
+# partitions.py
+"""
+Partitioning of the vector index by source document and SMC product series.
+
+Every chunk carries a "source" and a "series" metadata field. Searches can be
+scoped to one or more partitions (a series such as "ZHV" or a source file such
+as "ZHV-A_EU.pdf"), and unscoped questions that mention a known model code are
+routed to the matching series automatically.
+
+A page collapsed by dedup.py into a canonical copy from another document is
+still part of its own partitions: the canonical chunks get a boolean
+"also_source:<name>" / "also_series:<series>" field per copy (metadata must be
+scalar), and build_where matches those as well.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from collections import Counter
+
+import dedup
+from config import PROCESSED_DIR
+
+logger = logging.getLogger("partitions")
+
+PARTITIONS_FILE = os.path.join(PROCESSED_DIR, "partitions.json")
+UNKNOWN_SERIES = "GENERAL"
+ALSO_SOURCE_PREFIX = "also_source:"
+ALSO_SERIES_PREFIX = "also_series:"
+
+# SMC model codes start with a 2-4 letter series prefix followed by digits or a
+# hyphenated suffix, e.g. SY3120-5LZD, VQ1000, ITV2050, ZHV-A
+_MODEL_CODE_PATTERN = re.compile(r"\b([A-Z]{2,4})(?:\d[\w-]*|-[A-Z0-9][\w-]*)")
+
+# Uppercase prefixes that look like model codes but are not product series
+_NOT_SERIES = {
+    "SMC", "PDF", "EU", "ISO", "JIS", "DIN", "NPT", "DC", "AC", "IP", "EN", "IEC",
+    "NO", "NC", "LED", "USB", "CE", "UL", "CSA", "RS", "PT", "MPA", "KPA", "NOTE", "FIG"
+}
+
+_lock = threading.Lock()
+_manifest = None
+_manifest_version = None  # mtime of PARTITIONS_FILE when _manifest was read
+
+def find_series(text):
+    """Return the product series prefixes of all model codes found in text, in order."""
+    series = []
+    for match in _MODEL_CODE_PATTERN.finditer(text):
+        prefix = match.group(1)
+        if prefix not in _NOT_SERIES and prefix not in series:
+            series.append(prefix)
+    return series
+
+def assign_series(documents):
+    """
+    Add a "series" metadata field to each chunk (in place).
+
+    The series of a source document comes from its filename if that contains a
+    model code, otherwise from the model code mentioned most often in its text.
+    Chunks that stand in for duplicate pages are also flagged with the copies'
+    sources and series.
+    """
+    texts_by_source = {}
+    for doc in documents:
+        texts_by_source.setdefault(doc["metadata"]["source"], []).append(doc["content"])
+        # Sources whose pages were all collapsed still need a series
+        for reference in dedup.parse_references(doc["metadata"]):
+            texts_by_source.setdefault(reference["source"], [])
+
+    series_by_source = {}
+    for source, texts in texts_by_source.items():
+        from_name = find_series(os.path.splitext(source)[0].upper())
+        if from_name:
+            series_by_source[source] = from_name[0]
+            continue
+        counts = Counter(s for text in texts for s in find_series(text))
+        series_by_source[source] = counts.most_common(1)[0][0] if counts else UNKNOWN_SERIES
+
+    for doc in documents:
+        metadata = doc["metadata"]
+        metadata["series"] = series_by_source[metadata["source"]]
+        for reference in dedup.parse_references(metadata):
+            if reference["source"] != metadata["source"]:
+                metadata[ALSO_SOURCE_PREFIX + reference["source"]] = True
+            if series_by_source[reference["source"]] != metadata["series"]:
+                metadata[ALSO_SERIES_PREFIX + series_by_source[reference["source"]]] = True
+    return documents
+
+def build_manifest(metadatas):
+    """Summarize partitions (chunk counts per series and per source) from chunk metadata."""
+    series_counts = Counter()
+    source_counts = Counter()
+    source_series = {}
+    for metadata in metadatas:
+        series = metadata.get("series", UNKNOWN_SERIES)
+        series_counts[series] += 1
+        source_counts[metadata["source"]] += 1
+        source_series[metadata["source"]] = series
+    return {
+        "total": sum(source_counts.values()),
+        "series": dict(series_counts),
+        "sources": {s: {"chunks": n, "series": source_series[s]} for s, n in source_counts.items()}
+    }
+
+def _manifest_mtime(path=PARTITIONS_FILE):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def save_manifest(manifest, path=PARTITIONS_FILE):
+    """Persist the partition manifest next to the processed documents."""
+    global _manifest, _manifest_version
+    # Write atomically, since running servers may reload the file at any time
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+    with _lock:
+        _manifest = manifest
+        _manifest_version = _manifest_mtime(path)
+
+def get_manifest(collection=None):
+    """
+    Return the partition manifest.
+
+    It is read from PARTITIONS_FILE, and read again whenever the file changes
+    (process_docs.py rewrites it while the server keeps running). If the index
+    was created before partitioning existed, it is built once from the
+    collection's metadata.
+    """
+    global _manifest, _manifest_version
+    version = _manifest_mtime(PARTITIONS_FILE)
+    with _lock:
+        if _manifest is not None and (version is None or version == _manifest_version):
+            return _manifest
+        previous, previous_version = _manifest, _manifest_version
+
+    manifest = None
+    if version is not None:
+        try:
+            with open(PARTITIONS_FILE, "r") as f:
+                manifest = json.load(f)
+            if previous is not None:
+                logger.info("Partition manifest changed, reloaded it")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read partition manifest: {str(e)}")
+            # Keep the old manifest and try again on the next call
+            manifest, version = previous, previous_version
+
+    if manifest is None and collection is not None:
+        logger.info("No partition manifest found, scanning collection metadata...")
+        manifest = build_manifest(collection.get(include=["metadatas"])["metadatas"])
+
+    with _lock:
+        _manifest = manifest
+        _manifest_version = version
+    return manifest or {"total": 0, "series": {}, "sources": {}}
+
+def reset_manifest():
+    """Forget the cached manifest (e.g. after a re-index)."""
+    global _manifest, _manifest_version
+    with _lock:
+        _manifest = None
+        _manifest_version = None
+
+def resolve_partitions(names, manifest):
+    """
+    Split requested partition names into known series and sources.
+
+    Returns:
+        Tuple of (series, sources, unknown) lists
+    """
+    known_series = {s.upper(): s for s in manifest.get("series", {})}
+    known_sources = {s.lower(): s for s in manifest.get("sources", {})}
+
+    series, sources, unknown = [], [], []
+    for name in names:
+        if name.lower() in known_sources:
+            sources.append(known_sources[name.lower()])
+        elif name.upper() in known_series:
+            series.append(known_series[name.upper()])
+        else:
+            unknown.append(name)
+    return series, sources, unknown
+
+def route_query(query, manifest):
+    """Return the known series whose model codes appear in the query."""
+    known_series = {s.upper(): s for s in manifest.get("series", {}) if s != UNKNOWN_SERIES}
+    return [known_series[s] for s in find_series(query.upper()) if s in known_series]
+
+def copy_flags(metadata):
+    """Return the "also_source:"/"also_series:" flags of a chunk."""
+    return sorted(key for key in metadata if key.startswith((ALSO_SOURCE_PREFIX, ALSO_SERIES_PREFIX)))
+
+def partition_flags(series=None, sources=None):
+    """Return the flags marking a chunk as a copy from one of the given partitions."""
+    return ([ALSO_SERIES_PREFIX + s for s in series or []] +
+            [ALSO_SOURCE_PREFIX + s for s in sources or []])
+
+def build_where(series=None, sources=None):
+    """
+    Build a Chroma metadata filter for the given partitions (None if unscoped).
+
+    Matches chunks of the partitions and canonical chunks flagged as copies from them.
+    """
+    clauses = []
+    if series:
+        clauses.append({"series": {"$in": list(series)}})
+    if sources:
+        clauses.append({"source": {"$in": list(sources)}})
+    clauses.extend({flag: True} for flag in partition_flags(series, sources))
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
@@ -0,0 +1,94 @@
+# prefetch.py
+"""
+Short-lived, per-client cache of speculatively retrieved context.
+
+While the user is typing, the frontend posts the (debounced) partial question
+to /prefetch, which runs query embedding and vector search and stores the
+result here. When the submitted question matches a prefetched one (after
+normalizing case, whitespace and trailing punctuation), /ask reuses its context and goes straight to the response cache and
+generation, so retrieval is no longer part of the perceived latency.
+
+Near matches are not reused: questions that differ in one model code ("VQ1000"
+vs "VQ2000") or one word ("open" vs "closed") need different excerpts, and the
+answer would be cached under the wrong question.
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import metrics
+from config import PREFETCH_TTL, PREFETCH_MAX_CLIENTS, PREFETCH_MAX_PER_CLIENT
+
+_lock = threading.Lock()
+_clients = OrderedDict()
+
+_SPACE_PATTERN = re.compile(r"\s+")
+
+def normalize(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return _SPACE_PATTERN.sub(" ", query.lower()).strip().rstrip("?!. ")
+
+def _evict_expired(now):
+    """Drop clients whose newest entry expired (oldest first) and enforce the size bound."""
+    while _clients:
+        oldest_id, entries = next(iter(_clients.items()))
+        if now - entries[-1]["created"] > PREFETCH_TTL or len(_clients) > PREFETCH_MAX_CLIENTS:
+            del _clients[oldest_id]
+        else:
+            break
+
+def store(client_id, query, context, partition_names=None, partitions_searched=None):
+    """Remember the context retrieved for a client's partial question."""
+    now = time.time()
+    entry = {
+        "query": normalize(query),
+        "partition_names": tuple(partition_names) if partition_names else None,
+        "context": list(context),
+        "partitions": list(partitions_searched or []),
+        "created": now
+    }
+    with _lock:
+        entries = [e for e in _clients.pop(client_id, []) if e["query"] != entry["query"]]
+        entries.append(entry)
+        _clients[client_id] = entries[-PREFETCH_MAX_PER_CLIENT:]
+        _evict_expired(now)
+
+def has(client_id, query, partition_names=None):
+    """True if this exact (normalized) question is already prefetched for the client."""
+    query = normalize(query)
+    partition_names = tuple(partition_names) if partition_names else None
+    with _lock:
+        return any(e["query"] == query and e["partition_names"] == partition_names
+                   for e in _clients.get(client_id, []))
+
+def lookup(client_id, query, partition_names=None):
+    """
+    Find prefetched context for a submitted question.
+
+    Returns:
+        The newest unexpired entry ({"query", "context", "partitions", ...}) for
+        the same normalized question and partitions, or None
+    """
+    if not client_id:
+        return None
+    query = normalize(query)
+    partition_names = tuple(partition_names) if partition_names else None
+    now = time.time()
+    with _lock:
+        _evict_expired(now)
+        entries = list(_clients.get(client_id, []))
+
+    best = None
+    for entry in entries:
+        if (now - entry["created"] <= PREFETCH_TTL and entry["query"] == query
+                and entry["partition_names"] == partition_names):
+            best = entry
+    metrics.inc_counter("qa_prefetch_total", help_text="Submitted questions by prefetched context use",
+                        result="hit" if best is not None else "miss")
+    return best
+
+def clear():
+    """Forget all prefetched context."""
+    with _lock:
+        _clients.clear()
@@ -10,40 +10,42 @@ import time
 import logging
 import platform
 import subprocess
-import requests
+import importlib.util
 
+from logging_setup import setup_logging
 from config import (
     DOCS_DIR, PROCESSED_DIR, OLLAMA_MODEL, LLAVA_MODEL, 
-    CHROMA_DB_DIR, OCR_ENABLED
+    CHROMA_DB_DIR, OCR_ENABLED, MODEL_ROUTING_ENABLED, FAST_MODEL
 )
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("process_docs.log"), logging.StreamHandler()]
-)
+setup_logging("process_docs.log")
 logger = logging.getLogger("process_docs")
 
+# Import names of the required packages, keyed by their pip names
+DEPENDENCIES = {
+    "flask": "flask", "python-dotenv": "dotenv", "chromadb": "chromadb",
+    "sentence-transformers": "sentence_transformers", "pypdf": "pypdf", "pymupdf": "fitz",
+    "pytesseract": "pytesseract", "pillow": "PIL", "pdf2image": "pdf2image",
+    "tabula-py": "tabula", "pandas": "pandas", "requests": "requests", "tqdm": "tqdm",
+    "tiktoken": "tiktoken"
+}
+
 def check_dependencies():
-    """Check if all required dependencies are installed."""
-    dependencies = [
-        "flask", "python-dotenv", "chromadb", "sentence_transformers", 
-        "pypdf", "langchain", "fitz", "pytesseract", "PIL", 
-        "pdf2image", "tabula", "pandas", "requests", "tqdm"
-    ]
-    
+    """
+    Check if all required dependencies are installed.
+
+    Packages are located via their import specs without being imported, so the
+    check takes milliseconds instead of loading chromadb, torch, pandas, etc.
+    """
     missing = []
-    for dep in dependencies:
+    for package, module in DEPENDENCIES.items():
         try:
-            if dep == "PIL":
-                import PIL
-            elif dep == "fitz":
-                import fitz
-            else:
-                __import__(dep)
-        except ImportError:
-            missing.append(dep)
+            found = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            missing.append(package)
     
     return missing
 
@@ -74,7 +76,6 @@ python-dotenv>=1.0.0
 chromadb>=0.4.18
 sentence-transformers>=2.2.2
 pypdf>=3.17.1
-langchain>=0.0.267
 requests>=2.31.0
 pymupdf>=1.22.5
 pytesseract>=0.3.10
@@ -118,19 +119,26 @@ pydantic>=2.0.0""")
             if not proceed_without_ocr:
                 return False
     
-    # Check for Ollama
+    # Check the Ollama backends (OLLAMA_BACKENDS)
+    import ollama_pool
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=2)
-        if response.status_code == 200:
-            models = response.json()
+        pool = ollama_pool.OllamaPool(health_interval=0)
+        pool.check_health()
+        backends = pool.status()
+        for backend in backends:
+            print(f"Ollama at {backend['url']}: {'running' if backend['healthy'] else 'not responding'}")
+        healthy = [b for b in backends if b['healthy']]
+        if healthy:
             print(f"Ollama: Installed and running")
             
             # Get available models
-            available_models = [m['name'] for m in models.get('models', [])]
+            available_models = sorted(set().union(*(b['models'] for b in healthy)))
             print(f"Available models: {', '.join(available_models)}")
             
             # Check if the configured models are available
             required_models = [OLLAMA_MODEL, LLAVA_MODEL]
+            if MODEL_ROUTING_ENABLED and FAST_MODEL:
+                required_models.append(FAST_MODEL)
             missing_models = [m for m in required_models if m not in available_models]
             
             if missing_models:
@@ -170,8 +178,13 @@ pydantic>=2.0.0""")
     print("\nSetup verification complete. System is ready for processing.")
     return True
 
-def run_pipeline(skip_processing=False, skip_embeddings=False, force=False):
-    """Run the complete processing pipeline."""
+def run_pipeline(skip_processing=False, skip_embeddings=False, force=False, resume=False):
+    """
+    Run the complete processing pipeline.
+    
+    With resume, pages, captions and embedding batches journaled by an
+    interrupted run are reused instead of being processed again.
+    """
     start_time = time.time()
     
     print("=" * 60)
@@ -203,7 +216,7 @@ def run_pipeline(skip_processing=False, skip_embeddings=False, force=False):
         
         # Run document processor
         from document_processor import process_directory
-        chunked_docs = process_directory(DOCS_DIR)
+        chunked_docs = process_directory(DOCS_DIR, resume=resume)
         
         if not chunked_docs:
             print("Document processing failed or no content was extracted.")
@@ -234,7 +247,7 @@ def run_pipeline(skip_processing=False, skip_embeddings=False, force=False):
         
         from embeddings import process_embeddings_and_db
         try:
-            collection = process_embeddings_and_db()
+            collection = process_embeddings_and_db(resume=resume)
         except Exception as e:
             print(f"Error in embeddings processing: {str(e)}")
             return False
@@ -288,8 +301,12 @@ if __name__ == "__main__":
                         help="Verify system setup without running the pipeline")
     parser.add_argument("--force", action="store_true", 
                         help="Force overwrite of existing processed files")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its journal instead of starting over")
     parser.add_argument("--test", action="store_true",
                         help="Run a test query after processing")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="Pre-generate answers for the most frequent questions after processing")
     
     args = parser.parse_args()
     
@@ -300,8 +317,13 @@ if __name__ == "__main__":
             success = run_pipeline(
                 skip_processing=args.skip_processing,
                 skip_embeddings=args.skip_embeddings,
-                force=args.force
+                force=args.force,
+                resume=args.resume
             )
             
             if success and args.test:
-                run_test_query()
\ No newline at end of file
+                run_test_query()
+            
+            if success and args.warm_cache:
+                from warm_cache import warm
+                warm()
\ No newline at end of file
@@ -6,119 +6,292 @@ import os
 import json
 import time
 import hashlib
-import chromadb
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import dedup
+import metrics
+import sessions
+import partitions
+import quantized_index
+import query_encoder
+import embedding_backends
+from logging_setup import setup_logging
+import model_router
+import ollama_pool
+from context_packer import pack_context
+from retrieval import select_results
+from deadline import RequestAborted, DeadlineExceeded, RequestCancelled
 
 # Import configuration
 from config import (
-    OLLAMA_URL, OLLAMA_MODEL, LLM_TEMPERATURE, LLM_MAX_TOKENS,
-    LLM_CONTEXT_WINDOW, SEARCH_TOP_K, CACHE_SIZE, LLM_USE_STREAMING,
-    CHROMA_DB_DIR, COLLECTION_NAME, CACHE_DIR
+    OLLAMA_MODEL, LLM_TEMPERATURE,
+    LLM_CONTEXT_TOKENS, SEARCH_TOP_K, CACHE_SIZE, LLM_USE_STREAMING,
+    CHROMA_DB_DIR, COLLECTION_NAME, CACHE_DIR, REQUEST_TIMEOUT,
+    SESSION_MAX_CONTEXT_TOKENS, RETRIEVAL_MODE, MMR_FETCH_K, VECTOR_STORE,
+    QUERY_BATCHING_ENABLED, BATCH_CONCURRENCY, DEADLINE_MIN_GENERATION_SECONDS
 )
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("qa_system.log"), logging.StreamHandler()]
-)
 logger = logging.getLogger("qa_system")
 
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the documentation for your question."
+
 # Create cache directory if it doesn't exist
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-def get_relevant_context(query, n_results=SEARCH_TOP_K, rerank=True):
+# Vector database handles are expensive to create, so they are shared across requests
+_collection = None
+_embedding_function = None
+
+def get_embedding_function():
+    """Return the (lazily created) query embedding function."""
+    global _embedding_function
+    if _embedding_function is None:
+        _embedding_function = embedding_backends.get_backend()
+    return _embedding_function
+
+def embed_queries(queries):
     """
-    Retrieve and potentially rerank relevant document chunks based on the query.
+    Embed query texts.
+
+    With QUERY_BATCHING_ENABLED, queries from concurrent requests are encoded
+    together by the shared query encoder instead of one model call per request.
     """
-    try:
+    if not QUERY_BATCHING_ENABLED:
+        return get_embedding_function()(queries)
+    # Resolve the embedding function per batch so it can be swapped at runtime
+    batcher = query_encoder.get_batcher(lambda texts: get_embedding_function()(texts))
+    return batcher.encode(queries)
+
+def get_collection():
+    """Return the (lazily opened) ChromaDB collection."""
+    global _collection
+    if _collection is None:
+        # chromadb takes most of a second to import, so it is only loaded when first needed
+        import chromadb
         client = chromadb.PersistentClient(CHROMA_DB_DIR)
-        collection = client.get_collection(COLLECTION_NAME)
-        
-        # Get more results than needed for reranking
-        fetch_count = n_results * 2 if rerank else n_results
-        
-        results = collection.query(
-            query_texts=[query],
-            n_results=fetch_count,
-            include=["documents", "metadatas", "distances"]
+        _collection = client.get_collection(
+            COLLECTION_NAME,
+            embedding_function=get_embedding_function()
         )
+    return _collection
+
+def _vector_search(collection, query_embeddings, n_results, include, series=None, sources=None):
+    """
+    Run the nearest-neighbour search for one or more queries.
+    
+    With VECTOR_STORE = "chroma" this is a single multi-query Chroma query. With
+    "int8" or "binary" the quantized index finds and rescores the candidates, and
+    Chroma only supplies the documents and metadata. Results use Chroma's query
+    format (one list per query).
+    """
+    if VECTOR_STORE == "chroma":
+        return collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=partitions.build_where(series, sources),
+            include=include
+        )
+    
+    index = quantized_index.get_index(VECTOR_STORE)
+    mask = index.partition_mask(series, sources)
+    hits = [index.search(embedding, k=n_results, mask=mask) for embedding in query_embeddings]
+    
+    all_ids = list({chunk_id for ids, _, _ in hits for chunk_id in ids})
+    fetched = collection.get(ids=all_ids, include=["documents", "metadatas"]) if all_ids else {
+        "ids": [], "documents": [], "metadatas": []
+    }
+    by_id = {chunk_id: (doc, metadata) for chunk_id, doc, metadata in zip(
+        fetched["ids"], fetched["documents"], fetched["metadatas"]
+    )}
+    
+    results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+    for ids, similarities, vectors in hits:
+        keep = [j for j, chunk_id in enumerate(ids) if chunk_id in by_id]
+        results["ids"].append([ids[j] for j in keep])
+        results["documents"].append([by_id[ids[j]][0] for j in keep])
+        results["metadatas"].append([by_id[ids[j]][1] for j in keep])
+        # Squared L2 distance between unit vectors, as Chroma reports it
+        results["distances"].append([float(2.0 - 2.0 * similarities[j]) for j in keep])
+        results["embeddings"].append(vectors[keep])
+    return results
+
+def _search_scope(query, partition_names, manifest):
+    """Return the (series, sources) to search: the requested partitions, or auto-routed ones."""
+    if partition_names is None:
+        return partitions.route_query(query, manifest), []
+    series, sources, _ = partitions.resolve_partitions(partition_names, manifest)
+    return series, sources
+
+def _fetch_plan(n_results, rerank):
+    """Return (use_mmr, fetch_count, include) for a vector search."""
+    # Get more results than needed for reranking; MMR needs the candidate embeddings
+    use_mmr = rerank and RETRIEVAL_MODE == "mmr"
+    if use_mmr:
+        fetch_count = max(MMR_FETCH_K, n_results)
+    else:
+        fetch_count = n_results * 2 if rerank else n_results
+    include = ["documents", "metadatas", "distances"]
+    if use_mmr:
+        include.append("embeddings")
+    return use_mmr, fetch_count, include
+
+def _build_context(results, row, n_results, rerank, use_mmr, timings=None):
+    """Turn one query's search results into (optionally reranked) context entries."""
+    context = []
+    for chunk_id, doc, metadata, distance in zip(
+        results["ids"][row],
+        results["documents"][row], 
+        results["metadatas"][row],
+        results["distances"][row]
+    ):
+        # Calculate a relevance score (inverted distance)
+        relevance = 1.0 - (distance / 2.0)  # Normalize to 0-1 scale
         
-        context = []
-        for i, (doc, metadata, distance) in enumerate(zip(
-            results["documents"][0], 
-            results["metadatas"][0],
-            results["distances"][0]
-        )):
-            # Calculate a relevance score (inverted distance)
-            relevance = 1.0 - (distance / 2.0)  # Normalize to 0-1 scale
+        entry = {
+            "id": chunk_id,
+            "content": doc,
+            "source": metadata["source"],
+            "page": metadata.get("page", 0),
+            "heading": metadata.get("heading", ""),
+            "relevance": relevance
+        }
+        if "chunk_index" in metadata:
+            # Lets the context packer recognise neighbouring chunks of a page
+            entry["chunk_index"] = metadata["chunk_index"]
+        if metadata.get("references"):
+            # Every page this (deduplicated) page stands for, for citations
+            entry["references"] = dedup.parse_references(metadata)
+        context.append(entry)
+    
+    # Rerank results if enabled
+    if rerank:
+        with metrics.timed(None, timings=timings, timing_key="rerank_seconds"):
+            # Apply the relevance floor, adaptive cut-off and MMR diversification
+            embeddings = results["embeddings"][row] if use_mmr else None
+            context = select_results(context, embeddings, n_results,
+                                     mode=RETRIEVAL_MODE if use_mmr else "similarity")
+    return context
+
+def get_relevant_context(query, n_results=SEARCH_TOP_K, rerank=True, timings=None,
+                         partition_names=None, deadline=None):
+    """
+    Retrieve and potentially rerank relevant document chunks based on the query.
+    
+    Args:
+        partition_names: Series or source names to restrict the search to. If None,
+            the question is routed to a series automatically when it mentions a
+            known model code.
+        timings: Optional dict that is filled with the embedding, vector search
+            and rerank durations in seconds, and the partitions searched
+        deadline: Optional deadline.Deadline; RequestAborted is raised if it has
+            passed or the request was cancelled
+    """
+    if deadline is not None:
+        deadline.check("retrieval")
+    try:
+        with metrics.timed("qa_retrieval_seconds", "Vector retrieval latency"):
+            collection = get_collection()
+            manifest = partitions.get_manifest(collection)
             
-            context.append({
-                "content": doc,
-                "source": metadata["source"],
-                "page": metadata.get("page", 0),
-                "heading": metadata.get("heading", ""),
-                "relevance": relevance
-            })
-        
-        # Rerank results if enabled
-        if rerank:
-            # Sort by adjusted relevance and take top n_results
-            context = sorted(context, key=lambda x: x["relevance"], reverse=True)[:n_results]
-        
-        return context
+            # Scope the search to the requested partitions, or route automatically
+            auto_routed = partition_names is None
+            series, sources = _search_scope(query, partition_names, manifest)
+            if timings is not None:
+                timings["partitions"] = series + sources
+            
+            # Embed the query ourselves so the embedding cost can be measured separately
+            with metrics.timed("qa_embedding_seconds", "Query embedding latency",
+                               timings=timings, timing_key="embedding_seconds"):
+                query_embedding = embed_queries([query])
+            
+            use_mmr, fetch_count, include = _fetch_plan(n_results, rerank)
+            
+            with metrics.timed("qa_vector_search_seconds", "Vector search latency",
+                               timings=timings, timing_key="vector_search_seconds"):
+                results = _vector_search(collection, query_embedding, fetch_count, include,
+                                         series, sources)
+                
+                # An automatically routed search that finds nothing falls back to the full index
+                if auto_routed and (series or sources) and not results["ids"][0]:
+                    results = _vector_search(collection, query_embedding, fetch_count, include)
+                    if timings is not None:
+                        timings["partitions"] = []
+            
+            if deadline is not None:
+                # Reranking is cheap, but the question may have been abandoned during the search
+                deadline.check("rerank")
+            return _build_context(results, 0, n_results, rerank, use_mmr, timings)
     
+    except RequestAborted:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving context: {str(e)}")
         return []
 
-def format_context_for_llm(context, max_length=LLM_CONTEXT_WINDOW):
-    """Format context data for the LLM prompt with smart truncation and improved source tracking."""
-    formatted_chunks = []
-    total_length = 0
+def get_relevant_contexts(queries, n_results=SEARCH_TOP_K, rerank=True, partition_names=None):
+    """
+    Retrieve context for many queries at once.
     
-    # First pass: format all chunks with metadata and clear boundaries
-    for i, ctx in enumerate(context):
-        # Format each chunk with clear section boundaries
-        chunk = f"--- START EXCERPT FROM {ctx['source']}, PAGE {ctx['page']} ---\n"
-        
-        if ctx.get("heading"):
-            chunk += f"SECTION: {ctx['heading']}\n"
-        
-        # Truncate very long content chunks
-        content = ctx['content']
-        if len(content) > 1500:
-            content = content[:1450] + "... [content truncated]"
+    All queries are embedded in one pass, and queries that search the same
+    partitions share one multi-query vector search.
+    
+    Returns:
+        List of context lists, aligned with queries
+    """
+    try:
+        with metrics.timed("qa_batch_retrieval_seconds", "Batch vector retrieval latency"):
+            collection = get_collection()
+            manifest = partitions.get_manifest(collection)
             
-        chunk += f"{content}\n"
-        chunk += f"--- END EXCERPT FROM {ctx['source']}, PAGE {ctx['page']} ---\n\n"
-        
-        # Add to our list with relevance as priority
-        formatted_chunks.append({
-            "text": chunk,
-            "relevance": ctx.get("relevance", 0),
-            "length": len(chunk)
-        })
-    
-    # Sort chunks by relevance
-    formatted_chunks.sort(key=lambda x: x["relevance"], reverse=True)
-    
-    # Second pass: build context string respecting max length
-    context_text = ""
-    for chunk in formatted_chunks:
-        # If adding this chunk would exceed our max length, skip it
-        if total_length + chunk["length"] > max_length:
-            # But always include at least one chunk
-            if total_length == 0:
-                context_text = chunk["text"][:max_length]
-                break
-            else:
-                continue
+            with metrics.timed("qa_embedding_seconds", "Query embedding latency"):
+                embeddings = embed_queries(list(queries))
+            
+            use_mmr, fetch_count, include = _fetch_plan(n_results, rerank)
+            
+            # Group queries by the partitions they search
+            groups = {}
+            for i, query in enumerate(queries):
+                series, sources = _search_scope(query, partition_names, manifest)
+                groups.setdefault((tuple(series), tuple(sources)), []).append(i)
+            
+            contexts = [[] for _ in queries]
+            unrouted = []
+            with metrics.timed("qa_vector_search_seconds", "Vector search latency"):
+                for (series, sources), indices in groups.items():
+                    results = _vector_search(collection, [embeddings[i] for i in indices],
+                                             fetch_count, include, series, sources)
+                    for row, i in enumerate(indices):
+                        # Automatically routed searches that find nothing fall back to the full index
+                        if partition_names is None and (series or sources) and not results["ids"][row]:
+                            unrouted.append(i)
+                        else:
+                            contexts[i] = _build_context(results, row, n_results, rerank, use_mmr)
                 
-        context_text += chunk["text"]
-        total_length += chunk["length"]
+                if unrouted:
+                    results = _vector_search(collection, [embeddings[i] for i in unrouted],
+                                             fetch_count, include)
+                    for row, i in enumerate(unrouted):
+                        contexts[i] = _build_context(results, row, n_results, rerank, use_mmr)
+            
+            return contexts
     
+    except Exception as e:
+        logger.error(f"Error retrieving batch context: {str(e)}")
+        return [[] for _ in queries]
+
+def format_context_for_llm(context, max_tokens=LLM_CONTEXT_TOKENS, chunk_ids=None):
+    """
+    Format context data for the LLM prompt within a token budget.
+    
+    Overlapping or adjacent chunks from the same page are merged into one excerpt
+    and excerpts are selected by relevance per token (see context_packer). If a
+    chunk_ids list is given, the ids of the included chunks are appended to it.
+    """
+    context_text, _, included_ids = pack_context(context, max_tokens)
+    if chunk_ids is not None:
+        chunk_ids.extend(included_ids)
     return context_text
 
 def generate_llm_prompt(query, context_text):
@@ -142,15 +315,51 @@ USER QUESTION: {query}
 
 YOUR ANSWER:"""
 
-def get_cached_response(query, context):
-    """Check for cached response to avoid duplicate API calls."""
-    # Create a unique hash of the query and context
+def generate_followup_prompt(query, context_text):
+    """
+    Generate the prompt for a follow-up turn in a conversation session.
+    
+    The instructions and earlier excerpts are already part of the Ollama context,
+    so only new excerpts and the question are sent.
+    """
+    if not context_text:
+        context_text = "(No new excerpts - use the excerpts provided earlier in this conversation.)\n"
+    
+    return f"""
+
+ADDITIONAL CONTEXT:
+{context_text}
+FOLLOW-UP QUESTION: {query}
+
+Follow the same instruction guidelines as before.
+
+YOUR ANSWER:"""
+
+def _cache_file(query, context, model):
+    """Cache file path for a query, its context and the model that answers it."""
+    # Create a unique hash of the model, query and context
     context_str = json.dumps([c["content"] for c in context])
-    combined = query + context_str
+    combined = f"{model}:{query}{context_str}"
     hash_key = hashlib.md5(combined.encode()).hexdigest()
-    cache_file = os.path.join(CACHE_DIR, f"{hash_key}.json")
+    return os.path.join(CACHE_DIR, f"{hash_key}.json")
+
+def get_cached_response(query, context, timings=None, model=OLLAMA_MODEL):
+    """Check for cached response to avoid duplicate API calls."""
+    cache_file = _cache_file(query, context, model)
     
     # Check if we have a cached response
+    with metrics.timed("qa_cache_lookup_seconds", "Response cache lookup latency",
+                       timings=timings, timing_key="cache_lookup_seconds", tier="disk"):
+        cached = _read_cache_file(cache_file, query)
+    
+    if cached is None:
+        metrics.inc_counter("qa_cache_misses_total", help_text="Response cache misses", tier="disk")
+    else:
+        metrics.inc_counter("qa_cache_hits_total", help_text="Response cache hits", tier="disk")
+    return cached
+
+def _read_cache_file(cache_file, query):
+    """Read a cached response from disk if present and not expired."""
     if os.path.exists(cache_file):
         try:
             with open(cache_file, 'r') as f:
@@ -165,17 +374,14 @@ def get_cached_response(query, context):
     
     return None
 
-def save_to_cache(query, context, response):
+def save_to_cache(query, context, response, model=OLLAMA_MODEL):
     """Save response to cache."""
     try:
-        # Create a unique hash of the query and context
-        context_str = json.dumps([c["content"] for c in context])
-        combined = query + context_str
-        hash_key = hashlib.md5(combined.encode()).hexdigest()
-        cache_file = os.path.join(CACHE_DIR, f"{hash_key}.json")
+        cache_file = _cache_file(query, context, model)
         
         cache_data = {
             "query": query,
+            "model": model,
             "timestamp": time.time(),
             "response": response
         }
@@ -195,83 +401,257 @@ def save_to_cache(query, context, response):
     except Exception as e:
         logger.warning(f"Error saving to cache: {str(e)}")
 
-def answer_with_local_llm(query, context=None):
+def _generate(request_body, timings=None, deadline=None):
+    """
+    Send a generation request to Ollama.
+    
+    With a deadline the response is always streamed, so generation can be
+    abandoned between tokens: the stream is closed (which makes Ollama stop)
+    when the request is cancelled or the deadline passes.
+    
+    Returns:
+        Tuple of (status_code, answer, result) where result holds the final
+        Ollama response object (including its eval/prompt_eval statistics).
+    """
+    if deadline is not None:
+        return _generate_until(dict(request_body, stream=True), deadline, timings)
+    
+    start_time = time.time()
+    
+    pool = ollama_pool.get_pool()
+    if not request_body["stream"]:
+        with pool.post("/api/generate", request_body, REQUEST_TIMEOUT) as response:
+            if response.status_code != 200:
+                return response.status_code, "", {}
+            result = response.json()
+        
+        # Without streaming, time-to-first-token is everything but the decode phase
+        elapsed = time.time() - start_time
+        if timings is not None:
+            timings["time_to_first_token_seconds"] = max(
+                elapsed - result.get("eval_duration", 0) / 1e9, 0.0
+            )
+        return response.status_code, result.get("response", ""), result
+    
+    # For streaming, concatenate all the partial responses
+    parts = []
+    result = {}
+    with pool.post("/api/generate", request_body, REQUEST_TIMEOUT, stream=True) as response:
+        if response.status_code != 200:
+            return response.status_code, "", {}
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if not parts and timings is not None:
+                timings["time_to_first_token_seconds"] = time.time() - start_time
+            parts.append(result.get("response", ""))
+    
+    return 200, "".join(parts), result
+
+def _generate_until(request_body, deadline, timings=None):
+    """Stream a generation from Ollama, stopping when the deadline passes or the request is cancelled."""
+    start_time = time.time()
+    parts = []
+    result = {}
+    try:
+        with ollama_pool.get_pool().post("/api/generate", request_body, REQUEST_TIMEOUT, stream=True,
+                                         deadline=deadline) as response:
+            if response.status_code != 200:
+                return response.status_code, "", {}
+            # Closing the response from the cancelling thread unblocks the read below
+            remove_callback = deadline.on_cancel(response.close)
+            try:
+                for line in response.iter_lines():
+                    if deadline.cancelled:
+                        raise RequestCancelled("Request cancelled during generation")
+                    if deadline.remaining() <= 0:
+                        raise DeadlineExceeded("Deadline passed during generation")
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    if not parts and timings is not None:
+                        timings["time_to_first_token_seconds"] = time.time() - start_time
+                    parts.append(result.get("response", ""))
+            finally:
+                remove_callback()
+    except RequestAborted:
+        raise
+    except Exception:
+        # Errors caused by closing the stream or by the deadline-bounded read timeout
+        if deadline.cancelled:
+            raise RequestCancelled("Request cancelled during generation")
+        if deadline.remaining() <= 0:
+            raise DeadlineExceeded("Deadline passed during generation")
+        raise
+    
+    if deadline.cancelled:
+        raise RequestCancelled("Request cancelled during generation")
+    return 200, "".join(parts), result
+
+def retrieval_query(query, session=None):
+    """
+    The text used to retrieve context for a question.
+
+    Follow-up questions ("how does this valve work?") need the previous
+    question to retrieve the right excerpts.
+    """
+    if session is not None and session["turns"]:
+        return f"{session['turns'][-1][0]} {query}"
+    return query
+
+def answer_with_local_llm(query, context=None, timings=None, session=None, partition_names=None,
+                          routing=None, check_cache=True, deadline=None):
     """
-    Generate an answer using the Phi-4 model via Ollama.
+    Generate an answer via Ollama, using Phi-4 or the fast model picked by model_router.
     
     Args:
         query: The user's question
         context: Optional pre-retrieved context (if None, retrieves context)
+        timings: Optional dict that is filled with a per-stage timing breakdown
+        session: Optional conversation session (see sessions.get_session)
+        partition_names: Optional series/source names to scope retrieval to
+        routing: Optional model_router decision to use instead of routing again
+        check_cache: Look up the response cache first (disable if the caller already did)
+        deadline: Optional deadline.Deadline for the request; stages that can't finish
+            in time are skipped and generation stops when the request is cancelled
         
     Returns:
         Tuple of (answer, context)
+        
+    Raises:
+        deadline.RequestAborted: If the deadline passed or the request was cancelled
     """
+    if timings is None:
+        timings = {}
+    
     # Get context if not provided
     if context is None:
-        context = get_relevant_context(query)
+        context = get_relevant_context(retrieval_query(query, session), timings=timings,
+                                       partition_names=partition_names, deadline=deadline)
     
     # Check if we have enough context
     if not context:
-        return "I couldn't find any relevant information in the documentation for your question.", []
+        return NO_CONTEXT_ANSWER, []
+    
+    # Pick the chat model for this question and the current load
+    if routing is None:
+        routing = model_router.route(query, context)
+    model = routing["model"]
+    timings["model"] = model
+    timings["routing_reason"] = routing["reason"]
     
-    # Check cache first
-    cached_response = get_cached_response(query, context)
-    if cached_response:
-        return cached_response, context
+    # A follow-up can continue from the Ollama context of the previous turn,
+    # as long as it was produced by the same model and hasn't grown too large
+    follow_up = bool(
+        session is not None
+        and session.get("ollama_context")
+        and session.get("model") == model
+        and len(session["ollama_context"]) < SESSION_MAX_CONTEXT_TOKENS
+    )
+    timings["follow_up"] = follow_up
+    
+    # Check cache first (follow-up answers depend on the conversation, so they bypass it)
+    if not follow_up and check_cache:
+        cached_response = get_cached_response(query, context, timings=timings, model=model)
+        timings["cache_hit"] = bool(cached_response)
+        if cached_response:
+            if session is not None:
+                # This turn isn't part of any Ollama context, so the next turn starts fresh
+                sessions.update_session(session["id"], query, cached_response, reset_context=True)
+            return cached_response, context
+    
+    sent_chunk_ids = []
+    with metrics.timed(None, timings=timings, timing_key="prompt_build_seconds"):
+        # Format context for the LLM
+        with metrics.timed("qa_context_format_seconds", "Context formatting latency"):
+            if follow_up:
+                # Excerpts sent in earlier turns are already in the Ollama context
+                new_context = [c for c in context if c.get("id") not in session["sent_chunk_ids"]]
+                context_text = ""
+                if new_context:
+                    context_text = format_context_for_llm(new_context, chunk_ids=sent_chunk_ids)
+            else:
+                context_text = format_context_for_llm(context, chunk_ids=sent_chunk_ids)
         
-    # Format context for the LLM
-    context_text = format_context_for_llm(context)
+        # Generate prompt
+        if follow_up:
+            prompt = generate_followup_prompt(query, context_text)
+        else:
+            prompt = generate_llm_prompt(query, context_text)
     
-    # Generate prompt
-    prompt = generate_llm_prompt(query, context_text)
+    # Starting a generation that can't finish in time only takes capacity from other requests
+    if deadline is not None:
+        deadline.check("generation", DEADLINE_MIN_GENERATION_SECONDS)
     
     # Prepare the API request
     request_body = {
-        "model": OLLAMA_MODEL,
+        "model": model,
         "prompt": prompt,
         "stream": LLM_USE_STREAMING,
         "options": {
             "temperature": LLM_TEMPERATURE,
-            "num_predict": LLM_MAX_TOKENS
+            "num_predict": routing["num_predict"]
         }
     }
+    if follow_up:
+        request_body["context"] = session["ollama_context"]
     
     try:
         start_time = time.time()
-        logger.info(f"Sending request to Ollama: {OLLAMA_MODEL}")
+        logger.info(f"Sending request to Ollama: {model}")
         
         # Make the API call
-        response = requests.post(
-            OLLAMA_URL,
-            json=request_body,
-            timeout=180  # 3-minute timeout
-        )
+        status_code, answer, result = _generate(request_body, timings, deadline)
+        
+        if status_code == 404 and model != OLLAMA_MODEL:
+            # The routed model isn't installed on any backend; answer with the default model
+            logger.warning(f"Model {model} not found on any Ollama backend, retrying with {OLLAMA_MODEL}")
+            return answer_with_local_llm(query, context=context, timings=timings, session=session,
+                                         routing=model_router.default_route("model_missing"),
+                                         check_cache=check_cache, deadline=deadline)
         
         elapsed = time.time() - start_time
         logger.info(f"Ollama response received in {elapsed:.2f} seconds")
+        metrics.observe("qa_llm_generation_seconds", elapsed, "Ollama generation latency",
+                        model=model)
+        timings["llm_seconds"] = elapsed
         
-        if response.status_code == 200:
-            result = response.json()
+        if status_code == 200:
+            metrics.record_ollama_stats(result, model)
+            if "prompt_eval_count" in result:
+                timings["prompt_tokens"] = result["prompt_eval_count"]
+            if "eval_count" in result:
+                timings["completion_tokens"] = result["eval_count"]
+            if "eval_duration" in result:
+                timings["generation_seconds"] = result["eval_duration"] / 1e9
             
-            # Extract answer from response
-            if LLM_USE_STREAMING:
-                # For streaming, concatenate all the responses
-                answer = "".join([r.get("response", "") for r in result])
-            else:
-                answer = result.get("response", "")
+            if session is not None:
+                sessions.update_session(
+                    session["id"], query, answer,
+                    ollama_context=result.get("context"),
+                    model=model,
+                    chunk_ids=sent_chunk_ids,
+                    reset_context=not follow_up
+                )
             
             # Post-process answer
-            answer = post_process_answer(answer, context)
+            with metrics.timed(None, timings=timings, timing_key="post_process_seconds"):
+                answer = post_process_answer(answer, context)
             
-            # Cache the result
-            save_to_cache(query, context, answer)
+            # Cache the result (follow-up answers depend on the conversation)
+            if not follow_up:
+                save_to_cache(query, context, answer, model=model)
             
             return answer, context
         else:
-            error_msg = f"Error: Unable to get response from Ollama (Status code: {response.status_code})"
+            error_msg = f"Error: Unable to get response from Ollama (Status code: {status_code})"
             logger.error(error_msg)
             return error_msg, context
             
+    except RequestAborted:
+        raise
+        
     except requests.exceptions.Timeout:
         error_msg = "Error: Request to Ollama timed out. The query might be too complex or the system is overloaded."
         logger.error(error_msg)
@@ -287,6 +667,61 @@ def answer_with_local_llm(query, context=None):
         logger.error(error_msg)
         return error_msg, context
 
+def answer_batch(queries, partition_names=None, concurrency=BATCH_CONCURRENCY):
+    """
+    Answer many questions at once.
+    
+    Queries are embedded and searched together, repeated questions are answered
+    once, cache hits are resolved up front, and only the remaining questions are
+    sent to Ollama, at most `concurrency` at a time.
+    
+    Returns:
+        List of dicts (aligned with queries) with "query", "answer", "context",
+        "model", "cached" and "error" (None on success)
+    """
+    unique = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    contexts = dict(zip(unique, get_relevant_contexts(unique, partition_names=partition_names)))
+    
+    results = {}
+    pending = []
+    for query in unique:
+        context = contexts[query]
+        if not context:
+            results[query] = {"answer": NO_CONTEXT_ANSWER, "context": [], "model": None,
+                              "cached": False, "error": None}
+            continue
+        
+        routing = model_router.route(query, context)
+        cached_response = get_cached_response(query, context, model=routing["model"])
+        if cached_response:
+            results[query] = {"answer": cached_response, "context": context, "model": routing["model"],
+                              "cached": True, "error": None}
+        else:
+            pending.append((query, routing))
+    
+    def generate(query, routing):
+        answer, context = answer_with_local_llm(query, context=contexts[query], routing=routing,
+                                                check_cache=False)
+        return {"answer": answer, "context": context, "model": routing["model"], "cached": False,
+                "error": answer if answer.startswith("Error:") else None}
+    
+    if pending:
+        logger.info(f"Batch of {len(queries)} questions: {len(unique) - len(pending)} answered "
+                    f"without generation, generating {len(pending)} with concurrency {concurrency}")
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(generate, query, routing): query for query, routing in pending}
+            for future in as_completed(futures):
+                query = futures[future]
+                try:
+                    results[query] = future.result()
+                except Exception as e:
+                    logger.error(f"Error answering batch question '{query[:50]}': {str(e)}")
+                    results[query] = {"answer": "", "context": contexts[query], "model": None,
+                                      "cached": False, "error": f"Error: {str(e)}"}
+    
+    empty = {"answer": "", "context": [], "model": None, "cached": False, "error": "Query is required"}
+    return [dict(results.get((q or "").strip(), empty), query=q) for q in queries]
+
 def post_process_answer(answer, context):
     """Clean up and improve the LLM's answer."""
     # Check if the answer already has a sources section (added by the LLM despite instructions)
@@ -297,11 +732,14 @@ def post_process_answer(answer, context):
     # Create a mapping of source document to pages (with deduplication)
     source_pages = {}
     for ctx in context:
-        source = ctx['source']
-        page = ctx['page']
-        if source not in source_pages:
-            source_pages[source] = set()
-        source_pages[source].add(page)
+        # A deduplicated page also stands for its identical copies in other manuals
+        copies = ctx.get('references') or [{'source': ctx['source'], 'page': ctx['page']}]
+        for copy in copies:
+            source = copy['source']
+            page = copy['page']
+            if source not in source_pages:
+                source_pages[source] = set()
+            source_pages[source].add(page)
     
     # Add a clean source summary at the end
     sources_summary = "\n\n**Sources:**"
@@ -316,6 +754,8 @@ def post_process_answer(answer, context):
     return answer
 
 if __name__ == "__main__":
+    setup_logging("qa_system.log")
+    
     # Test the QA system
     test_query = "How do I reset the device?"
     
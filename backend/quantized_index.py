@@ -0,0 +1,259 @@
+# quantized_index.py
+"""
+Quantized in-memory vector index with exact float rescoring.
+
+Chunk embeddings are stored as int8 codes (4x smaller than float32) and as
+binary sign codes (32x smaller). A query first scans the compact codes, then the
+best QUANTIZED_RESCORE_CANDIDATES are rescored exactly against the float vectors,
+which stay on disk and are memory-mapped, so only the codes are kept resident.
+
+Usage:
+    python quantized_index.py --build          # Build from processed_docs/embeddings.pkl
+    python quantized_index.py --evaluate       # Report recall against exact float search
+"""
+import os
+import json
+import time
+import pickle
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+import partitions
+from logging_setup import setup_logging
+from config import (
+    PROCESSED_DIR, VECTOR_STORE, QUANTIZED_RESCORE_CANDIDATES, SEARCH_TOP_K
+)
+
+logger = logging.getLogger("quantized_index")
+
+INDEX_DIR = os.path.join(PROCESSED_DIR, "quantized_index")
+
+# Rows are de-quantized in small blocks so each block stays in CPU cache; this
+# makes the int8 scan faster than a float32 matmul over the whole matrix
+_SCAN_BLOCK_ROWS = 1024
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def build_index(ids, embeddings, metadatas=None, index_dir=INDEX_DIR):
+    """
+    Quantize embeddings and write the index files.
+
+    Args:
+        ids: Chunk ids aligned with embeddings (as stored in Chroma)
+        embeddings: Float embeddings, one per chunk
+        metadatas: Optional chunk metadata, used to support partition filters
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    vectors = _normalize(embeddings)
+
+    # Symmetric per-dimension int8 quantization
+    scales = np.abs(vectors).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+
+    # One bit per dimension: the sign of each component
+    bits = np.packbits(vectors > 0, axis=1)
+
+    np.save(os.path.join(index_dir, "vectors_f32.npy"), vectors)
+    np.save(os.path.join(index_dir, "codes_int8.npy"), codes)
+    np.save(os.path.join(index_dir, "scales.npy"), scales.astype(np.float32))
+    np.save(os.path.join(index_dir, "codes_binary.npy"), bits)
+
+    info = {
+        "ids": list(ids),
+        "dim": int(vectors.shape[1]),
+        "series": [m.get("series", "") for m in metadatas] if metadatas else None,
+        "sources": [m.get("source", "") for m in metadatas] if metadatas else None,
+        # Partition flags of canonical chunks that stand in for duplicate pages
+        "copies": {i: flags for i, flags in enumerate(partitions.copy_flags(m) for m in metadatas) if flags}
+                  if metadatas else None
+    }
+    with open(os.path.join(index_dir, "index.json"), "w") as f:
+        json.dump(info, f)
+
+    logger.info(f"Built quantized index for {len(ids)} vectors: "
+                f"float32 {vectors.nbytes / 1e6:.1f} MB, int8 {codes.nbytes / 1e6:.1f} MB, "
+                f"binary {bits.nbytes / 1e6:.1f} MB")
+
+class QuantizedIndex:
+    """Searchable quantized index; mode is "int8" or "binary"."""
+
+    def __init__(self, index_dir=INDEX_DIR, mode="int8"):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+
+        with open(os.path.join(index_dir, "index.json"), "r") as f:
+            info = json.load(f)
+        self.ids = info["ids"]
+        self.series = np.array(info["series"]) if info.get("series") else None
+        self.sources = np.array(info["sources"]) if info.get("sources") else None
+        self.copies = {int(i): set(flags) for i, flags in (info.get("copies") or {}).items()}
+
+        # Only the compact codes are loaded; float vectors are read on demand for rescoring
+        self.vectors = np.load(os.path.join(index_dir, "vectors_f32.npy"), mmap_mode="r")
+        if mode == "int8":
+            self.codes = np.load(os.path.join(index_dir, "codes_int8.npy"))
+            self.scales = np.load(os.path.join(index_dir, "scales.npy"))
+        else:
+            self.codes = np.load(os.path.join(index_dir, "codes_binary.npy"))
+
+    @property
+    def memory_bytes(self):
+        """Resident size of the codes."""
+        return self.codes.nbytes
+
+    def partition_mask(self, series=None, sources=None):
+        """Boolean row mask for a partition filter (None if unscoped)."""
+        if not series and not sources:
+            return None
+        if self.series is None:
+            raise ValueError("Index was built without metadata; rebuild it to filter by partition")
+        mask = np.zeros(len(self.ids), dtype=bool)
+        if series:
+            mask |= np.isin(self.series, list(series))
+        if sources:
+            mask |= np.isin(self.sources, list(sources))
+        wanted = set(partitions.partition_flags(series, sources))
+        for i, flags in self.copies.items():
+            if flags & wanted:
+                mask[i] = True
+        return mask
+
+    def _approximate_scores(self, query):
+        """Score all rows against the query using the compact codes."""
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0)
+            # Fewer differing bits means more similar; negate so higher is better
+            return -_popcount(np.bitwise_xor(self.codes, query_bits)).sum(axis=1, dtype=np.int32)
+
+        # Fold the per-dimension scales into the query instead of de-quantizing the codes
+        scaled_query = (query * self.scales).astype(np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), _SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + _SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        return scores
+
+    def search(self, query_embedding, k=SEARCH_TOP_K, rescore_candidates=QUANTIZED_RESCORE_CANDIDATES,
+               mask=None):
+        """
+        Find the k most similar chunks.
+
+        Returns:
+            Tuple of (ids, cosine similarities, float embeddings), most similar first
+        """
+        query = _normalize(query_embedding).reshape(-1)
+        scores = self._approximate_scores(query).astype(np.float32)
+        if mask is not None:
+            scores[~mask] = -np.inf
+            available = int(mask.sum())
+        else:
+            available = len(scores)
+
+        n_candidates = min(max(rescore_candidates, k), available)
+        if n_candidates == 0:
+            return [], np.zeros(0, dtype=np.float32), np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+
+        # Exact rescoring with the memory-mapped float vectors
+        candidates.sort()
+        candidate_vectors = np.asarray(self.vectors[candidates])
+        exact = candidate_vectors @ query
+        order = np.argsort(-exact)[:k]
+
+        return ([self.ids[candidates[i]] for i in order], exact[order], candidate_vectors[order])
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index(mode=VECTOR_STORE):
+    """Return the shared quantized index (loaded on first use)."""
+    global _index
+    with _index_lock:
+        if _index is None or _index.mode != mode:
+            start = time.time()
+            _index = QuantizedIndex(mode=mode)
+            logger.info(f"Loaded {mode} index with {len(_index.ids)} vectors "
+                        f"({_index.memory_bytes / 1e6:.1f} MB) in {time.time() - start:.2f} seconds")
+        return _index
+
+def evaluate_recall(embeddings, queries, k=SEARCH_TOP_K, rescore_candidates=QUANTIZED_RESCORE_CANDIDATES,
+                    index_dir=INDEX_DIR):
+    """
+    Measure recall@k of each quantized mode against exact float search.
+
+    Returns:
+        Dict mapping mode to recall, mean query latency and resident memory
+    """
+    vectors = _normalize(embeddings)
+    queries = _normalize(queries)
+    truth = [set(np.argsort(-(vectors @ q))[:k].tolist()) for q in queries]
+
+    report = {"float32": {"memory_mb": vectors.nbytes / 1e6}}
+    for mode in ("int8", "binary"):
+        index = QuantizedIndex(index_dir=index_dir, mode=mode)
+        position = {chunk_id: i for i, chunk_id in enumerate(index.ids)}
+        hits = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            found, _, _ = index.search(q, k=k, rescore_candidates=rescore_candidates)
+            hits += len(expected & {position[chunk_id] for chunk_id in found})
+        elapsed = time.perf_counter() - start
+        report[mode] = {
+            "recall": hits / (k * len(queries)) if len(queries) else 0.0,
+            "mean_query_ms": 1000 * elapsed / max(len(queries), 1),
+            "memory_mb": index.memory_bytes / 1e6
+        }
+    return report
+
+def _load_processed():
+    with open(os.path.join(PROCESSED_DIR, "chunked_docs.pkl"), "rb") as f:
+        documents = pickle.load(f)
+    with open(os.path.join(PROCESSED_DIR, "embeddings.pkl"), "rb") as f:
+        embeddings = pickle.load(f)
+    return documents, embeddings
+
+if __name__ == "__main__":
+    setup_logging("quantized_index.log")
+
+    parser = argparse.ArgumentParser(description="Quantized vector index")
+    parser.add_argument("--build", action="store_true", help="Build the index from processed embeddings")
+    parser.add_argument("--evaluate", action="store_true", help="Report recall against exact float search")
+    parser.add_argument("--queries", type=int, default=200, help="Number of sample queries for --evaluate")
+    parser.add_argument("--k", type=int, default=SEARCH_TOP_K)
+    args = parser.parse_args()
+
+    documents, embeddings = _load_processed()
+
+    if args.build:
+        build_index([doc["metadata"].get("chunk_id", f"doc_{i}") for i, doc in enumerate(documents)], embeddings,
+                    [doc["metadata"] for doc in documents])
+
+    if args.evaluate:
+        # Use perturbed stored vectors as sample queries
+        rng = np.random.default_rng(0)
+        sample = np.asarray(embeddings, dtype=np.float32)[
+            rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)]
+        sample += rng.normal(0, 0.05, sample.shape).astype(np.float32)
+        report = evaluate_recall(embeddings, sample, k=args.k)
+        for mode, stats in report.items():
+            details = ", ".join(f"{key}={value:.3f}" for key, value in stats.items())
+            print(f"{mode:<8} {details}")
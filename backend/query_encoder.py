@@ -0,0 +1,93 @@
+# query_encoder.py
+"""
+Shared query-encoding service with dynamic micro-batching.
+
+Concurrent /ask requests submit their query text to a single background worker,
+which waits up to QUERY_BATCH_WAIT_MS for more queries (or until QUERY_BATCH_MAX
+are queued), encodes them in one embedding call and hands the vectors back to the
+waiting requests. This uses the model's batch efficiency instead of having many
+threads contend on the same weights one query at a time.
+"""
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+import metrics
+from config import QUERY_BATCH_WAIT_MS, QUERY_BATCH_MAX, REQUEST_TIMEOUT
+
+logger = logging.getLogger("query_encoder")
+
+class QueryBatcher:
+    """Collects queries from many threads and encodes them in batches."""
+
+    def __init__(self, embed_fn, max_wait_ms=QUERY_BATCH_WAIT_MS, max_batch=QUERY_BATCH_MAX):
+        """
+        Args:
+            embed_fn: Callable mapping a list of texts to a list of vectors
+        """
+        self.embed_fn = embed_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queue a text for encoding and return a Future for its vector."""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, texts, timeout=REQUEST_TIMEOUT):
+        """Encode texts (possibly batched with other callers' texts) and return their vectors."""
+        futures = [self.submit(text) for text in texts]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _, _ in batch]
+            now = time.perf_counter()
+            for _, _, queued_at in batch:
+                metrics.observe("qa_query_batch_wait_seconds", now - queued_at,
+                                "Time queries wait to be batched for encoding")
+            metrics.observe("qa_query_batch_size", len(batch), "Queries encoded per batch",
+                            buckets=[1, 2, 4, 8, 16, 32, 64, 128])
+
+            try:
+                vectors = self.embed_fn(texts)
+            except Exception as e:
+                logger.error(f"Error encoding query batch of {len(batch)}: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher(embed_fn):
+    """Return the process-wide batcher, starting it on first use."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = QueryBatcher(embed_fn)
+        return _batcher
@@ -0,0 +1,103 @@
+# retrieval.py
+"""
+Result selection for retrieval: relevance floor, adaptive top-k and
+maximal-marginal-relevance (MMR) diversification.
+"""
+import numpy as np
+
+from config import (
+    MINIMUM_RELEVANCE, MMR_LAMBDA, MMR_DUPLICATE_SIMILARITY, RELEVANCE_CLIFF_GAP,
+    ADAPTIVE_MIN_K, RETRIEVAL_MODE
+)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def adaptive_cutoff(relevances, min_relevance=MINIMUM_RELEVANCE, cliff_gap=RELEVANCE_CLIFF_GAP,
+                    min_k=ADAPTIVE_MIN_K):
+    """
+    Decide how many of the (descending) relevance scores are worth keeping.
+
+    Scores below min_relevance are always dropped. Beyond the first min_k
+    results, the list is also cut where the score falls off a cliff, i.e. drops
+    by more than cliff_gap compared to the previous result.
+
+    Returns:
+        Number of leading results to keep
+    """
+    keep = 0
+    for i, score in enumerate(relevances):
+        if score < min_relevance:
+            break
+        if i >= min_k and relevances[i - 1] - score > cliff_gap:
+            break
+        keep += 1
+    return keep
+
+def mmr_select(candidate_embeddings, relevances, k, lambda_mult=MMR_LAMBDA,
+               duplicate_similarity=MMR_DUPLICATE_SIMILARITY):
+    """
+    Select k candidates by maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    lambda * relevance - (1 - lambda) * max similarity to already selected ones,
+    which skips near-duplicate chunks (e.g. from CHUNK_OVERLAP or boilerplate).
+    Candidates at least duplicate_similarity similar to a selected one are
+    never picked, so fewer than k indices may be returned.
+
+    Returns:
+        List of selected candidate indices, in selection order
+    """
+    if k <= 0 or len(candidate_embeddings) == 0:
+        return []
+
+    candidates = _normalize(candidate_embeddings)
+    relevances = np.asarray(relevances, dtype=np.float32)
+
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(relevances))]
+    max_similarity = similarity[selected[0]].copy()
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevances - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        scores[max_similarity >= duplicate_similarity] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            break
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+    return selected
+
+def select_results(context, embeddings, k, mode=RETRIEVAL_MODE):
+    """
+    Choose which retrieved candidates to keep.
+
+    In "similarity" mode the top k candidates above MINIMUM_RELEVANCE are kept.
+    In "mmr" mode the candidate list is additionally cut adaptively where scores
+    fall off a cliff, and the survivors are diversified with MMR.
+
+    Args:
+        context: Candidate context entries with a "relevance" score
+        embeddings: Candidate embeddings aligned with context (needed for "mmr")
+        k: Maximum number of results
+
+    Returns:
+        The selected context entries, most relevant first
+    """
+    order = sorted(range(len(context)), key=lambda i: context[i]["relevance"], reverse=True)
+    relevances = [context[i]["relevance"] for i in order]
+
+    if mode != "mmr" or embeddings is None:
+        keep = sum(1 for score in relevances[:k] if score >= MINIMUM_RELEVANCE)
+        return [context[i] for i in order[:keep]]
+
+    keep = adaptive_cutoff(relevances)
+    survivors = order[:keep]
+    picks = mmr_select([embeddings[i] for i in survivors], relevances[:keep], k)
+    selected = [context[survivors[p]] for p in picks]
+    return sorted(selected, key=lambda x: x["relevance"], reverse=True)
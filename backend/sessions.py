@@ -0,0 +1,99 @@
+# sessions.py
+"""
+Bounded, expiring in-memory store for multi-turn chat sessions.
+
+A session keeps the Ollama `context` token array returned by the previous
+generation, so a follow-up turn only has to prefill its new excerpts and question
+instead of the full prompt.
+"""
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from config import SESSION_MAX_COUNT, SESSION_TTL, SESSION_MAX_TURNS
+
+_lock = threading.Lock()
+_sessions = OrderedDict()
+
+def _new_session(session_id=None):
+    now = time.time()
+    return {
+        "id": session_id or uuid.uuid4().hex,
+        "created": now,
+        "last_used": now,
+        "ollama_context": None,  # Token array returned by the last Ollama generation
+        "model": None,           # Model that produced ollama_context
+        "sent_chunk_ids": [],    # Chunks already present in ollama_context
+        "turns": []              # Recent (query, answer) pairs
+    }
+
+def _evict_expired(now):
+    """Drop expired sessions (oldest first) and enforce the size bound."""
+    while _sessions:
+        oldest_id, oldest = next(iter(_sessions.items()))
+        if now - oldest["last_used"] > SESSION_TTL or len(_sessions) > SESSION_MAX_COUNT:
+            del _sessions[oldest_id]
+        else:
+            break
+
+def get_session(session_id=None):
+    """
+    Return the session for session_id, creating a new one if it is unknown or expired.
+
+    The returned dict is a snapshot; persist changes with update_session().
+    """
+    now = time.time()
+    with _lock:
+        _evict_expired(now)
+        session = _sessions.get(session_id) if session_id else None
+        if session is None:
+            session = _new_session(session_id)
+            _sessions[session["id"]] = session
+        session["last_used"] = now
+        _sessions.move_to_end(session["id"])
+        _evict_expired(now)
+        return dict(session, turns=list(session["turns"]),
+                    sent_chunk_ids=list(session["sent_chunk_ids"]))
+
+def peek_session(session_id):
+    """Return a snapshot of a live session without creating or refreshing it (None if unknown)."""
+    with _lock:
+        session = _sessions.get(session_id) if session_id else None
+        if session is None or time.time() - session["last_used"] > SESSION_TTL:
+            return None
+        return dict(session, turns=list(session["turns"]),
+                    sent_chunk_ids=list(session["sent_chunk_ids"]))
+
+def update_session(session_id, query, answer, ollama_context=None, model=None, chunk_ids=None,
+                   reset_context=False):
+    """Record a completed turn and the Ollama context it produced."""
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return
+
+        if reset_context:
+            session["ollama_context"] = None
+            session["sent_chunk_ids"] = []
+        if ollama_context is not None:
+            session["ollama_context"] = ollama_context
+            session["model"] = model
+            session["sent_chunk_ids"].extend(cid for cid in (chunk_ids or [])
+                                             if cid not in session["sent_chunk_ids"])
+
+        session["turns"].append((query, answer))
+        del session["turns"][:-SESSION_MAX_TURNS]
+        session["last_used"] = time.time()
+        _sessions.move_to_end(session_id)
+
+def clear_session(session_id):
+    """Forget a session."""
+    with _lock:
+        _sessions.pop(session_id, None)
+
+def session_count():
+    """Number of live sessions."""
+    with _lock:
+        _evict_expired(time.time())
+        return len(_sessions)
@@ -0,0 +1,214 @@
+# static_assets.py
+"""
+In-memory serving of the React build with precompressed variants.
+
+At startup every file under static/react is read once, hashed for its ETag and
+compressed with gzip (and brotli, if the `brotli` package is installed). Requests
+are then answered from memory without touching the filesystem:
+
+- Vite's content-hashed files (assets/index-<hash>.js) are cached as immutable
+- index.html and other unhashed files are revalidated with their ETag (304s)
+
+Each encoding of a file is a different representation, so it gets its own
+strong ETag (the content hash plus "-gz"/"-br"); If-None-Match matches any of
+them, since they all carry the same content.
+
+Usage:
+    python static_assets.py --precompress   # Also write .gz/.br files for a reverse proxy
+"""
+import os
+import re
+import gzip
+import hashlib
+import logging
+import argparse
+import mimetypes
+
+from flask import Response
+
+from logging_setup import setup_logging
+from config import STATIC_DIR, STATIC_COMPRESSION_MIN_SIZE, STATIC_IMMUTABLE_MAX_AGE
+
+logger = logging.getLogger("static_assets")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+REACT_DIR = os.path.join(STATIC_DIR, "react")
+FRONTEND_SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "src")
+
+# Vite names built assets <name>-<8+ char content hash>.<ext>
+_HASHED_NAME_PATTERN = re.compile(r"-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+
+_ETAG_SUFFIXES = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml",
+                       "application/xml", "application/manifest+json")
+
+class Asset:
+    """A static file held in memory with its compressed variants."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+        self.immutable = path.startswith("assets/") and bool(_HASHED_NAME_PATTERN.search(path))
+        self.variants = {"identity": data}
+
+        if len(data) >= STATIC_COMPRESSION_MIN_SIZE and self.mimetype.startswith(_COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.variants["br"] = compressed
+
+    def etag_for(self, encoding):
+        return self.etag + _ETAG_SUFFIXES[encoding]
+
+    def matches(self, if_none_match):
+        """True if an If-None-Match header names any variant of this asset (weak comparison)."""
+        if if_none_match.star_tag:
+            return True
+        for tag in if_none_match.as_set(include_weak=True):
+            for suffix in _ETAG_SUFFIXES.values():
+                if suffix and tag.endswith(suffix):
+                    tag = tag[:-len(suffix)]
+                    break
+            if tag == self.etag:
+                return True
+        return False
+
+    @property
+    def cache_control(self):
+        if self.immutable:
+            return f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        # Unhashed files (index.html in particular) must be revalidated so new builds are picked up
+        return "no-cache"
+
+def _warn_if_stale(root, src_dir=FRONTEND_SRC_DIR):
+    """Warn when the frontend sources changed after the build (the UI would lack those changes)."""
+    index_path = os.path.join(root, "index.html")
+    if not os.path.isdir(src_dir) or not os.path.exists(index_path):
+        return
+    built = os.path.getmtime(index_path)
+    for dir_path, _, file_names in os.walk(src_dir):
+        for file_name in file_names:
+            if os.path.getmtime(os.path.join(dir_path, file_name)) > built:
+                logger.warning(f"The React build in {root} is older than frontend/src; "
+                               f"run 'npm run build' in frontend/ (or ./start-app.sh --rebuild)")
+                return
+
+def build_manifest(root=REACT_DIR):
+    """
+    Load every file under root into memory.
+
+    Returns:
+        Dict mapping URL path (relative to root, with forward slashes) to Asset
+    """
+    manifest = {}
+    if not os.path.isdir(root):
+        logger.warning(f"React build not found at {root}; run 'npm run build' in frontend/")
+        return manifest
+
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith((".gz", ".br")):
+                continue
+            full_path = os.path.join(dir_path, file_name)
+            url_path = os.path.relpath(full_path, root).replace(os.sep, "/")
+            with open(full_path, "rb") as f:
+                manifest[url_path] = Asset(url_path, f.read())
+
+    _warn_if_stale(root)
+    total = sum(len(a.variants["identity"]) for a in manifest.values())
+    logger.info(f"Loaded {len(manifest)} static assets ({total / 1024:.0f} KB) from {root}, "
+                f"brotli {'enabled' if brotli is not None else 'unavailable'}")
+    return manifest
+
+def _accepted_encodings(accept_encoding):
+    """Parse Accept-Encoding into {coding: q-value}."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+def _choose_encoding(asset, accept_encoding):
+    """Pick the best available encoding the client accepts (q > 0)."""
+    weights = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+def serve(manifest, path, request):
+    """
+    Build the response for a static path, falling back to index.html for client-side routes.
+
+    Args:
+        manifest: Result of build_manifest()
+        path: Requested URL path relative to the React root
+        request: The Flask request (for Accept-Encoding and If-None-Match)
+    """
+    asset = manifest.get(path) if path else None
+    if asset is None:
+        if path.startswith("assets/"):
+            # A stale build reference; don't answer a script request with HTML
+            return Response("Not found", status=404, mimetype="text/plain")
+        asset = manifest.get("index.html")
+        if asset is None:
+            return Response("Frontend not built", status=404, mimetype="text/plain")
+
+    encoding = _choose_encoding(asset, request.headers.get("Accept-Encoding", ""))
+    headers = {
+        "ETag": f'"{asset.etag_for(encoding)}"',
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding"
+    }
+
+    # If-None-Match uses weak comparison (RFC 9110), so W/"..." tags added by
+    # recompressing proxies still match
+    if asset.matches(request.if_none_match):
+        return Response(status=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.variants[encoding], mimetype=asset.mimetype, headers=headers)
+
+def precompress(root=REACT_DIR):
+    """Write .gz/.br files next to the build so a reverse proxy can serve them directly."""
+    for asset in build_manifest(root).values():
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if encoding in asset.variants:
+                with open(os.path.join(root, asset.path) + suffix, "wb") as f:
+                    f.write(asset.variants[encoding])
+                logger.info(f"Wrote {asset.path}{suffix}")
+
+if __name__ == "__main__":
+    setup_logging("static_assets.log")
+
+    parser = argparse.ArgumentParser(description="Static asset manifest for the React build")
+    parser.add_argument("--precompress", action="store_true", help="Write .gz/.br files for a reverse proxy")
+    args = parser.parse_args()
+
+    if args.precompress:
+        precompress()
+    else:
+        for path, asset in sorted(build_manifest().items()):
+            sizes = ", ".join(f"{enc} {len(data)}" for enc, data in asset.variants.items())
+            print(f"{path:<40} {'immutable' if asset.immutable else 'revalidate':<10} {sizes}")
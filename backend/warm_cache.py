@@ -0,0 +1,241 @@
+# warm_cache.py
+"""
+Offline cache-warming job for frequently asked questions.
+
+After a re-index or a deploy the response cache starts cold. This job collects
+the most frequent questions from the response cache, the feedback files and the
+request log, and pre-generates their answers so they are cache hits for the first
+users. Progress is journaled, so an interrupted run picks up where it stopped.
+
+Usage:
+    python warm_cache.py                      # Warm the top WARM_CACHE_TOP_N questions now
+    python warm_cache.py --start-at 02:00     # Wait for the off-peak window, then warm
+    python warm_cache.py --stop-at 06:00      # Stop (resumable) when the window ends
+    python warm_cache.py --list               # Only show the questions that would be warmed
+"""
+import os
+import re
+import sys
+import json
+import glob
+import time
+import logging
+import argparse
+import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import feedback_store
+from logging_setup import setup_logging
+from config import (
+    CACHE_DIR, CACHE_SIZE, CHROMA_DB_DIR, WARM_CACHE_TOP_N, WARM_CACHE_CONCURRENCY,
+    WARM_CACHE_STATE, WARM_CACHE_LOG_FILES, MODEL_ROUTING_ENABLED, FAST_MODEL, ROUTING_QUEUE_DEPTH
+)
+
+logger = logging.getLogger("warm_cache")
+
+_QUERY_LOG_PATTERN = re.compile(r"^Received query: (.+)$")
+
+def _log_message(line):
+    """Message of a log line, for JSON lines as well as the older plain-text format."""
+    line = line.rstrip("\n")
+    if line.startswith("{"):
+        try:
+            return json.loads(line).get("message", "")
+        except ValueError:
+            return ""
+    return line.split(" - ", 3)[-1]
+
+def _normalize(question):
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+def collect_questions(cache_dir=CACHE_DIR, log_files=WARM_CACHE_LOG_FILES):
+    """
+    Count how often each question was asked.
+
+    Questions are grouped case- and whitespace-insensitively; the most common
+    spelling is kept as the representative.
+
+    Returns:
+        List of (question, count) tuples, most frequent first
+    """
+    counts = Counter()
+    spellings = {}
+
+    def add(question):
+        question = question.strip()
+        if not question:
+            return
+        key = _normalize(question)
+        counts[key] += 1
+        spellings.setdefault(key, Counter())[question] += 1
+
+    # Cached responses record the question that was asked
+    for path in glob.glob(os.path.join(cache_dir, "*.json")):
+        try:
+            with open(path, "r") as f:
+                add(json.load(f).get("query", ""))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable file {path}: {str(e)}")
+
+    for question in feedback_store.all_queries():
+        add(question)
+
+    # The request log has one "Received query" line per /ask request (rotated logs included)
+    for pattern in log_files:
+        for path in glob.glob(pattern):
+            try:
+                with open(path, "r", errors="replace") as f:
+                    for line in f:
+                        match = _QUERY_LOG_PATTERN.match(_log_message(line))
+                        if match:
+                            add(match.group(1))
+            except OSError as e:
+                logger.warning(f"Skipping unreadable log {path}: {str(e)}")
+
+    return [(spellings[key].most_common(1)[0][0], n) for key, n in counts.most_common()]
+
+def _index_version():
+    """Modification time of the vector database, which changes on every rebuild."""
+    path = os.path.join(CHROMA_DB_DIR, "chroma.sqlite3")
+    return os.path.getmtime(path) if os.path.exists(path) else 0
+
+def _load_state(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable warm-up journal: {str(e)}")
+    return None
+
+def _save_state(state, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _next_occurrence(clock_time):
+    """Datetime of the next occurrence of a local HH:MM time."""
+    now = datetime.datetime.now()
+    hour, minute = map(int, clock_time.split(":"))
+    moment = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if moment <= now:
+        moment += datetime.timedelta(days=1)
+    return moment
+
+def wait_until(clock_time):
+    """Sleep until the next occurrence of a local HH:MM time."""
+    start = _next_occurrence(clock_time)
+    logger.info(f"Waiting until {start:%Y-%m-%d %H:%M} to start warming the cache")
+    time.sleep(max((start - datetime.datetime.now()).total_seconds(), 0))
+
+def warm(top_n=WARM_CACHE_TOP_N, concurrency=WARM_CACHE_CONCURRENCY, state_file=WARM_CACHE_STATE,
+         stop_at=None, fresh=False):
+    """
+    Pre-generate answers for the most frequent questions.
+
+    Args:
+        top_n: Number of questions to warm (capped so their answers fit in
+            CACHE_SIZE, beyond which warmed answers would evict each other)
+        concurrency: Maximum number of simultaneous Ollama generations
+        state_file: Journal of completed questions, used to resume
+        stop_at: Optional local HH:MM time after which no new question is started
+        fresh: Ignore the journal and warm every question again
+
+    Returns:
+        Dict with counts of generated, already cached, failed and skipped questions
+    """
+    # Imported here so --list works without loading the embedding model
+    import qa_system
+    import model_router
+
+    # With model routing a question can be answered by either model, one cache entry each
+    answers_per_question = 2 if MODEL_ROUTING_ENABLED and FAST_MODEL and ROUTING_QUEUE_DEPTH else 1
+    max_questions = CACHE_SIZE // answers_per_question
+    if top_n > max_questions:
+        logger.warning(f"Only {CACHE_SIZE} responses fit in the cache (CACHE_SIZE); "
+                       f"warming {max_questions} questions")
+        top_n = max_questions
+
+    # Resume only a journal written against the current index
+    version = _index_version()
+    state = None if fresh else _load_state(state_file)
+    if state is None or state.get("index_version") != version:
+        questions = [q for q, _ in collect_questions()[:top_n]]
+        state = {"index_version": version, "questions": questions, "done": []}
+        _save_state(state, state_file)
+    else:
+        logger.info(f"Resuming warm-up: {len(state['done'])}/{len(state['questions'])} questions done")
+
+    done = set(state["done"])
+    pending = [q for q in state["questions"] if q not in done]
+    stats = {"generated": 0, "cached": 0, "failed": 0, "skipped": 0}
+    if not pending:
+        logger.info("Cache is already warm")
+        return stats
+
+    deadline = _next_occurrence(stop_at).timestamp() if stop_at else None
+
+    # Open the shared collection once before the workers race to do it
+    qa_system.get_collection()
+
+    def warm_one(question):
+        if deadline is not None and time.time() >= deadline:
+            return question, "skipped"
+        context = qa_system.get_relevant_context(question)
+        if not context:
+            # Nothing relevant in the index; there is no answer worth caching
+            return question, "failed"
+        # Responses are cached per model, and under load /ask may route the question
+        # to another model than when idle, so warm the answer of each one
+        outcome = "cached"
+        for routing in model_router.possible_routes(question, context):
+            timings = {}
+            answer, _ = qa_system.answer_with_local_llm(question, context=context, timings=timings,
+                                                        routing=routing)
+            if answer.startswith("Error:"):
+                logger.warning(f"Could not warm '{question[:50]}' with {routing['model']}: {answer}")
+                return question, "failed"
+            if not timings.get("cache_hit"):
+                outcome = "generated"
+        return question, outcome
+
+    start_time = time.time()
+    logger.info(f"Warming {len(pending)} questions with concurrency {concurrency}")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(warm_one, question) for question in pending]
+        for future in as_completed(futures):
+            question, outcome = future.result()
+            stats[outcome] += 1
+            if outcome in ("generated", "cached"):
+                state["done"].append(question)
+                _save_state(state, state_file)
+            logger.info(f"[{sum(stats.values())}/{len(pending)}] {outcome}: {question[:60]}")
+
+    logger.info(f"Cache warm-up finished in {time.time() - start_time:.1f} seconds: "
+                + ", ".join(f"{n} {outcome}" for outcome, n in stats.items()))
+    return stats
+
+if __name__ == "__main__":
+    setup_logging("warm_cache.log")
+
+    parser = argparse.ArgumentParser(description="Pre-generate answers for frequent questions")
+    parser.add_argument("--top", type=int, default=WARM_CACHE_TOP_N, help="Number of questions to warm")
+    parser.add_argument("--concurrency", type=int, default=WARM_CACHE_CONCURRENCY,
+                        help="Maximum simultaneous Ollama generations")
+    parser.add_argument("--start-at", help="Local HH:MM time to start (off-peak window)")
+    parser.add_argument("--stop-at", help="Local HH:MM time after which no new question is started")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the resume journal")
+    parser.add_argument("--list", action="store_true", help="List the most frequent questions and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for question, count in collect_questions()[:args.top]:
+            print(f"{count:5d}  {question}")
+        sys.exit(0)
+
+    if args.start_at:
+        wait_until(args.start_at)
+    stats = warm(top_n=args.top, concurrency=args.concurrency, stop_at=args.stop_at, fresh=args.fresh)
+    sys.exit(1 if stats["failed"] and not stats["generated"] + stats["cached"] else 0)
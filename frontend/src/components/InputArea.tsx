@@ -3,6 +3,10 @@ import { Send } from "lucide-react";
 import FeedbackSection from "./FeedbackSection";
 import useAPI from "../hooks/useAPI";
 
+// Wait for a pause in typing before retrieving context for the partial question
+const PREFETCH_DELAY_MS = 400;
+const PREFETCH_MIN_CHARS = 12;
+
 interface InputAreaProps {
   onSendMessage: (message: string) => void;
   showFeedback: boolean;
@@ -19,7 +23,7 @@ const InputArea: React.FC<InputAreaProps> = ({
   const [inputValue, setInputValue] = useState<string>("");
   const [backendStatus, setBackendStatus] = useState<boolean>(false);
   const inputRef = useRef<HTMLInputElement>(null);
-  const { checkSystemStatus } = useAPI();
+  const { checkSystemStatus, prefetch } = useAPI();
 
   useEffect(() => {
     const checkStatus = async () => {
@@ -40,6 +44,15 @@ const InputArea: React.FC<InputAreaProps> = ({
     return () => clearInterval(interval);
   }, [checkSystemStatus]);
 
+  useEffect(() => {
+    const query = inputValue.trim();
+    if (!backendStatus || query.length < PREFETCH_MIN_CHARS) {
+      return;
+    }
+    const timer = setTimeout(() => prefetch(query), PREFETCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [inputValue, backendStatus, prefetch]);
+
   const handleSubmit = (e: FormEvent<HTMLFormElement>): void => {
     e.preventDefault();
     if (inputValue.trim() && backendStatus) {
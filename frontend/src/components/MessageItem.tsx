@@ -12,12 +12,19 @@ const MessageItem: React.FC<MessageItemProps> = ({ message, type }) => {
   const formatSources = (sources: Source[]): JSX.Element => {
     // Group pages by document
     const uniqueSources: Record<string, Set<number>> = {};
+    const otherDocuments: Record<string, Set<string>> = {};
     sources.forEach(source => {
       const key = source.document;
       if (!uniqueSources[key]) {
         uniqueSources[key] = new Set<number>();
+        otherDocuments[key] = new Set<string>();
       }
       uniqueSources[key].add(source.page);
+      (source.also_in || []).forEach(ref => {
+        if (ref.document !== key) {
+          otherDocuments[key].add(ref.document);
+        }
+      });
     });
 
     return (
@@ -31,6 +38,11 @@ const MessageItem: React.FC<MessageItemProps> = ({ message, type }) => {
                 <li key={page} className="my-0.5">Page {page}</li>
               ))}
             </ul>
+            {otherDocuments[document].size > 0 && (
+              <div className="pl-4 italic" title={Array.from(otherDocuments[document]).join(', ')}>
+                Also in {otherDocuments[document].size} other document{otherDocuments[document].size > 1 ? 's' : ''}
+              </div>
+            )}
           </div>
         ))}
       </div>
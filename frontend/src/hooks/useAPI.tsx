@@ -1,13 +1,13 @@
-import { useState } from 'react';
+import { useState, useRef, useEffect, useCallback } from 'react';
 import axios, { AxiosResponse } from 'axios';
-import { SystemStatus, Source } from '../types';
+import { SystemStatus, Source, Timing } from '../types';
 
 interface QueryResponse {
   answer: string;
   sources: Source[];
-  timing?: {
-    total_seconds: number;
-  };
+  timing?: Timing;
+  session_id?: string;
+  model?: string;
   error?: string;
 }
 
@@ -23,9 +23,40 @@ interface FeedbackResponse {
   message?: string;
 }
 
+// Identifies this browser tab to /prefetch, so /ask can reuse context retrieved while typing
+const clientId = Math.random().toString(16).slice(2) + Date.now().toString(16);
+// Server-side conversation session, so follow-up questions keep their context. Shared by
+// every component using the hook, since prefetching must retrieve for the same session.
+let sessionId: string | null = null;
+
 const useAPI = () => {
     const [loading, setLoading] = useState<boolean>(false);
     const [error, setError] = useState<string | null>(null);
+    // The /ask request in flight, so it can be cancelled on the server when abandoned
+    const activeQuery = useRef<{ id: string; controller: AbortController } | null>(null);
+  
+    // Stop the server-side generation of an abandoned question. sendBeacon still
+    // gets through while the page is being closed.
+    const cancelQuery = (): void => {
+      const active = activeQuery.current;
+      if (!active) {
+        return;
+      }
+      activeQuery.current = null;
+      active.controller.abort();
+      const body = new Blob([JSON.stringify({ request_id: active.id })], { type: 'application/json' });
+      if (!navigator.sendBeacon || !navigator.sendBeacon('/ask/cancel', body)) {
+        axios.post('/ask/cancel', { request_id: active.id }).catch(() => undefined);
+      }
+    };
+  
+    useEffect(() => {
+      window.addEventListener('pagehide', cancelQuery);
+      return () => {
+        window.removeEventListener('pagehide', cancelQuery);
+        cancelQuery();
+      };
+    }, []);
   
     // Function to get system status
     const checkSystemStatus = async (): Promise<SystemStatus> => {
@@ -49,20 +80,51 @@ const useAPI = () => {
   
     // Function to send a query
     const sendQuery = async (query: string): Promise<QueryResponse> => {
+      // A new question replaces any that is still being answered
+      cancelQuery();
+      const active = {
+        id: Math.random().toString(16).slice(2, 10) + Date.now().toString(16),
+        controller: new AbortController(),
+      };
+      activeQuery.current = active;
       try {
         setLoading(true);
         setError(null);
-        const response: AxiosResponse<QueryResponse> = await axios.post('/ask', { query });
+        const response: AxiosResponse<QueryResponse> = await axios.post('/ask', {
+          query,
+          session_id: sessionId,
+          client_id: clientId,
+        }, {
+          headers: { 'X-Request-ID': active.id },
+          signal: active.controller.signal,
+        });
+        if (response.data.session_id) {
+          sessionId = response.data.session_id;
+        }
         return response.data;
       } catch (err) {
         const errorMessage = err instanceof Error ? err.message : 'Failed to process query';
         setError(errorMessage);
         throw new Error(errorMessage);
       } finally {
+        if (activeQuery.current === active) {
+          activeQuery.current = null;
+        }
         setLoading(false);
       }
     };
   
+    // Retrieve context for a partially typed question ahead of submission. Failures
+    // don't matter: /ask simply retrieves the context itself. Stable across renders,
+    // so the debounce timer in InputArea isn't restarted by unrelated re-renders.
+    const prefetch = useCallback((query: string): void => {
+      axios.post('/prefetch', {
+        query,
+        session_id: sessionId,
+        client_id: clientId,
+      }).catch(() => undefined);
+    }, []);
+  
     // Function to send feedback
     const sendFeedback = async (queryData: FeedbackData): Promise<FeedbackResponse> => {
       try {
@@ -84,6 +146,8 @@ const useAPI = () => {
       error,
       checkSystemStatus,
       sendQuery,
+      cancelQuery,
+      prefetch,
       sendFeedback,
     };
   };
@@ -4,15 +4,21 @@ export interface Message {
     isLoading?: boolean;
     error?: string;
     sources?: Source[];
-    timing?: {
-      total_seconds: number;
-    };
+    timing?: Timing;
+  }
+  
+  export interface Timing {
+    total_seconds: number;
+    // Per-stage breakdown, only present when requested with timing_detail
+    stages?: Record<string, number | boolean>;
   }
   
   export interface Source {
     document: string;
     page: number;
     section?: string;
+    // Other documents containing the same page (collapsed as a near-duplicate at ingestion)
+    also_in?: { document: string; page: number }[];
   }
   
   export interface SystemStatus {
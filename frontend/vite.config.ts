@@ -10,6 +10,7 @@ export default defineConfig({
   server: {
     proxy: {
       '/ask': 'http://localhost:5000',
+      '/prefetch': 'http://localhost:5000',
       '/status': 'http://localhost:5000',
       '/feedback': 'http://localhost:5000',
     }
@@ -56,8 +56,9 @@ else
     echo -e "${GREEN}Already in virtual environment: $VIRTUAL_ENV${NC}"
 fi
 
-# Build frontend if needed
-if [[ ! -d "$BACKEND_DIR/static/react" || "$1" == "--rebuild" ]]; then
+# Build frontend if needed (missing, or older than the frontend sources)
+BUILD_INDEX="$BACKEND_DIR/static/react/index.html"
+if [[ ! -f "$BUILD_INDEX" || "$1" == "--rebuild" || -n "$(find "$FRONTEND_DIR/src" "$FRONTEND_DIR/index.html" -newer "$BUILD_INDEX" -print -quit)" ]]; then
     echo -e "${GREEN}Building frontend...${NC}"
     cd "$FRONTEND_DIR" || exit 1
     npm install